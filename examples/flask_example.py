@@ -7,8 +7,9 @@ from flask import Flask
 from flask.ext.sqlalchemy import SQLAlchemy
 from flask_ripozo import FlaskDispatcher
 from ripozo import restmixins, ListRelationship, Relationship, adapters, apimethod
-from ripozo_sqlalchemy import AlchemyManager, SessionHandler
-from sqlalchemy.orm import relationship
+from flask_ripozo.sessions import PooledSessionHandler
+from ripozo_sqlalchemy import AlchemyManager
+from sqlalchemy.orm import relationship, sessionmaker
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////tmp/ripozo_example.db'
@@ -30,7 +31,7 @@ class Task(db.Model):
     completed = db.Column(db.Boolean, default=False)
 
 db.create_all()
-session_handler = SessionHandler(db.session)
+session_handler = PooledSessionHandler(sessionmaker(bind=db.engine), pool_size=10)
 
 
 class TaskBoardManager(AlchemyManager):
@@ -74,6 +75,7 @@ dispatcher = FlaskDispatcher(app, url_prefix='/api')
 dispatcher.register_resources(TaskBoardResource, TaskResource)
 dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter,
                              adapters.BasicJSONAdapter)
+session_handler.attach(dispatcher)
 
 if __name__ == '__main__':
     app.run(debug=True, port=8000)
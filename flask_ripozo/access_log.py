@@ -0,0 +1,203 @@
+"""
+Structured access and error logging that does not block the
+threads handling requests.  Pass an ``AccessLogger`` to the
+``FlaskDispatcher`` and every request produces a record with
+the endpoint, status, adapter, body size and stage timings.
+Records are put on a bounded queue and written to the sink by
+a background thread.  If the sink falls behind, records are
+dropped (and counted) rather than making requests wait.
+
+Exceptions raised while handling requests are written as error
+records.  Their tracebacks are formatted by the background thread,
+and an error raised from the same place within ``traceback_window``
+seconds is only counted; the next full traceback includes how many
+were repeated.
+
+.. code-block:: python
+
+    access_logger = AccessLogger(sample_rate=0.1)
+    dispatcher = FlaskDispatcher(app, access_logger=access_logger)
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from six.moves import queue
+
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import traceback
+
+import six
+
+_logger = logging.getLogger(__name__)
+_access_logger = logging.getLogger('flask_ripozo.access')
+
+
+def log_sink(record):
+    """
+    The default sink.  Writes the record as a line of JSON to the
+    ``flask_ripozo.access`` logger.  Error records are logged at
+    the ERROR level and access records at the INFO level.
+
+    :param dict record: The access or error record.
+    """
+    level = logging.ERROR if record['type'] == 'error' else logging.INFO
+    _access_logger.log(level, json.dumps(record, sort_keys=True, default=str))
+
+
+class AccessLogger(object):
+    """
+    Writes access and error records on a background thread.
+    """
+
+    def __init__(self, sink=log_sink, sample_rate=1.0, max_queue=10000, traceback_window=60):
+        """
+        :param function sink: Takes a record dictionary and writes it.
+            It is only called from the background thread.
+        :param float sample_rate: The fraction (0 to 1) of the requests
+            with a status below 500 that are recorded.  Server errors
+            are always recorded.
+        :param int max_queue: The maximum number of records waiting
+            to be written.  Records are dropped when it is full.
+        :param float traceback_window: The number of seconds during which
+            the traceback of an error raised from the same place is
+            not written again.
+        """
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.traceback_window = traceback_window
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._tracebacks = {}
+        self._counts = dict(written=0, dropped=0, sampled_out=0,
+                            suppressed_tracebacks=0, sink_errors=0)
+
+    def log_request(self, endpoint, method, status_code, content_length, adapter, timer):
+        """
+        Queues the access record for a request.  Called by the
+        dispatcher once the response has been made.
+
+        :param unicode endpoint: The endpoint of the request.
+        :param unicode method: The http method.
+        :param int status_code: The status of the response.
+        :param int content_length: The number of bytes in the body.
+        :param unicode adapter: The name of the adapter class used.
+        :param flask_ripozo.profiler.StageTimer timer: The timings
+            of the request's stages.
+        """
+        if status_code is not None and status_code < 500 and \
+                self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self._count('sampled_out')
+            return
+        self._put(dict(type='access', time=time.time(), endpoint=endpoint, method=method,
+                       status=status_code, bytes=content_length, adapter=adapter,
+                       duration=timer.elapsed, stages=dict(timer.stages)))
+
+    def log_error(self, endpoint, exc):
+        """
+        Queues an error record.  It must be called while the
+        exception is being handled so that the traceback is
+        available.  The traceback is formatted by the background thread.
+
+        :param unicode endpoint: The endpoint of the request.
+        :param Exception exc: The exception that was raised.
+        """
+        exc_type, exc_value, tb = sys.exc_info()
+        if exc_value is not exc:
+            exc_type, tb = type(exc), None
+        self._put(dict(type='error', time=time.time(), endpoint=endpoint,
+                       exception=exc_type.__name__, message=six.text_type(exc)), (exc_type, exc, tb))
+
+    def flush(self):
+        """
+        Blocks until every queued record has been written.
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self):
+        """
+        Writes the queued records and stops the background thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self):
+        """
+        :return: The number of records written, queued, dropped
+            because the queue was full and not recorded because of
+            the sample rate, the number of suppressed tracebacks and
+            the number of times the sink failed.
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._counts)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._counts[key] += value
+
+    def _put(self, record, exc_info=None):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((record, exc_info))
+        except queue.Full:
+            self._count('dropped')
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write, name='flask-ripozo-access-log')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                record, exc_info = item
+                if exc_info is not None:
+                    self._add_traceback(record, exc_info)
+                try:
+                    self.sink(record)
+                except Exception:
+                    self._count('sink_errors')
+                    _logger.exception('The access log sink failed')
+                else:
+                    self._count('written')
+            finally:
+                self._queue.task_done()
+
+    def _add_traceback(self, record, exc_info):
+        exc_type, exc, tb = exc_info
+        if tb is None:
+            return
+        last = tb
+        while last.tb_next is not None:
+            last = last.tb_next
+        key = (exc_type, last.tb_frame.f_code.co_filename, last.tb_lineno)
+        now = time.time()
+        logged_at, repeated = self._tracebacks.get(key, (None, 0))
+        if logged_at is not None and now - logged_at < self.traceback_window:
+            self._tracebacks[key] = (logged_at, repeated + 1)
+            record['traceback_suppressed'] = True
+            self._count('suppressed_tracebacks')
+            return
+        self._tracebacks[key] = (now, 0)
+        record['traceback'] = ''.join(traceback.format_exception(exc_type, exc, tb))
+        record['repeated'] = repeated
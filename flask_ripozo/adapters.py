@@ -0,0 +1,237 @@
+"""
+Adapters for compact binary representations.  They build the
+same documents as ripozo's JSON adapters (SIREN by default) but
+encode them with MessagePack or CBOR.  The codecs are optional
+dependencies: ``pip install msgpack`` and/or ``pip install cbor2``.
+
+.. code-block:: python
+
+    from flask_ripozo.adapters import available_binary_adapters
+
+    dispatcher.register_adapters(SirenAdapter, HalAdapter, *available_binary_adapters())
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from abc import ABCMeta, abstractmethod
+
+from ripozo.adapters import AdapterBase, BasicJSONAdapter, HalAdapter, SirenAdapter
+from ripozo.exceptions import DispatchException
+
+import json
+
+import six
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+MSGPACK_TYPES = ('application/vnd.msgpack', 'application/msgpack', 'application/x-msgpack')
+CBOR_TYPES = ('application/cbor',)
+
+
+def _siren_document(adapter):
+    if adapter.status_code == 204:
+        return None
+    response = dict(properties=adapter.resource.properties, actions=adapter._actions,
+                    links=adapter.generate_links(), entities=adapter.get_entities())
+    response['class'] = [adapter.resource.resource_name]
+    return response
+
+
+def _hal_document(adapter):
+    return adapter._construct_resource(adapter.resource)
+
+
+def _basic_json_document(adapter):
+    response = dict()
+    adapter._append_relationships_to_list(response, adapter.resource.related_resources)
+    adapter._append_relationships_to_list(response, adapter.resource.linked_resources)
+    response.update(adapter.resource.properties)
+    return {adapter.resource.resource_name: response}
+
+
+_DOCUMENT_BUILDERS = {
+    SirenAdapter: _siren_document,
+    HalAdapter: _hal_document,
+    BasicJSONAdapter: _basic_json_document,
+}
+
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True, default=six.text_type)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def _cbor_dumps(obj):
+    return cbor2.dumps(obj, default=lambda encoder, value: encoder.encode(six.text_type(value)))
+
+
+def _cbor_loads(data):
+    return cbor2.loads(data)
+
+
+@six.add_metaclass(ABCMeta)
+class BinaryAdapter(AdapterBase):
+    """
+    The abstract base class for the binary adapters.  The document
+    is built by the ``structure_adapter`` (SirenAdapter, HalAdapter or
+    BasicJSONAdapter without a round trip through JSON) and encoded
+    with the ``dumps`` of the subclass.  Subclass one of the
+    concrete adapters to use another structure:
+
+    .. code-block:: python
+
+        class HalMessagePackAdapter(MessagePackAdapter):
+            structure_adapter = HalAdapter
+            formats = ['application/hal+msgpack']
+            extra_headers = {'Content-Type': 'application/hal+msgpack'}
+    """
+    structure_adapter = SirenAdapter
+    codec_name = None
+
+    @classmethod
+    def available(cls):
+        """
+        :return: Whether the codec for this adapter is installed.
+        :rtype: bool
+        """
+        return True
+
+    @classmethod
+    @abstractmethod
+    def dumps(cls, obj):
+        """
+        Encodes the object with the adapter's codec.
+
+        :param object obj: The document to encode.
+        :rtype: bytes
+        """
+
+    @classmethod
+    def _encode(cls, obj):
+        if not cls.available():
+            raise DispatchException('The {0} codec is not installed'.format(cls.codec_name))
+        return cls.dumps(obj)
+
+    @property
+    def document(self):
+        """
+        :return: The document built by the structure adapter or
+            None for an empty response.
+        :rtype: dict
+        """
+        structure = self.structure_adapter(self.resource, base_url=self.base_url)
+        builder = _DOCUMENT_BUILDERS.get(self.structure_adapter)
+        if builder is not None:
+            return builder(structure)
+        body = structure.formatted_body
+        return json.loads(body) if body else None
+
+    @property
+    def formatted_body(self):
+        """
+        :return: The encoded document.  An empty byte string if
+            the document is empty.
+        :rtype: bytes
+        """
+        document = self.document
+        if document is None:
+            return b''
+        return self._encode(document)
+
+    @classmethod
+    def format_exception(cls, exc):
+        """
+        Encodes the status code and the message of the exception.
+
+        :param Exception exc: The exception to format.
+        :return: A tuple containing: response body, format,
+            http response code
+        :rtype: tuple
+        """
+        status_code = getattr(exc, 'status_code', 500)
+        body = cls._encode(dict(status=status_code, message=six.text_type(exc)))
+        return body, cls.formats[0], status_code
+
+    @classmethod
+    def format_request(cls, request):
+        """
+        Simply returns request
+
+        :param RequestContainer request: The request to handler
+        :rtype: RequestContainer
+        """
+        return request
+
+
+class MessagePackAdapter(BinaryAdapter):
+    """
+    SIREN documents encoded with MessagePack.
+    """
+    formats = list(MSGPACK_TYPES)
+    extra_headers = {'Content-Type': MSGPACK_TYPES[0]}
+    codec_name = 'msgpack'
+
+    @classmethod
+    def available(cls):
+        return msgpack is not None
+
+    @classmethod
+    def dumps(cls, obj):
+        return _msgpack_dumps(obj)
+
+
+class CBORAdapter(BinaryAdapter):
+    """
+    SIREN documents encoded with CBOR.
+    """
+    formats = list(CBOR_TYPES)
+    extra_headers = {'Content-Type': CBOR_TYPES[0]}
+    codec_name = 'cbor2'
+
+    @classmethod
+    def available(cls):
+        return cbor2 is not None
+
+    @classmethod
+    def dumps(cls, obj):
+        return _cbor_dumps(obj)
+
+
+def available_binary_adapters():
+    """
+    :return: The binary adapters whose codecs are installed.
+    :rtype: list
+    """
+    return [adapter for adapter in (MessagePackAdapter, CBORAdapter) if adapter.available()]
+
+
+def get_body_decoder(content_type):
+    """
+    Gets the function that decodes a request body in one
+    of the binary formats.
+
+    :param unicode content_type: The mimetype of the request
+        without any parameters.
+    :return: A function that takes the raw body and returns the
+        decoded object or None if the content type is not
+        a binary format with an installed codec.
+    :rtype: function
+    """
+    if content_type in MSGPACK_TYPES and msgpack is not None:
+        return _msgpack_loads
+    if content_type in CBOR_TYPES and cbor2 is not None:
+        return _cbor_loads
+    return None
@@ -0,0 +1,120 @@
+"""
+Argument parsers that are compiled when a route is registered.
+The fields declared on an apimethod with ripozo's ``translate``
+or ``manager_translate`` decorators are looked up once and turned
+into a flat list of translation steps.  The query and body
+arguments are then coerced and validated in a single pass after
+the adapter formatted the request and before the apimethod is called.
+
+The ``translate`` decorator of the apimethod still runs afterwards.
+Translating the values that were already coerced again is harmless.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from functools import wraps
+
+from ripozo.resources.constants import input_categories
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+_URL_PARAMS = 0
+_QUERY_ARGS = 1
+_BODY_ARGS = 2
+
+_LOCATIONS = {
+    None: (_URL_PARAMS, _QUERY_ARGS, _BODY_ARGS),
+    input_categories.URL_PARAMS: (_URL_PARAMS,),
+    input_categories.QUERY_ARGS: (_QUERY_ARGS,),
+    input_categories.BODY_ARGS: (_BODY_ARGS,),
+}
+
+
+class CompiledArgumentParser(object):
+    """
+    Coerces and validates the arguments of a request using
+    the fields declared on an apimethod.  It follows the same
+    rules as ``ripozo.resources.fields.base.translate_fields``
+    but everything that does not depend on the request is
+    worked out when the parser is created.
+    """
+
+    def __init__(self, fields, skip_required=False, validate=False):
+        """
+        :param list fields: The ripozo fields to translate.
+        :param bool skip_required: Fields that are not in the request
+            are skipped instead of being validated as missing.
+        :param bool validate: Whether the field validations should run.
+        """
+        self.skip_required = skip_required
+        self.validate = validate
+        self.steps = tuple((field.name, _LOCATIONS.get(field.arg_type, ()), field.translate)
+                           for field in fields)
+
+    def parse(self, url_params, query_args, body_args):
+        """
+        Translates the arguments in place.
+
+        :param dict url_params: The url parameters.
+        :param dict query_args: The query arguments.
+        :param dict body_args: The body arguments.
+        :raises: ripozo.exceptions.ValidationException
+        :raises: ripozo.exceptions.TranslationException
+        """
+        containers = (url_params, query_args, body_args)
+        skip_required = self.skip_required
+        validate = self.validate
+        for name, locations, translate in self.steps:
+            for location in locations:
+                container = containers[location]
+                if name in container:
+                    container[name] = translate(container[name], skip_required=skip_required,
+                                                validate=validate)
+                    break
+            else:
+                if not skip_required:
+                    translate(None, skip_required=skip_required, validate=validate)
+
+    def wrap(self, f):
+        """
+        :param function f: The function that the dispatcher calls
+            with the RequestContainer formatted by the adapter.
+        :return: A function that translates the arguments of the
+            request in place before calling f.
+        :rtype: function
+        """
+        @wraps(f)
+        def parsed(request, *args, **kwargs):
+            self.parse(request._url_params, request._query_args, request._body_args)
+            return f(request, *args, **kwargs)
+        return parsed
+
+
+def compile_argument_parser(endpoint_func, resource_class=None):
+    """
+    Compiles an argument parser for the apimethod if it
+    declares fields with the ``translate`` or ``manager_translate``
+    decorators.
+
+    :param function endpoint_func: The apimethod.
+    :param type resource_class: The ResourceBase subclass the apimethod
+        belongs to.  It is needed to look up the manager's fields.
+    :return: The parser or None if the apimethod does not declare fields.
+    :rtype: CompiledArgumentParser
+    """
+    get_fields = getattr(endpoint_func, 'fields', None)
+    decorator = getattr(get_fields, '__self__', None)
+    if decorator is None or not hasattr(decorator, 'skip_required'):
+        return None
+    try:
+        fields = get_fields(getattr(resource_class, 'manager', None))
+    except AttributeError:
+        _logger.debug('Unable to get the fields for %s', endpoint_func)
+        return None
+    return CompiledArgumentParser(fields, skip_required=decorator.skip_required,
+                                  validate=decorator.validate)
+
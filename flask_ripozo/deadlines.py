@@ -0,0 +1,124 @@
+"""
+Deadlines for requests.  The ``FlaskDispatcher`` gives a request a
+deadline when its route has a ``timeout`` option, when the dispatcher
+has a ``default_timeout`` or when the client sends the number of
+seconds it is willing to wait in the ``X-Request-Timeout`` header.
+The deadline is available as ``request.deadline`` in apimethods and
+from ``current_deadline`` anywhere in the thread handling the request,
+so managers can give up early:
+
+.. code-block:: python
+
+    from flask_ripozo.deadlines import check_deadline
+
+    class ReportManager(AlchemyManager):
+        def retrieve_list(self, filters, *args, **kwargs):
+            for chunk in self.chunks(filters):
+                check_deadline()
+                ...
+
+A request whose deadline passes is answered with a 504
+through the dispatcher's ``error_handler``.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from timeit import default_timer
+
+from ripozo.exceptions import RestException
+
+import threading
+
+_local = threading.local()
+
+
+class DeadlineExceeded(RestException):
+    """
+    Raised when a request runs past its deadline.
+    """
+    def __init__(self, message='The request deadline was exceeded', status_code=504, *args, **kwargs):
+        super(DeadlineExceeded, self).__init__(message, status_code=status_code, *args, **kwargs)
+
+
+class Deadline(object):
+    """
+    The time by which a request must be answered.
+    """
+
+    def __init__(self, timeout, start=None):
+        """
+        :param float timeout: The number of seconds the request
+            may take.
+        :param float start: When the request started according to
+            ``timeit.default_timer``.  Now by default.
+        """
+        self.timeout = timeout
+        self.expires = (start if start is not None else default_timer()) + timeout
+
+    @property
+    def remaining(self):
+        """
+        :return: The number of seconds left.  Negative once
+            the deadline has passed.
+        :rtype: float
+        """
+        return self.expires - default_timer()
+
+    @property
+    def expired(self):
+        """
+        :return: Whether the deadline has passed.
+        :rtype: bool
+        """
+        return self.remaining <= 0
+
+    def check(self):
+        """
+        :raises: DeadlineExceeded if the deadline has passed.
+        """
+        if self.expired:
+            raise DeadlineExceeded()
+
+
+def parse_timeout(value):
+    """
+    :param unicode value: The number of seconds from a header.
+    :return: The number of seconds or None if the value
+        is not a positive number.
+    :rtype: float
+    """
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        return None
+    return timeout if timeout > 0 else None
+
+
+def current_deadline():
+    """
+    :return: The deadline of the request being handled by
+        this thread or None.
+    :rtype: Deadline
+    """
+    return getattr(_local, 'deadline', None)
+
+
+def check_deadline():
+    """
+    Raises a ``DeadlineExceeded`` if the request being handled
+    by this thread has a deadline that has passed.
+    """
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check()
+
+
+def set_deadline(deadline):
+    """
+    Sets the deadline of the request being handled by this thread.
+
+    :param Deadline deadline: The deadline or None to clear it.
+    """
+    _local.deadline = deadline
@@ -6,19 +6,34 @@ from __future__ import unicode_literals
 from flask import request, Response
 
 from functools import wraps
+from timeit import default_timer
+
+from flask_ripozo.adapters import get_body_decoder
+from flask_ripozo.arguments import compile_argument_parser
+from flask_ripozo.deadlines import Deadline, parse_timeout, set_deadline
+from flask_ripozo.events import ChangeFeed, EventBroker
+from flask_ripozo.metadata import add_validators, head_response, options_response
+from flask_ripozo.profiler import StageTimer
+from flask_ripozo.ratelimit import LoadShedException, RateLimitExceeded
 
 from ripozo.dispatch_base import DispatcherBase
 from ripozo.exceptions import RestException
 from ripozo.utilities import join_url_parts
 from ripozo.resources.request import RequestContainer
 
-from werkzeug.routing import Map
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from werkzeug.routing import Map, Rule
 
+import json
 import logging
 import six
+import threading
 
 _logger = logging.getLogger(__name__)
 
+_NEGOTIATION_CACHE_SIZE = 1024
+
 
 class _CaseInsentiveDict(dict):
     def __setitem__(self, key, value):
@@ -34,7 +49,8 @@ def exception_handler(dispatcher, accepted_mimetypes, exc):
     This catches any RestException (from ripozo.exceptions)
     and calls the format_exception class method on the adapter
     class.  It will appropriately set the status_code, response,
-    and content type for the exception.
+    and content type for the exception.  The ``headers`` of the
+    exception are added to the response if it has them.
 
     :param FlaskDispatcher dispatcher: A FlaskDispatcher instance
         used to format the exception
@@ -47,10 +63,32 @@ def exception_handler(dispatcher, accepted_mimetypes, exc):
     if isinstance(exc, RestException):
         adapter_klass = dispatcher.get_adapter_for_type(accepted_mimetypes)
         response, content_type, status_code = adapter_klass.format_exception(exc)
-        return Response(response=response, content_type=content_type, status=status_code)
+        return Response(response=response, content_type=content_type, status=status_code,
+                        headers=getattr(exc, 'headers', None))
     raise exc
 
 
+def decode_body(decoder, data):
+    """
+    Decodes a request body with the decoder.  Like
+    ``get_json(silent=True)`` an empty dictionary is returned
+    if the body cannot be decoded or is not a mapping.
+
+    :param function decoder: Takes the raw body and returns the object.
+    :param bytes data: The raw body.
+    :return: The decoded body.
+    :rtype: dict
+    """
+    if not data:
+        return {}
+    try:
+        body = decoder(data)
+    except Exception:
+        _logger.debug('Unable to decode the request body', exc_info=True)
+        return {}
+    return dict(body) if isinstance(body, dict) else {}
+
+
 def get_request_query_body_args(request_obj):
     """
     Gets the request query args and the
@@ -60,7 +98,9 @@ def get_request_query_body_args(request_obj):
     json for the body first.  If it doesn't find any it
     looks at the form otherwise it returns an empty dictionary.
     The body is also transformed from an ImmutableMultiDict to
-    a builtin dict.
+    a builtin dict.  If the Content-Type is MessagePack or CBOR
+    (and the codec is installed) the body is decoded with that
+    codec instead.
 
     :param flask.Request request_obj: A Flask request object.
     :return: A tuple of the appropriately formatted query
@@ -68,11 +108,15 @@ def get_request_query_body_args(request_obj):
     :rtype: (dict, dict, dict)
     """
     query_args = dict(request_obj.args)
-    body = dict(
-        request_obj.get_json(force=True, silent=True) or
-        request_obj.form or
-        {}
-    )
+    decoder = get_body_decoder(getattr(request_obj, 'mimetype', None))
+    if decoder is not None:
+        body = decode_body(decoder, request_obj.get_data())
+    else:
+        body = dict(
+            request_obj.get_json(force=True, silent=True) or
+            request_obj.form or
+            {}
+        )
 
     # Make a copy of the headers
     headers = _CaseInsentiveDict()
@@ -88,7 +132,9 @@ class FlaskDispatcher(DispatcherBase):
     """
 
     def __init__(self, app, url_prefix='', error_handler=exception_handler,
-                 argument_getter=get_request_query_body_args, **kwargs):
+                 argument_getter=get_request_query_body_args, profiler=None,
+                 allocation_tracker=None, compile_arguments=False, default_timeout=None,
+                 timeout_header='X-Request-Timeout', access_logger=None, **kwargs):
         """
         Initialize the adapter.  The app can actually be either a flask.Flask
         instance or a flask.Blueprint instance.
@@ -106,15 +152,70 @@ class FlaskDispatcher(DispatcherBase):
             getting the query/body arguments from the Flask Request as a
             tuple. This function should return (dict, dict,) with the first
             as the query args and the second as the request body args.
+        :param flask_ripozo.profiler.SamplingProfiler profiler: An optional
+            profiler that keeps stack samples and stage timings for
+            slow or sampled requests.
+        :param flask_ripozo.memory.AllocationTracker allocation_tracker: An
+            optional tracker that records the bytes allocated while
+            dispatching and constructing the response for a sample
+            of the requests.
+        :param bool compile_arguments: If True, an argument parser is
+            compiled from the fields declared with ripozo's ``translate``
+            decorators when a route is registered.  The query and body
+            args are then coerced and validated once the adapter formatted
+            the request and before the apimethod (and its preprocessors)
+            are called.  The ``translate`` decorator still translates
+            them afterwards, so this rejects invalid arguments earlier
+            rather than making requests faster.
+        :param float default_timeout: The number of seconds a request may
+            take when its route does not have a ``timeout`` option.
+            Requests that run longer are answered with a 504.
+        :param unicode timeout_header: The header in which clients may
+            send the number of seconds they will wait.  It can shorten
+            the route's timeout but not extend it.
+        :param flask_ripozo.access_log.AccessLogger access_logger: An
+            optional logger that writes a record for every request and
+            the exceptions on a background thread.  The exceptions are
+            then not logged by the request thread.
         """
         self.app = app
         self.url_map = Map()
         self.function_for_endpoint = {}
+        self.resource_for_endpoint = {}
+        self.route_for_endpoint = {}
+        self.route_methods = {}
+        self.options_endpoints = {}
+        self.argument_parsers = {}
+        self.compile_arguments = compile_arguments
+        self.change_feeds = {}
+        self.event_broker = None
+        self.background_endpoints = set()
+        self.job_runner = None
+        self.idempotency = None
+        self.static_renderer = None
+        self.rate_limiter = None
+        self.route_rate_limits = {}
+        self.default_timeout = default_timeout
+        self.timeout_header = timeout_header
+        self.route_timeouts = {}
+        self._registering_class = None
         if url_prefix and not url_prefix.startswith('/'):
             url_prefix = '/{0}'.format(url_prefix)
         self.url_prefix = url_prefix
         self.error_handler = error_handler
         self.argument_getter = argument_getter
+        self.profiler = profiler
+        self.allocation_tracker = allocation_tracker
+        self.access_logger = access_logger
+        self.before_request_hooks = []
+        self.after_dispatch_hooks = []
+        self.error_hooks = []
+        self.stats_sources = {}
+        self.routes = []
+        self.mounts = []
+        self._accept_cache = {}
+        self._adapter_cache = {}
+        self._local = threading.local()
         super(FlaskDispatcher, self).__init__(**kwargs)
 
     @property
@@ -124,12 +225,198 @@ class FlaskDispatcher(DispatcherBase):
             the provided base_url in the __init__ method and
             joins it with the ``request.url_root``.  If this
             app provided is actually a blueprint, it will
-            return join the blueprints url_prefix in between
+            return join the blueprints url_prefix in between.
+            When the request is being handled by the ``wsgi_app``
+            the url root of the WSGI environ is used instead.  When it
+            is being handled by a mount the mount's app and url_prefix
+            are used.  Background jobs use the base_url of the request
+            that queued them.
         :rtype: unicode
         """
-        if getattr(self.app, 'url_prefix', None):
-            return join_url_parts(request.url_root, self.app.url_prefix, self.url_prefix)
-        return join_url_parts(request.url_root, self.url_prefix)
+        base_url = getattr(self._local, 'base_url', None)
+        if base_url is not None:
+            return base_url
+        url_root = getattr(self._local, 'url_root', None)
+        if url_root is not None:
+            return join_url_parts(url_root, self.url_prefix)
+        app, url_prefix = self.app, self.url_prefix
+        mount = getattr(self._local, 'mount', None)
+        if mount is not None:
+            app, url_prefix = mount.app, mount.url_prefix
+        if getattr(app, 'url_prefix', None):
+            return join_url_parts(request.url_root, app.url_prefix, url_prefix)
+        return join_url_parts(request.url_root, url_prefix)
+
+    @DispatcherBase.default_adapter.setter
+    def default_adapter(self, adapter_class):
+        """
+        Sets the default adapter and clears the negotiation cache.
+
+        :param type adapter_class: the class to use as the default
+            adapter class
+        """
+        self._default_adapter = adapter_class
+        self._adapter_cache.clear()
+
+    def register_adapters(self, *adapter_classes):
+        """
+        Registers the adapter classes and clears the negotiation cache.
+        See ``ripozo.dispatch_base.DispatcherBase.register_adapters``
+
+        :param list adapter_classes: A list of subclasses of AdapterBase
+        """
+        super(FlaskDispatcher, self).register_adapters(*adapter_classes)
+        self._adapter_cache.clear()
+
+    def get_adapter_for_type(self, accept_mimetypes):
+        """
+        Gets the adapter class for the mimetypes accepted by the
+        client.  The result is cached for every list of mimetypes.
+
+        :param list accept_mimetypes: A list of the mime types accepted
+            by the client.
+        :return: A BaseAdapter subclass for the best matched
+            accept type.
+        :rtype: type
+        """
+        key = tuple(accept_mimetypes)
+        adapter_class = self._adapter_cache.get(key)
+        if adapter_class is None:
+            adapter_class = super(FlaskDispatcher, self).get_adapter_for_type(accept_mimetypes)
+            if len(self._adapter_cache) >= _NEGOTIATION_CACHE_SIZE:
+                self._adapter_cache.clear()
+            self._adapter_cache[key] = adapter_class
+        return adapter_class
+
+    def accepted_mimetypes(self, accept_header):
+        """
+        Parses an Accept header.  The result is cached
+        for every header value.
+
+        :param unicode accept_header: The value of the Accept header.
+        :return: The mimetypes from the most to the least preferred.
+        :rtype: list
+        """
+        mimetypes = self._accept_cache.get(accept_header)
+        if mimetypes is None:
+            mimetypes = tuple(accept[0] for accept in parse_accept_header(accept_header, MIMEAccept))
+            if len(self._accept_cache) >= _NEGOTIATION_CACHE_SIZE:
+                self._accept_cache.clear()
+            self._accept_cache[accept_header] = mimetypes
+        return list(mimetypes)
+
+    def mount(self, app, url_prefix='', name=None):
+        """
+        Serves the routes registered on this dispatcher from another
+        flask app or blueprint.  The mount shares the wrapped
+        apimethods, argument parsers, adapters and caches of the
+        dispatcher.  Only the url_prefix differs.  Routes registered
+        after the mount was created are added to it as well.
+
+        .. code-block:: python
+
+            dispatcher = FlaskDispatcher(v1, url_prefix='/api')
+            dispatcher.register_resources(TaskResource)
+            dispatcher.register_adapters(SirenAdapter, HalAdapter)
+            dispatcher.mount(v2, url_prefix='/api')
+            dispatcher.mount(partners, url_prefix='/partner/api')
+
+        :param flask.Flask|flask.Blueprint app: The flask app or blueprint.
+        :param unicode url_prefix: The url prefix for the routes on the mount.
+        :param unicode name: Prepended to the endpoint names.  It is
+            required when mounting on an app that already has the routes.
+        :return: The mount.
+        :rtype: DispatcherMount
+        """
+        mount = DispatcherMount(self, app, url_prefix=url_prefix, name=name)
+        for endpoint, route, methods, options, view in self.routes:
+            mount.add_route(endpoint, route, methods, options, view)
+        self.mounts.append(mount)
+        return mount
+
+    def stats(self):
+        """
+        Collects the statistics from the profiler, the
+        allocation tracker and the access logger if they are enabled and from
+        every object in ``stats_sources``.
+
+        :return: A dictionary keyed by the name of the statistics source.
+        :rtype: dict
+        """
+        stats = {}
+        if self.profiler is not None:
+            stats['profiler'] = self.profiler.stats()
+        if self.allocation_tracker is not None:
+            stats['allocations'] = self.allocation_tracker.stats()
+        if self.access_logger is not None:
+            stats['access_log'] = self.access_logger.stats()
+        for name, source in six.iteritems(self.stats_sources):
+            stats[name] = source.stats()
+        return stats
+
+    def before_request(self, func):
+        """
+        Registers a function that is called with the endpoint name
+        before the arguments are extracted from the request.  If it
+        raises an exception the request is not dispatched and the
+        exception is passed to the error hooks and the error_handler.
+        Can be used as a decorator.
+
+        :param function func: The hook.
+        :return: The hook.
+        :rtype: function
+        """
+        self.before_request_hooks.append(func)
+        return func
+
+    def after_dispatch(self, func):
+        """
+        Registers a function that is called with the endpoint name,
+        the RequestContainer and the adapter after the apimethod
+        succeeded and before the response is constructed.  If it
+        raises an exception it is handled like an exception raised
+        by the apimethod.  When a stored response is replayed for an
+        idempotency key the RequestContainer is None and the adapter
+        is the ``flask_ripozo.idempotency.StoredResponse``.  When a
+        pre-rendered file is served it is the
+        ``flask_ripozo.prerender.RenderedFile``.  Can be used
+        as a decorator.
+
+        :param function func: The hook.
+        :return: The hook.
+        :rtype: function
+        """
+        self.after_dispatch_hooks.append(func)
+        return func
+
+    def on_error(self, func):
+        """
+        Registers a function that is called with the endpoint name
+        and the exception when a before request hook, the argument
+        extraction, the apimethod or an after dispatch hook fails.
+        It is called before the error_handler.  Exceptions raised by
+        error hooks are logged and ignored.  Can be used as a decorator.
+
+        :param function func: The hook.
+        :return: The hook.
+        :rtype: function
+        """
+        self.error_hooks.append(func)
+        return func
+
+    def _register_class_routes(self, klass):
+        """
+        Keeps track of the ResourceBase subclass whose routes
+        are being registered so that ``register_route`` knows which
+        resource each endpoint belongs to.
+
+        :param type klass: The ResourceBase subclass being registered.
+        """
+        self._registering_class = klass
+        try:
+            super(FlaskDispatcher, self)._register_class_routes(klass)
+        finally:
+            self._registering_class = None
 
     def register_route(self, endpoint, endpoint_func=None, route=None, methods=None, **options):
         """
@@ -147,24 +434,199 @@ class FlaskDispatcher(DispatcherBase):
             method.
         :param unicode route:  The actual route that is going to be used.
         :param list methods: The http verbs that can be used with this endpoint
-        :param dict options: The additional options to pass to the add_url_rule
+        :param dict options: The additional options to pass to the add_url_rule.
+            If ``background`` is True the endpoint is run by the
+            ``flask_ripozo.jobs.JobRunner`` attached to this dispatcher.
+            ``timeout`` is the number of seconds requests to the endpoint
+            may take.  ``rate_limit`` is the ``(rate, burst)`` of each
+            client's token bucket for the endpoint (see
+            ``flask_ripozo.ratelimit.RateLimiter``).
+
+        Unless an endpoint on the route includes OPTIONS in its methods,
+        OPTIONS requests are answered from the methods registered on the
+        route (see ``flask_ripozo.metadata``).
         """
         valid_flask_options = ('defaults', 'subdomain', 'methods', 'build_only',
                                'endpoint', 'strict_slashes', 'redirect_to',
                                'alias', 'host')
+        relative_route = route
         route = join_url_parts(self.url_prefix, route)
+        methods = [method.upper() for method in methods or ['GET']]
+        self.route_for_endpoint[endpoint] = route
+        self.route_methods.setdefault(route, set()).update(methods)
+        if 'OPTIONS' in methods:
+            self.options_endpoints.setdefault(route, endpoint)
+        else:
+            methods.append('OPTIONS')
+
+        if options.get('background'):
+            self.background_endpoints.add(endpoint)
+        if options.get('timeout') is not None:
+            self.route_timeouts[endpoint] = options['timeout']
+        if options.get('rate_limit') is not None:
+            self.route_rate_limits[endpoint] = options['rate_limit']
 
         # Remove invalid flask options.
         options_copy = options.copy()
         for key, value in six.iteritems(options_copy):
             if key not in valid_flask_options:
                 options.pop(key, None)
-        self.app.add_url_rule(route, endpoint=endpoint,
-                              view_func=flask_dispatch_wrapper(self, endpoint_func, self.argument_getter),
-                              methods=methods, **options)
+        view = flask_dispatch_wrapper(self, endpoint_func, self.argument_getter, endpoint=endpoint)
+        self.url_map.add(Rule(route, endpoint=endpoint, methods=methods, **options))
+        self._add_route(endpoint, relative_route, methods, options, view)
+        self.function_for_endpoint[endpoint] = endpoint_func
+        self.resource_for_endpoint[endpoint] = self._registering_class
+        if self.compile_arguments:
+            parser = compile_argument_parser(endpoint_func, self._registering_class)
+            if parser is not None:
+                self.argument_parsers[endpoint] = parser
+
+    def register_change_feed(self, resource_class, route=None, broker=None,
+                             adapter_class=None, keepalive=15):
+        """
+        Registers a Server-Sent Events route that streams the changes
+        to the resource.  Whenever a POST, PUT, PATCH or DELETE to one
+        of the resource's endpoints succeeds, the resource returned by
+        the apimethod is formatted and pushed to the subscribers.
+        Subscribers can filter on the url params of the changes with
+        query args.  For example, ``/taskboard/_changes?id=1`` only
+        receives the changes to the task board with an id of 1.
+        The feed is also served from the mounts of the dispatcher.
+
+        :param type resource_class: The ResourceBase subclass.  Its
+            routes should be registered on this dispatcher.
+        :param unicode route: The route of the feed.  Defaults to
+            ``_changes`` appended to the resource's base_url_sans_pks.
+        :param flask_ripozo.events.EventBroker broker: The broker to use.
+            Defaults to a broker shared by all the feeds on this dispatcher.
+        :param type adapter_class: The adapter used to format the events.
+            Defaults to the dispatcher's default adapter.  Binary
+            adapters are rejected with a ValueError and a binary default
+            adapter is replaced by its ``structure_adapter``.
+        :param float keepalive: The number of seconds between keepalive
+            comments on idle connections.
+        :return: The change feed
+        :rtype: flask_ripozo.events.ChangeFeed
+        """
+        if broker is None:
+            if self.event_broker is None:
+                self.event_broker = EventBroker()
+            broker = self.event_broker
+        feed = ChangeFeed(resource_class, broker, adapter_class=adapter_class, keepalive=keepalive)
+        self.change_feeds[resource_class] = feed
+        route = route or join_url_parts(resource_class.base_url_sans_pks, '_changes')
+
+        def change_feed():
+            return Response(feed.stream(filters=request.args.to_dict()),
+                            content_type='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
+        self._add_route('{0}__change_feed'.format(resource_class.__name__), route, ['GET'], {}, change_feed)
+        return feed
 
-def flask_dispatch_wrapper(dispatcher, f, argument_getter=get_request_query_body_args):
+    def _add_route(self, endpoint, route, methods, options, view):
+        """
+        Adds the url rule for the view to the app and
+        the mounts and keeps it for later mounts.
+
+        :param unicode endpoint: The name of the endpoint.
+        :param unicode route: The route without the url_prefix.
+        :param list methods: The http methods.
+        :param dict options: The flask options for the rule.
+        :param function view: The flask view.
+        """
+        self.app.add_url_rule(join_url_parts(self.url_prefix, route), endpoint=endpoint,
+                              view_func=view, methods=methods, **options)
+        self.routes.append((endpoint, route, methods, options, view))
+        for mount in self.mounts:
+            mount.add_route(endpoint, route, methods, options, view)
+
+    def publish_change(self, endpoint, method, resource, url_params):
+        """
+        Publishes the resource to the change feed of the endpoint's
+        resource class if there is one.  Failures are logged and
+        do not affect the response.
+
+        :param unicode endpoint: The endpoint that handled the request.
+        :param unicode method: The http method of the request.
+        :param ripozo.resources.resource_base.ResourceBase resource: The
+            resource returned by the apimethod.
+        :param dict url_params: The url params of the request.
+        """
+        feed = self.change_feeds.get(self.resource_for_endpoint.get(endpoint))
+        if feed is None:
+            return
+        try:
+            feed.publish(self, method, resource, url_params)
+        except Exception:
+            _logger.exception('Unable to publish the change for %s', endpoint)
+
+    def wsgi_app(self, **kwargs):
+        """
+        Creates a standalone WSGI application that serves the
+        routes registered on this dispatcher without going through
+        Flask.  It can be mounted next to the Flask app using
+        werkzeug's ``DispatcherMiddleware``.
+
+        :param dict kwargs: Additional arguments for the
+            ``flask_ripozo.wsgi.WSGIDispatcherApp``
+        :return: The WSGI application
+        :rtype: flask_ripozo.wsgi.WSGIDispatcherApp
+        """
+        from flask_ripozo.wsgi import WSGIDispatcherApp
+        return WSGIDispatcherApp(self, **kwargs)
+
+
+class DispatcherMount(object):
+    """
+    The routes of a FlaskDispatcher served from another flask
+    app or blueprint.  Create one with ``FlaskDispatcher.mount``.
+    """
+
+    def __init__(self, dispatcher, app, url_prefix='', name=None):
+        """
+        :param FlaskDispatcher dispatcher: The dispatcher whose
+            routes are served.
+        :param flask.Flask|flask.Blueprint app: The flask app or blueprint.
+        :param unicode url_prefix: The url prefix for the routes.
+        :param unicode name: Prepended to the endpoint names.
+        """
+        if url_prefix and not url_prefix.startswith('/'):
+            url_prefix = '/{0}'.format(url_prefix)
+        self.dispatcher = dispatcher
+        self.app = app
+        self.url_prefix = url_prefix
+        self.name = name
+
+    def add_route(self, endpoint, route, methods, options, view):
+        """
+        Adds the url rule for a route registered on the dispatcher.
+
+        :param unicode endpoint: The name of the endpoint.
+        :param unicode route: The route without the url_prefix.
+        :param list methods: The http methods.
+        :param dict options: The flask options for the rule.
+        :param function view: The view shared with the dispatcher.
+        """
+        if self.name:
+            endpoint = '{0}__{1}'.format(self.name, endpoint)
+        self.app.add_url_rule(join_url_parts(self.url_prefix, route), endpoint=endpoint,
+                              view_func=self._mounted_view(view), methods=methods, **options)
+
+    def _mounted_view(self, view):
+        local = self.dispatcher._local
+
+        @wraps(view)
+        def mounted_view(**urlparams):
+            local.mount = self
+            try:
+                return view(**urlparams)
+            finally:
+                local.mount = None
+        return mounted_view
+
+
+def flask_dispatch_wrapper(dispatcher, f, argument_getter=get_request_query_body_args, endpoint=None):
     """
     A decorator for wrapping the apimethods provided to the
     dispatcher.  The actual wrapper performs that actual
@@ -181,7 +643,10 @@ def flask_dispatch_wrapper(dispatcher, f, argument_getter=get_request_query_body
     :param function argument_getter:  The function that takes a flask
         Request object and uses it to get the query arguments and the
         body arguments as a tuple.
+    :param unicode endpoint: The name of the endpoint.  It is used
+        to group the profiles.  Defaults to the name of the function.
     """
+    endpoint = endpoint or f.__name__
 
     @wraps(f)
     def flask_dispatch(**urlparams):
@@ -203,18 +668,259 @@ def flask_dispatch_wrapper(dispatcher, f, argument_getter=get_request_query_body
         :return: A response that the flask application can return.
         :rtype: flask.Response
         """
-        request_args, body_args, headers = argument_getter(request)
+        def get_arguments():
+            return argument_getter(request)
+
+        accepted_mimetypes = dispatcher.accepted_mimetypes(request.headers.get('Accept'))
+        return _dispatch_request(dispatcher, f, endpoint, request.method, urlparams,
+                                 accepted_mimetypes, get_arguments, _make_flask_response,
+                                 environ=request.environ)
+    return flask_dispatch
+
+
+def _make_flask_response(adapter):
+    """
+    :param ripozo.adapters.AdapterBase adapter: The adapter returned
+        by the dispatch.
+    :return: The flask Response for the adapter.
+    :rtype: flask.Response
+    """
+    response = Response(response=adapter.formatted_body, headers=adapter.extra_headers,
+                        content_type=adapter.extra_headers.get('Content-Type'), status=adapter.status_code)
+    if adapter.formatted_body is None:
+        # Responses without a body only have the headers they were given.
+        response.automatically_set_content_length = False
+        if 'Content-Type' not in adapter.extra_headers:
+            del response.headers['Content-Type']
+    return response
+
+
+def _handle_error(dispatcher, endpoint, accepted_mimetypes, exc):
+    """
+    Runs the error hooks and returns the response from the
+    dispatcher's error_handler.  The exception is queued on
+    the access logger if the dispatcher has one.
+    """
+    if dispatcher.access_logger is not None:
+        dispatcher.access_logger.log_error(endpoint, exc)
+    for hook in dispatcher.error_hooks:
+        try:
+            hook(endpoint, exc)
+        except Exception:
+            _logger.exception('The error hook %s failed for %s', hook, endpoint)
+    return dispatcher.error_handler(dispatcher, accepted_mimetypes, exc)
+
+
+def _dispatch_request(dispatcher, f, endpoint, method, urlparams, accepted_mimetypes,
+                      get_arguments, make_response, environ=None):
+    """
+    Does the actual work for the ``flask_dispatch`` function and
+    the ``flask_ripozo.wsgi.WSGIDispatcherApp``.  It runs the request
+    lifecycle hooks, builds the RequestContainer, dispatches it and
+    profiles and logs the request if the dispatcher has a profiler
+    or an access logger.  If the
+    request has a deadline it is set as the ``deadline`` attribute
+    of the RequestContainer.  Requests with an idempotency key replay
+    the stored response if there is one.  GET and HEAD requests are
+    answered with the pre-rendered file if the dispatcher has a
+    static renderer and there is one for the request.  If the
+    dispatcher has a rate limiter it is checked first and the
+    requests it rejects are passed straight to the error_handler.
+
+    :param FlaskDispatcher dispatcher: The dispatcher handling the request.
+    :param function f: The apimethod to dispatch to.
+    :param unicode endpoint: The name of the endpoint.
+    :param unicode method: The http method of the request.
+    :param dict urlparams: The url params of the request.
+    :param list accepted_mimetypes: The mimetypes accepted by the client.
+    :param function get_arguments: Takes no arguments and returns
+        the query args, body args and headers.
+    :param function make_response: Takes the adapter and returns
+        the response.
+    :param dict environ: The WSGI environ of the request.  Pre-rendered
+        files are only served and the rate limiter is only checked
+        when it is given.
+    :return: The result of ``make_response`` or the response from
+        the error_handler.
+    """
+    if method == 'OPTIONS':
+        options_endpoint = dispatcher.options_endpoints.get(dispatcher.route_for_endpoint[endpoint])
+        if options_endpoint is None:
+            return make_response(options_response(dispatcher, endpoint))
+        endpoint, f = options_endpoint, dispatcher.function_for_endpoint[options_endpoint]
+    start = default_timer()
+    profile = dispatcher.profiler.start(endpoint) if dispatcher.profiler is not None else None
+    timer = profile.timer if profile is not None else None
+    if timer is None and dispatcher.access_logger is not None:
+        timer = StageTimer()
+    response = None
+    idempotency_key = None
+    admitted = None
+    try:
+        if environ is not None and dispatcher.rate_limiter is not None:
+            try:
+                admitted = dispatcher.rate_limiter.admit(endpoint, environ)
+            except (RateLimitExceeded, LoadShedException) as e:
+                # Rejections are expected under load so they skip
+                # the error hooks and the error log.
+                response = dispatcher.error_handler(dispatcher, accepted_mimetypes, e)
+                return response
+        try:
+            for hook in dispatcher.before_request_hooks:
+                hook(endpoint)
+            if environ is not None and dispatcher.static_renderer is not None and method in ('GET', 'HEAD'):
+                response = _send_rendered_file(dispatcher, endpoint, urlparams, accepted_mimetypes, environ)
+                if response is not None:
+                    return response
+            request_args, body_args, headers = get_arguments()
+            deadline = _get_deadline(dispatcher, endpoint, headers, start)
+            if dispatcher.idempotency is not None:
+                key = dispatcher.idempotency.get_key(endpoint, method, headers, environ)
+                if key is not None:
+                    path = _request_path(endpoint, urlparams, environ)
+                    fingerprint = dispatcher.idempotency.fingerprint(method, path, body_args)
+                    stored = dispatcher.idempotency.begin(key, fingerprint)
+                    if stored is not None:
+                        for hook in dispatcher.after_dispatch_hooks:
+                            hook(endpoint, None, stored)
+                        response = make_response(stored)
+                        return response
+                    idempotency_key = key
+                    make_response = dispatcher.idempotency.recorder(key, make_response, fingerprint)
+        except Exception as e:
+            response = _handle_error(dispatcher, endpoint, accepted_mimetypes, e)
+            return response
         ripozo_request = RequestContainer(url_params=urlparams,
                                           query_args=request_args,
                                           body_args=body_args,
                                           headers=headers)
-        accepted_mimetypes = [accept[0] for accept in request.accept_mimetypes]
+        ripozo_request.deadline = deadline
+        set_deadline(deadline)
+        if timer is not None:
+            timer.mark('arguments')
+        if endpoint in dispatcher.background_endpoints and dispatcher.job_runner is not None:
+            f, make_response = dispatcher.job_runner.background(dispatcher, f, endpoint, method,
+                                                                accepted_mimetypes, make_response)
+        parser = dispatcher.argument_parsers.get(endpoint)
+        if parser is not None:
+            f = parser.wrap(f)
+        response = _dispatch_container(dispatcher, f, endpoint, method, ripozo_request,
+                                       accepted_mimetypes, make_response, timer)
+        return response
+    finally:
+        set_deadline(None)
+        if idempotency_key is not None:
+            dispatcher.idempotency.release(idempotency_key)
+        if admitted is not None:
+            dispatcher.rate_limiter.finish(admitted)
+        if profile is not None:
+            dispatcher.profiler.finish(profile)
+        if dispatcher.access_logger is not None:
+            _log_request(dispatcher, endpoint, method, accepted_mimetypes, response, timer)
+
+
+def _request_path(endpoint, urlparams, environ):
+    """
+    :return: The path of the request or the endpoint
+        and url params if there is no environ.
+    :rtype: unicode
+    """
+    if environ is not None:
+        return environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+    return '{0}:{1}'.format(endpoint, json.dumps(urlparams, sort_keys=True, default=repr))
+
+
+def _send_rendered_file(dispatcher, endpoint, urlparams, accepted_mimetypes, environ):
+    """
+    :return: The response sending the pre-rendered file for the
+        request or None if the request should be dispatched.
+    """
+    renderer = dispatcher.static_renderer
+    rendered_file = renderer.lookup(endpoint, urlparams, accepted_mimetypes, environ)
+    if rendered_file is None:
+        return None
+    response = renderer.send(rendered_file, environ)
+    if response is not None:
+        for hook in dispatcher.after_dispatch_hooks:
+            hook(endpoint, None, rendered_file)
+    return response
+
+
+def _log_request(dispatcher, endpoint, method, accepted_mimetypes, response, timer):
+    """
+    Passes the status and size of the response to the
+    dispatcher's access logger.
+    """
+    adapter_class = dispatcher.get_adapter_for_type(accepted_mimetypes)
+    dispatcher.access_logger.log_request(endpoint, method, getattr(response, 'status_code', None),
+                                         getattr(response, 'content_length', None),
+                                         adapter_class.__name__, timer)
+
+
+def _get_deadline(dispatcher, endpoint, headers, start):
+    """
+    :return: The deadline from the route's timeout or the dispatcher's
+        default timeout, shortened by the timeout header.  None if
+        the request does not have one.
+    :rtype: flask_ripozo.deadlines.Deadline
+    """
+    timeout = dispatcher.route_timeouts.get(endpoint, dispatcher.default_timeout)
+    if dispatcher.timeout_header:
+        try:
+            requested = parse_timeout(headers[dispatcher.timeout_header])
+        except KeyError:
+            requested = None
+        if requested is not None and (timeout is None or requested < timeout):
+            timeout = requested
+    return Deadline(timeout, start=start) if timeout is not None else None
+
+
+def _dispatch_container(dispatcher, f, endpoint, method, ripozo_request,
+                        accepted_mimetypes, make_response, timer):
+    """
+    Dispatches the RequestContainer, runs the after dispatch hooks,
+    publishes the change and makes the response.  The allocations
+    are tracked if the dispatcher has an allocation tracker.  A
+    ``DeadlineExceeded`` is raised if the request's deadline passes
+    before the apimethod is called or before the response is formatted.
+    HEAD requests are answered from the ``head_metadata`` of the
+    resource class instead of dispatching when it has one.  GET
+    requests whose conditional headers match it are answered
+    with a 304 and otherwise its headers are added to the response.
+    """
+    tracker = dispatcher.allocation_tracker
+    measurement = tracker.start(endpoint) if tracker is not None else None
+    deadline = getattr(ripozo_request, 'deadline', None)
+    try:
         try:
-            adapter = dispatcher.dispatch(f, accepted_mimetypes, ripozo_request)
+            if deadline is not None:
+                deadline.check()
+            adapter = metadata = None
+            if method in ('GET', 'HEAD'):
+                metadata = head_response(dispatcher, endpoint, ripozo_request, accepted_mimetypes)
+                if metadata is not None and (method == 'HEAD' or metadata.status_code == 304):
+                    adapter = metadata
+            if adapter is None:
+                adapter = dispatcher.dispatch(f, accepted_mimetypes, ripozo_request)
+                if metadata is not None:
+                    adapter = add_validators(adapter, metadata.validators)
+            if deadline is not None:
+                deadline.check()
+            for hook in dispatcher.after_dispatch_hooks:
+                hook(endpoint, ripozo_request, adapter)
         except Exception as e:
-            _logger.exception(e)
-            return dispatcher.error_handler(dispatcher, accepted_mimetypes, e)
+            if dispatcher.access_logger is None:
+                _logger.exception(e)
+            return _handle_error(dispatcher, endpoint, accepted_mimetypes, e)
+        if dispatcher.change_feeds and endpoint not in dispatcher.background_endpoints:
+            dispatcher.publish_change(endpoint, method, adapter.resource, ripozo_request.url_params)
+        if timer is not None:
+            timer.mark('dispatch')
 
-        return Response(response=adapter.formatted_body, headers=adapter.extra_headers,
-                        content_type=adapter.extra_headers['Content-Type'], status=adapter.status_code)
-    return flask_dispatch
+        response = make_response(adapter)
+        if timer is not None:
+            timer.mark('response')
+        return response
+    finally:
+        if measurement is not None:
+            tracker.finish(measurement)
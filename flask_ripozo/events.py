@@ -0,0 +1,298 @@
+"""
+An in-process publish/subscribe broker and the Server-Sent
+Events change feeds that are built on top of it.  Clients can
+subscribe to a resource's change feed instead of polling it.
+Every time a create, update or delete dispatched through the
+FlaskDispatcher succeeds, the adapter formatted resource is
+pushed to the subscribers.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import deque
+
+import itertools
+import logging
+import threading
+import time
+
+import six
+
+from flask_ripozo.adapters import BinaryAdapter
+
+_logger = logging.getLogger(__name__)
+
+CHANGE_EVENTS = {
+    'POST': 'created',
+    'PUT': 'updated',
+    'PATCH': 'updated',
+    'DELETE': 'deleted',
+}
+
+
+class Event(object):
+    """
+    A single published event.
+    """
+
+    def __init__(self, event_id, name, data, url_params=None):
+        """
+        :param int event_id: The id of the event.  It is unique per broker.
+        :param unicode name: The name of the event (e.g. ``'updated'``)
+        :param unicode data: The formatted data for the event.
+        :param dict url_params: The url params of the request that
+            produced the event.  Subscribers can filter on them.
+        """
+        self.id = event_id
+        self.name = name
+        self.data = data
+        self.url_params = url_params or {}
+
+
+class Subscription(object):
+    """
+    A subscriber to a channel.  Events are buffered in a bounded
+    queue until they are retrieved with ``get``.
+    """
+
+    def __init__(self, broker, channel, max_buffer, drop_slow=True):
+        """
+        :param EventBroker broker: The broker that created this.
+        :param unicode channel: The channel subscribed to.
+        :param int max_buffer: The maximum number of events to buffer.
+        :param bool drop_slow: If True, the subscription is closed when the
+            buffer is full.  Otherwise the oldest event is discarded.
+        """
+        self.broker = broker
+        self.channel = channel
+        self.max_buffer = max_buffer
+        self.drop_slow = drop_slow
+        self.closed = False
+        self.dropped = 0
+        self._events = deque()
+        self._condition = threading.Condition()
+
+    def put(self, event):
+        """
+        Buffers the event without blocking the publisher.
+
+        :param Event event: The event to buffer.
+        :return: False if the subscription was closed.
+        :rtype: bool
+        """
+        with self._condition:
+            if self.closed:
+                return False
+            if len(self._events) >= self.max_buffer:
+                if self.drop_slow:
+                    _logger.info('Closing a slow subscriber to %s', self.channel)
+                    self.closed = True
+                    self._condition.notify_all()
+                    return False
+                self._events.popleft()
+                self.dropped += 1
+            self._events.append(event)
+            self._condition.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Waits for the next event.
+
+        :param float timeout: The maximum number of seconds to wait.
+        :return: The next event or None if the timeout expired
+            or the subscription was closed.
+        :rtype: Event
+        """
+        with self._condition:
+            if not self._events and not self.closed:
+                self._condition.wait(timeout)
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    def close(self):
+        """
+        Closes the subscription and removes it from the broker.
+        """
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self.broker.unsubscribe(self)
+
+
+class EventBroker(object):
+    """
+    An in-process publish/subscribe broker.  Publishing never
+    blocks: each subscriber has a bounded buffer and slow subscribers
+    are either disconnected or lose their oldest events.
+    """
+
+    def __init__(self, max_buffer=100, drop_slow=True):
+        """
+        :param int max_buffer: The number of events buffered per subscriber.
+        :param bool drop_slow: Whether subscribers with a full buffer are
+            disconnected (True) or lose their oldest events (False).
+        """
+        self.max_buffer = max_buffer
+        self.drop_slow = drop_slow
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel):
+        """
+        :param unicode channel: The channel to subscribe to.
+        :return: A new subscription to the channel.
+        :rtype: Subscription
+        """
+        subscription = Subscription(self, channel, self.max_buffer, drop_slow=self.drop_slow)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        :param Subscription subscription: The subscription to remove.
+        """
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def subscriber_count(self, channel):
+        """
+        :param unicode channel: The channel.
+        :return: The number of current subscribers to the channel.
+        :rtype: int
+        """
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+    def publish(self, channel, name, data, url_params=None):
+        """
+        Publishes an event to every subscriber of the channel.
+
+        :param unicode channel: The channel to publish to.
+        :param unicode name: The name of the event.
+        :param unicode data: The event data.
+        :param dict url_params: The url params the event applies to.
+        :return: The published event.
+        :rtype: Event
+        """
+        event = Event(next(self._ids), name, data, url_params=url_params)
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            if not subscription.put(event):
+                self.unsubscribe(subscription)
+        return event
+
+
+def format_sse(data, event=None, event_id=None):
+    """
+    Formats a message in the Server-Sent Events wire format.
+
+    :param unicode data: The data.  It may contain new lines.
+    :param unicode event: The event name.
+    :param int event_id: The event id.
+    :return: The formatted message.
+    :rtype: unicode
+    """
+    lines = []
+    if event_id is not None:
+        lines.append('id: {0}'.format(event_id))
+    if event is not None:
+        lines.append('event: {0}'.format(event))
+    for line in data.splitlines() or ['']:
+        lines.append('data: {0}'.format(line))
+    return '\n'.join(lines) + '\n\n'
+
+
+class ChangeFeed(object):
+    """
+    The change feed for a single ResourceBase subclass.
+    It is created by ``FlaskDispatcher.register_change_feed``.
+    """
+
+    def __init__(self, resource_class, broker, adapter_class=None, keepalive=15):
+        """
+        :param type resource_class: The ResourceBase subclass.
+        :param EventBroker broker: The broker to publish with.
+        :param type adapter_class: The adapter used to format the
+            events.  Defaults to the dispatcher's default adapter or,
+            if that is a binary adapter, the adapter it builds its
+            documents with.
+        :param float keepalive: The number of seconds between the
+            keepalive comments sent to idle subscribers.
+        :raises: ValueError if the adapter is a binary adapter.
+            Server-Sent Events can only carry text.
+        """
+        if adapter_class is not None and issubclass(adapter_class, BinaryAdapter):
+            raise ValueError('The change feed for {0} can not use the binary adapter '
+                             '{1}'.format(resource_class.__name__, adapter_class.__name__))
+        self.resource_class = resource_class
+        self.broker = broker
+        self.adapter_class = adapter_class
+        self.keepalive = keepalive
+        self.channel = resource_class.__name__
+
+    def publish(self, dispatcher, method, resource, url_params):
+        """
+        Formats the resource and publishes it to the subscribers.
+        Nothing is formatted if there are no subscribers.
+
+        :param FlaskDispatcher dispatcher: The dispatcher that
+            dispatched the request.
+        :param unicode method: The http method of the request.
+        :param ripozo.resources.resource_base.ResourceBase resource: The
+            resource returned by the apimethod.
+        :param dict url_params: The url params of the request.
+        :return: The published event or None.
+        :rtype: Event
+        """
+        name = CHANGE_EVENTS.get(method)
+        if name is None or not self.broker.subscriber_count(self.channel):
+            return None
+        adapter_class = self.adapter_class or dispatcher.default_adapter
+        if issubclass(adapter_class, BinaryAdapter):
+            adapter_class = adapter_class.structure_adapter
+        data = adapter_class(resource, base_url=dispatcher.base_url).formatted_body
+        if isinstance(data, six.binary_type):
+            data = data.decode('utf-8')
+        return self.broker.publish(self.channel, name, data, url_params=url_params)
+
+    def stream(self, filters=None):
+        """
+        A generator of the Server-Sent Events for a new subscriber.
+        The subscription is created when the generator is first
+        advanced and closed when the generator is closed.
+
+        :param dict filters: Only events whose url params match all
+            of the filters are sent.
+        :return: A generator of the formatted messages.
+        :rtype: types.GeneratorType
+        """
+        filters = dict((key, six.text_type(value)) for key, value in six.iteritems(filters or {}))
+        subscription = self.broker.subscribe(self.channel)
+        try:
+            yield ': connected\n\n'
+            last_sent = time.time()
+            while not subscription.closed:
+                event = subscription.get(timeout=self.keepalive)
+                if event is None:
+                    if time.time() - last_sent >= self.keepalive:
+                        last_sent = time.time()
+                        yield ': keepalive\n\n'
+                    continue
+                if any(six.text_type(event.url_params.get(key)) != value
+                       for key, value in six.iteritems(filters)):
+                    continue
+                last_sent = time.time()
+                yield format_sse(event.data, event=event.name, event_id=event.id)
+        finally:
+            subscription.close()
@@ -0,0 +1,337 @@
+"""
+Deduplicates retried writes with the ``Idempotency-Key`` header.
+The first request with a key is dispatched normally and its formatted
+response is stored.  Retries with the same key replay the stored
+response without calling the apimethod.  A retry that arrives while
+the first request is still being handled waits for it to finish.
+
+.. code-block:: python
+
+    dispatcher = FlaskDispatcher(app)
+    IdempotencyHandler(InMemoryIdempotencyStore(ttl=3600)).attach(dispatcher)
+
+Only successful dispatches are stored.  If the first request fails
+the key is released and a retry runs the apimethod again.
+
+Keys are scoped to the client sending them, by default the
+``Authorization`` or ``X-Api-Key`` header or else the remote address,
+so two clients can use the same key.  A retry with the same key but a
+different method, path or body gets a 422 instead of the stored response.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from timeit import default_timer
+
+from ripozo.exceptions import RestException
+
+import hashlib
+import json
+import threading
+
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+IDENTITY_HEADERS = ('Authorization', 'X-Api-Key')
+
+
+def client_identity(environ, headers):
+    """
+    The default ``key_func`` of the ``IdempotencyHandler``.
+
+    :param dict environ: The WSGI environ of the request or None.
+    :param dict headers: The request headers.
+    :return: The ``Authorization`` or ``X-Api-Key`` header or
+        the remote address if there is neither.
+    :rtype: unicode
+    """
+    for header in IDENTITY_HEADERS:
+        try:
+            value = headers[header]
+        except KeyError:
+            continue
+        if value:
+            return value
+    return (environ or {}).get('REMOTE_ADDR') or ''
+
+
+def _hash(*parts):
+    value = '\n'.join(parts)
+    return hashlib.sha1(value.encode('utf8')).hexdigest()
+
+
+class IdempotencyConflict(RestException):
+    """
+    Raised when a request with the same key is
+    still being handled after the wait timeout.
+    """
+    def __init__(self, message, status_code=409, *args, **kwargs):
+        super(IdempotencyConflict, self).__init__(message, status_code=status_code, *args, **kwargs)
+
+
+class IdempotencyKeyMismatch(RestException):
+    """
+    Raised when a key is reused for a request with
+    a different method, path or body.
+    """
+    def __init__(self, message, status_code=422, *args, **kwargs):
+        super(IdempotencyKeyMismatch, self).__init__(message, status_code=status_code, *args, **kwargs)
+
+
+class StoredResponse(object):
+    """
+    A formatted response.  It has the same ``formatted_body``,
+    ``extra_headers`` and ``status_code`` attributes as an adapter
+    so the dispatcher can make a response from it.  The ``fingerprint``
+    identifies the request it is the response to.
+    """
+
+    def __init__(self, formatted_body, extra_headers, status_code, fingerprint=None):
+        self.formatted_body = formatted_body
+        self.extra_headers = extra_headers
+        self.status_code = status_code
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_adapter(cls, adapter, fingerprint=None):
+        """
+        :param ripozo.adapters.AdapterBase adapter: The adapter
+            returned by the dispatch.
+        :param unicode fingerprint: The fingerprint of the request.
+        :rtype: StoredResponse
+        """
+        return cls(adapter.formatted_body, dict(adapter.extra_headers), adapter.status_code,
+                   fingerprint=fingerprint)
+
+    def replayed(self):
+        """
+        :return: A copy with the ``Idempotent-Replayed`` header.
+        :rtype: StoredResponse
+        """
+        headers = dict(self.extra_headers)
+        headers['Idempotent-Replayed'] = 'true'
+        return StoredResponse(self.formatted_body, headers, self.status_code, fingerprint=self.fingerprint)
+
+
+class InMemoryIdempotencyStore(object):
+    """
+    Keeps the responses in memory for ``ttl`` seconds.  At most
+    ``max_entries`` responses are kept, removing the oldest first.
+    Other stores need the same ``reserve``, ``save``, ``release``
+    and ``wait`` methods.
+    """
+
+    def __init__(self, max_entries=10000, ttl=86400):
+        """
+        :param int max_entries: The maximum number of stored responses.
+        :param float ttl: The number of seconds a response is kept.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._responses = OrderedDict()
+        self._in_flight = set()
+        self._changed = threading.Condition()
+
+    def reserve(self, key):
+        """
+        Atomically gets the stored response for the key or marks
+        the key as in flight if there is not one.
+
+        :param unicode key: The idempotency key.
+        :return: The stored response (or None) and whether
+            the key was reserved by this call.
+        :rtype: tuple
+        """
+        with self._changed:
+            entry = self._responses.get(key)
+            if entry is not None:
+                expires, response = entry
+                if expires > default_timer():
+                    return response, False
+                del self._responses[key]
+            if key in self._in_flight:
+                return None, False
+            self._in_flight.add(key)
+            return None, True
+
+    def save(self, key, response):
+        """
+        Stores the response for a reserved key.
+
+        :param unicode key: The idempotency key.
+        :param StoredResponse response: The response to replay.
+        """
+        with self._changed:
+            self._in_flight.discard(key)
+            self._responses.pop(key, None)
+            self._responses[key] = (default_timer() + self.ttl, response)
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+            self._changed.notify_all()
+
+    def release(self, key):
+        """
+        Releases a reserved key without storing a response.
+
+        :param unicode key: The idempotency key.
+        """
+        with self._changed:
+            if key in self._in_flight:
+                self._in_flight.discard(key)
+                self._changed.notify_all()
+
+    def wait(self, key, timeout):
+        """
+        Waits until the key is no longer in flight.
+
+        :param unicode key: The idempotency key.
+        :param float timeout: The maximum number of seconds to wait.
+        """
+        with self._changed:
+            if key in self._in_flight:
+                self._changed.wait(timeout)
+
+    def __len__(self):
+        return len(self._responses)
+
+
+class IdempotencyHandler(object):
+    """
+    Replays the responses of requests with an idempotency key.
+    """
+
+    def __init__(self, store=None, header='Idempotency-Key', methods=UNSAFE_METHODS, wait_timeout=10,
+                 key_func=client_identity):
+        """
+        :param InMemoryIdempotencyStore store: Where the responses are
+            kept.  An ``InMemoryIdempotencyStore`` by default.
+        :param unicode header: The header with the key.
+        :param tuple methods: The http methods that are deduplicated.
+        :param float wait_timeout: The number of seconds a duplicate
+            waits for the first request before a 409 is returned.
+        :param function key_func: Takes the WSGI environ (or None)
+            and the headers and returns the identity of the client
+            the keys are scoped to.  ``client_identity`` by default.
+        """
+        self.store = store if store is not None else InMemoryIdempotencyStore()
+        self.header = header
+        self.methods = methods
+        self.wait_timeout = wait_timeout
+        self.key_func = key_func
+        self._lock = threading.Lock()
+        self._counts = dict(stored=0, replayed=0, conflicts=0, mismatches=0)
+
+    def attach(self, dispatcher, name='idempotency'):
+        """
+        Deduplicates the requests handled by the dispatcher.
+
+        :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The dispatcher.
+        :param unicode name: The name of the metrics in ``dispatcher.stats``
+        """
+        dispatcher.idempotency = self
+        dispatcher.stats_sources[name] = self
+
+    def get_key(self, endpoint, method, headers, environ=None):
+        """
+        :param unicode endpoint: The endpoint of the request.
+        :param unicode method: The http method.
+        :param dict headers: The request headers.
+        :param dict environ: The WSGI environ of the request.
+        :return: The key scoped to the client and endpoint or None
+            if the request should not be deduplicated.
+        :rtype: unicode
+        """
+        if method not in self.methods:
+            return None
+        try:
+            value = headers[self.header]
+        except KeyError:
+            return None
+        if not value:
+            return None
+        client = _hash(self.key_func(environ, headers) or '')
+        return '{0}:{1}:{2}'.format(endpoint, client, value)
+
+    @staticmethod
+    def fingerprint(method, path, body_args):
+        """
+        :param unicode method: The http method.
+        :param unicode path: The path of the request.
+        :param dict body_args: The body args of the request.
+        :return: A hash of the method, path and body.
+        :rtype: unicode
+        """
+        body = json.dumps(body_args, sort_keys=True, default=repr)
+        return _hash(method, path, body)
+
+    def begin(self, key, fingerprint=None):
+        """
+        Reserves the key, waiting for a request with the
+        same key that is in flight.
+
+        :param unicode key: The key from ``get_key``.
+        :param unicode fingerprint: The fingerprint of the request.
+            The stored response is only replayed if it is the
+            response to a request with the same fingerprint.
+        :return: The response to replay or None if the
+            request should be dispatched.
+        :rtype: StoredResponse
+        :raises: IdempotencyConflict
+        :raises: IdempotencyKeyMismatch
+        """
+        give_up = default_timer() + self.wait_timeout
+        while True:
+            response, reserved = self.store.reserve(key)
+            if response is not None:
+                if response.fingerprint != fingerprint:
+                    self._count('mismatches')
+                    raise IdempotencyKeyMismatch('The idempotency key was used for a different request')
+                self._count('replayed')
+                return response.replayed()
+            if reserved:
+                return None
+            remaining = give_up - default_timer()
+            if remaining <= 0:
+                self._count('conflicts')
+                raise IdempotencyConflict('A request with the same idempotency key is in progress')
+            self.store.wait(key, remaining)
+
+    def recorder(self, key, make_response, fingerprint=None):
+        """
+        :param unicode key: The reserved key.
+        :param function make_response: Takes the adapter and
+            returns the response.
+        :param unicode fingerprint: The fingerprint of the request.
+        :return: A ``make_response`` function that stores
+            the formatted response first.
+        :rtype: function
+        """
+        def record(adapter):
+            stored = StoredResponse.from_adapter(adapter, fingerprint=fingerprint)
+            self.store.save(key, stored)
+            self._count('stored')
+            return make_response(stored)
+        return record
+
+    def release(self, key):
+        """
+        Releases the key if the response was not stored.
+
+        :param unicode key: The reserved key.
+        """
+        self.store.release(key)
+
+    def stats(self):
+        """
+        :return: The number of responses stored, replayed, the
+            number of duplicates that timed out waiting and the
+            number of keys reused for a different request.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
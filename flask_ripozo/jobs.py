@@ -0,0 +1,404 @@
+"""
+Runs long apimethods in the background.  Routes registered with
+``background=True`` are queued on a local pool of worker threads
+and immediately answered with a ``202 Accepted`` whose ``Location``
+points to a job resource.  The job resource returns the status of the
+job while it is pending and the result of the apimethod once it has
+finished.
+
+.. code-block:: python
+
+    class Report(ResourceBase):
+        @apimethod(route='/generate', methods=['POST'], background=True)
+        def generate(cls, request):
+            ...
+
+    dispatcher = FlaskDispatcher(app)
+    dispatcher.register_resources(Report)
+    JobRunner(workers=2).attach(dispatcher)
+
+The request lifecycle hooks of the dispatcher run for the request
+that queues the job, not for the job.  The worker runs the job hooks
+of the runner instead (see ``JobRunner.before_job``).  They are
+called outside of a flask request context.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from ripozo import apimethod, ResourceBase
+from ripozo.exceptions import NotFoundException, RestException
+
+from six.moves import queue
+
+import logging
+import re
+import six
+import threading
+import time
+import uuid
+
+_logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+class JobStoreFullException(RestException):
+    """
+    Raised when a job can not be stored because the
+    store is full of unfinished jobs.
+    """
+    def __init__(self, message, status_code=503, *args, **kwargs):
+        super(JobStoreFullException, self).__init__(message, status_code=status_code, *args, **kwargs)
+
+
+class Job(object):
+    """
+    A call to a background apimethod.  Once it has finished
+    ``resource`` holds the ResourceBase instance the apimethod
+    returned.  If it failed ``exception`` holds the exception
+    it raised.
+    """
+
+    def __init__(self, endpoint, job_id=None):
+        """
+        :param unicode endpoint: The endpoint that was called.
+        :param unicode job_id: The id of the job.  A random
+            id is generated by default.
+        """
+        self.job_id = job_id or uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.status = PENDING
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.resource = None
+        self.exception = None
+
+    @property
+    def done(self):
+        """
+        :return: Whether the job has finished or failed.
+        :rtype: bool
+        """
+        return self.status in (FINISHED, FAILED)
+
+    def to_dict(self):
+        """
+        :return: The properties of the job resource.
+        :rtype: dict
+        """
+        error = six.text_type(self.exception) if self.exception is not None else None
+        return dict(job_id=self.job_id, endpoint=self.endpoint, status=self.status,
+                    created=self.created, started=self.started, finished=self.finished,
+                    error=error)
+
+
+class InMemoryJobStore(object):
+    """
+    Keeps the jobs in memory.  Finished jobs are kept for
+    ``retention`` seconds and at most ``max_jobs`` jobs are kept,
+    removing the oldest finished jobs first.  Other stores need
+    the same ``add``, ``get``, ``update`` and ``__len__`` methods.
+    """
+
+    def __init__(self, max_jobs=1000, retention=3600):
+        """
+        :param int max_jobs: The maximum number of jobs stored.
+        :param float retention: The number of seconds finished
+            jobs are kept.
+        """
+        self.max_jobs = max_jobs
+        self.retention = retention
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        """
+        Stores a new job.
+
+        :param Job job: The job to store.
+        :raises: JobStoreFullException
+        """
+        with self._lock:
+            self._expire()
+            if len(self._jobs) >= self.max_jobs:
+                raise JobStoreFullException('Too many background jobs are pending')
+            self._jobs[job.job_id] = job
+
+    def get(self, job_id):
+        """
+        :param unicode job_id: The id of the job.
+        :return: The job or None if it does not exist or has expired.
+        :rtype: Job
+        """
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def update(self, job):
+        """
+        Called when the status of a job changes.  The jobs in
+        memory are already up to date.
+
+        :param Job job: The job that changed.
+        """
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _expire(self):
+        oldest = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished < oldest:
+                del self._jobs[job_id]
+        if len(self._jobs) >= self.max_jobs:
+            for job_id, job in list(self._jobs.items()):
+                if job.done:
+                    del self._jobs[job_id]
+                    if len(self._jobs) < self.max_jobs:
+                        break
+
+
+class JobResource(ResourceBase):
+    """
+    The status of a background job.  ``JobRunner.attach``
+    registers a subclass bound to the runner.
+    """
+    resource_name = 'jobs'
+    pks = ('job_id',)
+    append_slash = True
+    runner = None
+
+    @apimethod(methods=['GET'])
+    def retrieve(cls, request):
+        """
+        Returns the job while it is pending or running and the
+        resource returned by the apimethod once it has finished.
+        If it failed with a RestException it is raised, otherwise
+        the job is returned with its error message.
+        """
+        job = cls.runner.store.get(request.get('job_id'))
+        if job is None:
+            raise NotFoundException('The job {0} does not exist'.format(request.get('job_id')))
+        if job.status == FINISHED:
+            return job.resource
+        if job.status == FAILED and isinstance(job.exception, RestException):
+            raise job.exception
+        return cls(properties=job.to_dict())
+
+
+class _AcceptedAdapter(object):
+    """
+    Adds the ``Location`` of the job to the formatted
+    job resource.
+    """
+
+    def __init__(self, adapter):
+        self.formatted_body = adapter.formatted_body
+        self.status_code = adapter.status_code
+        self.extra_headers = dict(adapter.extra_headers)
+        self.extra_headers['Location'] = adapter.combine_base_url_with_resource_url(adapter.resource.url)
+
+
+class JobRunner(object):
+    """
+    Runs the apimethods of background routes on a pool of
+    worker threads.  The job hooks run in the worker for the
+    apimethod, so a ``PooledSessionHandler`` attached to the
+    runner commits the job's session when the job finishes.
+    """
+
+    def __init__(self, store=None, workers=4):
+        """
+        :param InMemoryJobStore store: Where the jobs are kept.
+            An ``InMemoryJobStore`` by default.
+        :param int workers: The number of worker threads.
+        """
+        self.store = store if store is not None else InMemoryJobStore()
+        self.workers = workers
+        self.resource_class = None
+        self.before_job_hooks = []
+        self.after_job_hooks = []
+        self.job_error_hooks = []
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counts = dict(submitted=0, running=0, finished=0, failed=0)
+
+    def attach(self, dispatcher, resource_name='jobs', name='jobs'):
+        """
+        Registers the job resource on the dispatcher and
+        runs its background routes with this runner.
+
+        :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The
+            dispatcher with background routes.
+        :param unicode resource_name: The resource_name of the job resource.
+            The job resource class is named after it (e.g. ``JobsJobResource``).
+        :param unicode name: The name of the metrics in ``dispatcher.stats``
+        """
+        words = re.sub(r'[^0-9a-zA-Z]', ' ', resource_name).title()
+        class_name = '{0}JobResource'.format(words.replace(' ', ''))
+        self.resource_class = type(str(class_name), (JobResource,),
+                                   dict(runner=self, resource_name=resource_name))
+        dispatcher.register_resources(self.resource_class)
+        dispatcher.job_runner = self
+        dispatcher.stats_sources[name] = self
+
+    def before_job(self, func):
+        """
+        Registers a function that is called with the endpoint
+        name in the worker before the apimethod of a job is called.
+        It can be used as a decorator.
+
+        :param function func: The function to call.
+        :return: The function.
+        :rtype: function
+        """
+        self.before_job_hooks.append(func)
+        return func
+
+    def after_job(self, func):
+        """
+        Registers a function that is called with the endpoint name,
+        the RequestContainer and the adapter for the result in the
+        worker after the apimethod of a job returned.  It can be
+        used as a decorator.
+
+        :param function func: The function to call.
+        :return: The function.
+        :rtype: function
+        """
+        self.after_job_hooks.append(func)
+        return func
+
+    def on_job_error(self, func):
+        """
+        Registers a function that is called with the endpoint name
+        and the exception in the worker when a job fails.  It can be
+        used as a decorator.
+
+        :param function func: The function to call.
+        :return: The function.
+        :rtype: function
+        """
+        self.job_error_hooks.append(func)
+        return func
+
+    def background(self, dispatcher, f, endpoint, method, accepted_mimetypes, make_response):
+        """
+        Replaces the apimethod of a request with one that queues
+        it and returns the job resource with a 202 status.
+
+        :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The
+            dispatcher handling the request.
+        :param function f: The apimethod.
+        :param unicode endpoint: The endpoint of the route.
+        :param unicode method: The http method of the request.
+        :param list accepted_mimetypes: The mimetypes accepted by the client.
+        :param function make_response: Takes the adapter and returns
+            the response.
+        :return: The function to dispatch and the function that
+            makes the response.
+        :rtype: tuple
+        """
+        def submit(request):
+            job = Job(endpoint)
+            self.store.add(job)
+            adapter_class = dispatcher.get_adapter_for_type(accepted_mimetypes)
+            self._start_workers()
+            self._queue.put((job, dispatcher, f, method, request, adapter_class, dispatcher.base_url))
+            with self._lock:
+                self._counts['submitted'] += 1
+            return self.resource_class(properties=job.to_dict(), status_code=202)
+
+        def accepted_response(adapter):
+            return make_response(_AcceptedAdapter(adapter))
+
+        return submit, accepted_response
+
+    def stats(self):
+        """
+        :return: The number of jobs submitted, queued, running,
+            finished and failed and the number of stored jobs.
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._counts)
+        stats.update(queued=self._queue.qsize(), stored=len(self.store))
+        return stats
+
+    def shutdown(self):
+        """
+        Stops the workers after the queued jobs have run.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _start_workers(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name='flask-ripozo-jobs')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._run(*item)
+
+    def _run(self, job, dispatcher, f, method, request, adapter_class, base_url):
+        job.status = RUNNING
+        job.started = time.time()
+        self.store.update(job)
+        self._count('running', 1)
+        endpoint = job.endpoint
+        request.deadline = None
+        dispatcher._local.base_url = base_url
+        try:
+            for hook in self.before_job_hooks:
+                hook(endpoint)
+            resource = f(request)
+            adapter = adapter_class(resource, base_url=base_url)
+            for hook in self.after_job_hooks:
+                hook(endpoint, request, adapter)
+        except Exception as exc:
+            _logger.exception('The background job %s for %s failed', job.job_id, endpoint)
+            for hook in self.job_error_hooks:
+                try:
+                    hook(endpoint, exc)
+                except Exception:
+                    _logger.exception('The error hook %s failed for %s', hook, endpoint)
+            job.exception = exc
+            status = FAILED
+        else:
+            if dispatcher.change_feeds:
+                dispatcher.publish_change(endpoint, method, resource, request.url_params)
+            job.resource = resource
+            status = FINISHED
+        finally:
+            dispatcher._local.base_url = None
+        job.finished = time.time()
+        job.status = status
+        self._count('running', -1)
+        self._count(job.status, 1)
+        self.store.update(job)
+
+    def _count(self, key, value):
+        with self._lock:
+            self._counts[key] += value
@@ -0,0 +1,123 @@
+"""
+Optional per-endpoint memory allocation tracking using
+``tracemalloc``.  Only a sample of the requests are measured
+since tracing allocations slows down the interpreter.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import threading
+import warnings
+
+import six
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+
+class _Measurement(object):
+    """
+    An allocation measurement that is in progress.
+    """
+
+    def __init__(self, endpoint, baseline, owns_tracing):
+        self.endpoint = endpoint
+        self.baseline = baseline
+        self.owns_tracing = owns_tracing
+
+
+class AllocationTracker(object):
+    """
+    Records the peak and net number of bytes allocated while
+    dispatching a request and constructing its response.  Pass
+    an instance to the FlaskDispatcher to enable it.
+
+    ``tracemalloc`` traces the whole process so only one request
+    is measured at a time.  Allocations made by other threads during
+    that time are included, so the numbers are most accurate with
+    a single worker thread (e.g. in benchmark runs).
+    """
+
+    def __init__(self, sample_rate=0.01):
+        """
+        :param float sample_rate: The fraction (0 to 1) of the requests
+            to measure.
+        """
+        if tracemalloc is None:
+            warnings.warn('tracemalloc is not available on this interpreter. '
+                          'No allocations will be tracked.')
+        self.sample_rate = sample_rate
+        self.endpoint_stats = {}
+        self._measuring = threading.Lock()
+        self._lock = threading.Lock()
+
+    def start(self, endpoint):
+        """
+        Starts measuring the allocations for the request if it
+        is sampled and no other request is being measured.
+
+        :param unicode endpoint: The name of the endpoint.
+        :return: The measurement to pass to ``finish`` or None
+            if the request is not being measured.
+        :rtype: _Measurement
+        """
+        if tracemalloc is None or random.random() >= self.sample_rate:
+            return None
+        if not self._measuring.acquire(False):
+            return None
+        owns_tracing = not tracemalloc.is_tracing()
+        if owns_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        return _Measurement(endpoint, tracemalloc.get_traced_memory()[0], owns_tracing)
+
+    def finish(self, measurement):
+        """
+        Stops measuring and records the allocations against
+        the endpoint.
+
+        :param _Measurement measurement: The object returned by ``start``
+        :return: A tuple of the peak and net allocated bytes.
+        :rtype: tuple
+        """
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            if measurement.owns_tracing:
+                tracemalloc.stop()
+        finally:
+            self._measuring.release()
+        peak = max(peak - measurement.baseline, 0)
+        net = current - measurement.baseline
+        with self._lock:
+            stats = self.endpoint_stats.get(measurement.endpoint)
+            if stats is None:
+                stats = self.endpoint_stats[measurement.endpoint] = dict(
+                    samples=0, max_peak=0, total_peak=0, total_net=0)
+            stats['samples'] += 1
+            stats['max_peak'] = max(stats['max_peak'], peak)
+            stats['total_peak'] += peak
+            stats['total_net'] += net
+            stats['last_peak'] = peak
+            stats['last_net'] = net
+        return peak, net
+
+    def stats(self):
+        """
+        :return: A dictionary of the endpoint names to the number of
+            samples and the max, mean and last peak and net allocated bytes.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((endpoint, dict(samples=stats['samples'],
+                                        max_peak=stats['max_peak'],
+                                        mean_peak=stats['total_peak'] / stats['samples'],
+                                        mean_net=stats['total_net'] / stats['samples'],
+                                        last_peak=stats['last_peak'],
+                                        last_net=stats['last_net']))
+                        for endpoint, stats in six.iteritems(self.endpoint_stats))
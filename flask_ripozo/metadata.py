@@ -0,0 +1,202 @@
+"""
+Answers HEAD and OPTIONS requests without formatting a body.
+
+OPTIONS requests are answered from the routes registered on the
+dispatcher.  The ``Allow`` header lists the methods of every
+apimethod registered on the route and the ``Accept-Formats``
+header lists the mimetypes of the registered adapters.  If an
+apimethod on the route lists ``OPTIONS`` in its methods the
+requests are dispatched to it as usual.
+
+HEAD requests are dispatched to the GET apimethod of the route
+unless its resource class has a ``head_metadata`` classmethod.
+It takes the RequestContainer and the adapter class negotiated
+for the request and returns a dictionary with the ``etag`` and/or
+``last_modified`` of the resource (or None to dispatch the request
+anyway).  It is called before GET requests are dispatched too.  If
+the ``If-None-Match`` or ``If-Modified-Since`` header of the request
+matches, a ``304 Not Modified`` is returned without dispatching.
+Otherwise the headers are added to the response:
+
+.. code-block:: python
+
+    class TaskResource(restmixins.RetrieveRetrieveList):
+        @classmethod
+        def head_metadata(cls, request, adapter_class):
+            task = Task.query.get_or_404(request.get('id'))
+            return dict(etag=task.version, last_modified=task.updated)
+
+The responses to HEAD requests answered from the ``head_metadata``
+do not have a ``Content-Length`` since the body is never formatted.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag, unquote_etag
+
+import six
+
+FORMATS_HEADER = 'Accept-Formats'
+
+
+class MetadataResponse(object):
+    """
+    The headers of a response without a body.  It has the
+    same ``formatted_body``, ``extra_headers`` and ``status_code``
+    attributes as an adapter so the dispatcher can make a
+    response from it.
+    """
+    formatted_body = None
+    resource = None
+
+    def __init__(self, extra_headers, status_code=200, validators=None):
+        self.extra_headers = extra_headers
+        self.status_code = status_code
+        self.validators = validators or {}
+
+
+class _ValidatedAdapter(object):
+    """
+    Adds the ``ETag`` and ``Last-Modified`` headers to the
+    adapter of a GET request.  The body is formatted by the
+    adapter when it is first used.
+    """
+
+    def __init__(self, adapter, headers):
+        self.adapter = adapter
+        self.extra_headers = dict(adapter.extra_headers)
+        self.extra_headers.update(headers)
+
+    @property
+    def formatted_body(self):
+        return self.adapter.formatted_body
+
+    @property
+    def status_code(self):
+        return self.adapter.status_code
+
+    @property
+    def resource(self):
+        return self.adapter.resource
+
+
+def allowed_methods(methods):
+    """
+    :param set methods: The methods of the apimethods on a route.
+    :return: The sorted methods including HEAD if GET is allowed
+        and OPTIONS.
+    :rtype: list
+    """
+    allowed = set(method.upper() for method in methods)
+    allowed.add('OPTIONS')
+    if 'GET' in allowed:
+        allowed.add('HEAD')
+    return sorted(allowed)
+
+
+def options_response(dispatcher, endpoint):
+    """
+    :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The
+        dispatcher handling the request.
+    :param unicode endpoint: The endpoint that matched the request.
+    :return: The response to an OPTIONS request.
+    :rtype: MetadataResponse
+    """
+    route = dispatcher.route_for_endpoint[endpoint]
+    headers = {
+        'Allow': ', '.join(allowed_methods(dispatcher.route_methods[route])),
+        FORMATS_HEADER: ', '.join(sorted(fmt for fmt in dispatcher.adapter_formats if '/' in fmt)),
+        'Content-Length': '0',
+    }
+    return MetadataResponse(headers)
+
+
+def validator_headers(metadata):
+    """
+    :param dict metadata: The dictionary returned by ``head_metadata``.
+    :return: The ``ETag`` and ``Last-Modified`` headers.
+    :rtype: dict
+    """
+    headers = {}
+    if metadata.get('etag') is not None:
+        etag = six.text_type(metadata['etag'])
+        headers['ETag'] = etag if etag.startswith(('"', 'W/"')) else quote_etag(etag)
+    if metadata.get('last_modified') is not None:
+        last_modified = metadata['last_modified']
+        if not isinstance(last_modified, six.string_types):
+            last_modified = http_date(last_modified)
+        headers['Last-Modified'] = last_modified
+    return headers
+
+
+def not_modified(validators, headers):
+    """
+    :param dict validators: The headers from ``validator_headers``.
+    :param dict headers: The request headers.
+    :return: Whether the conditional headers of the request
+        match the validators.
+    :rtype: bool
+    """
+    if_none_match = _get_header(headers, 'If-None-Match')
+    if if_none_match is not None:
+        if 'ETag' not in validators:
+            return False
+        etag = unquote_etag(validators['ETag'])[0]
+        return parse_etags(if_none_match).contains_weak(etag)
+    if_modified_since = _get_header(headers, 'If-Modified-Since')
+    if if_modified_since is None or 'Last-Modified' not in validators:
+        return False
+    since = parse_date(if_modified_since)
+    last_modified = parse_date(validators['Last-Modified'])
+    return since is not None and last_modified is not None and last_modified <= since
+
+
+def head_response(dispatcher, endpoint, request, accepted_mimetypes):
+    """
+    Gets the headers for a HEAD or GET request from the
+    ``head_metadata`` of the endpoint's resource class.  The
+    status is 304 if the request's conditional headers match.
+
+    :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The
+        dispatcher handling the request.
+    :param unicode endpoint: The endpoint that matched the request.
+    :param RequestContainer request: The request.
+    :param list accepted_mimetypes: The mimetypes accepted by the client.
+    :return: The response or None if the resource
+        class does not have metadata for the request.
+    :rtype: MetadataResponse
+    """
+    head_metadata = getattr(dispatcher.resource_for_endpoint.get(endpoint), 'head_metadata', None)
+    if head_metadata is None:
+        return None
+    adapter_class = dispatcher.get_adapter_for_type(accepted_mimetypes)
+    metadata = head_metadata(adapter_class.format_request(request), adapter_class)
+    if metadata is None:
+        return None
+    validators = validator_headers(metadata)
+    if validators and not_modified(validators, request._headers):
+        return MetadataResponse(dict(validators), status_code=304, validators=validators)
+    headers = dict(adapter_class.extra_headers)
+    headers.update(validators)
+    return MetadataResponse(headers, validators=validators)
+
+
+def add_validators(adapter, validators):
+    """
+    :param ripozo.adapters.AdapterBase adapter: The adapter
+        returned by the dispatch of a GET request.
+    :param dict validators: The headers from ``validator_headers``.
+    :return: The adapter or one with the headers added.
+    """
+    if not validators:
+        return adapter
+    return _ValidatedAdapter(adapter, validators)
+
+
+def _get_header(headers, name):
+    try:
+        return headers[name]
+    except KeyError:
+        return None
@@ -0,0 +1,441 @@
+"""
+Pre-renders the GET routes of a dispatcher into files so that
+reference data that rarely changes can be served without dispatching.
+Every GET route is rendered with every registered adapter.  Routes
+with url parameters are only rendered if their resource class has a
+``prerender_url_params`` classmethod that returns the url parameters
+to render:
+
+.. code-block:: python
+
+    class CountryResource(restmixins.RetrieveList):
+        @classmethod
+        def prerender_url_params(cls):
+            return [dict(code=country.code) for country in Country.query]
+
+    dispatcher = FlaskDispatcher(app)
+    dispatcher.register_resources(CountryResource)
+    renderer = StaticRenderer('/var/cache/api', 'https://api.example.com/')
+    renderer.attach(dispatcher)
+
+Then run ``flask prerender`` (or ``flask prerender --resource
+CountryResource`` to only render the routes of one resource) whenever
+the data changes.  GET and HEAD requests without a query string
+are answered from the rendered files with an ``ETag`` and a gzip
+variant for clients that accept it.  Requests for anything that
+was not rendered are dispatched as usual.  The before request and
+after dispatch hooks still run for files that are served.
+
+The rendered bodies contain links built from the ``url_root`` of
+the renderer.  Requests handled by a ``DispatcherMount`` are always
+dispatched since their links differ.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from io import BytesIO
+from timeit import default_timer
+
+from werkzeug.http import parse_accept_header
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import six
+
+try:
+    from werkzeug.utils import send_file
+except ImportError:  # Werkzeug < 2.0
+    send_file = None
+
+from flask_ripozo.dispatcher import _CaseInsentiveDict, _dispatch_request
+from flask_ripozo.idempotency import StoredResponse
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+
+class RenderedFile(object):
+    """
+    A response rendered to a file.  The ``filename`` and the
+    ``gzip_filename`` are relative to the renderer's directory.
+    """
+    status_code = 200
+
+    def __init__(self, endpoint, url_params, mimetype, content_type, filename, etag,
+                 gzip_filename=None, resource=None):
+        self.endpoint = endpoint
+        self.url_params = url_params
+        self.mimetype = mimetype
+        self.content_type = content_type
+        self.filename = filename
+        self.etag = etag
+        self.gzip_filename = gzip_filename
+        self.resource = resource
+
+    @property
+    def key(self):
+        return _file_key(self.endpoint, self.url_params, self.mimetype)
+
+    def to_dict(self):
+        return dict(endpoint=self.endpoint, url_params=self.url_params, mimetype=self.mimetype,
+                    content_type=self.content_type, filename=self.filename, etag=self.etag,
+                    gzip_filename=self.gzip_filename, resource=self.resource)
+
+
+class StaticRenderer(object):
+    """
+    Renders the GET routes of a dispatcher into a directory and
+    serves the rendered files.  The rendered files are listed
+    in a manifest in the directory which other processes reload
+    when it changes.
+    """
+
+    def __init__(self, directory, url_root, compress=True, compress_min_size=256,
+                 max_age=None, use_x_sendfile=False, check_interval=1):
+        """
+        :param unicode directory: Where the files are written.  It
+            is created if it does not exist.
+        :param unicode url_root: The url the dispatcher is served from
+            without its url_prefix.  It is used to build the links in
+            the rendered bodies.
+        :param bool compress: Whether a gzip variant of each file is written.
+        :param int compress_min_size: Bodies smaller than this number
+            of bytes are not compressed.
+        :param int max_age: The number of seconds clients may cache
+            the files.  They must revalidate them with the ``ETag``
+            by default.
+        :param bool use_x_sendfile: Whether to let the web server send
+            the file with the ``X-Sendfile`` header.
+        :param float check_interval: The minimum number of seconds
+            between checks of the manifest for changes by other processes.
+        """
+        self.directory = directory
+        self.url_root = url_root
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self.max_age = max_age
+        self.use_x_sendfile = use_x_sendfile
+        self.check_interval = check_interval
+        self.dispatcher = None
+        self._files = {}
+        self._manifest_mtime = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._counts = dict(hits=0, misses=0)
+
+    def attach(self, dispatcher, name='prerender', command='prerender'):
+        """
+        Serves the rendered files for the dispatcher's routes and
+        adds the command that renders them to the dispatcher's app.
+
+        :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The dispatcher.
+        :param unicode name: The name of the metrics in ``dispatcher.stats``
+        :param unicode command: The name of the command on the app's
+            ``cli``.  No command is added if it is None.
+        """
+        self.dispatcher = dispatcher
+        dispatcher.static_renderer = self
+        dispatcher.stats_sources[name] = self
+        if command is not None and getattr(dispatcher.app, 'cli', None) is not None:
+            self._add_command(dispatcher.app.cli, command)
+        self.load()
+
+    def render(self, resources=None):
+        """
+        Renders the GET routes.  Only the files whose body changed
+        are written.  The files of the routes that can no longer be
+        rendered (e.g. because they now return a 404) are removed.
+
+        :param list resources: Only the routes of these ResourceBase
+            subclasses are rendered.  All of the routes by default.
+        :return: The number of files that were written, unchanged and removed.
+        :rtype: dict
+        """
+        dispatcher = self.dispatcher
+        selected = set(resources) if resources is not None else None
+        counts = dict(written=0, unchanged=0, removed=0)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with self._lock:
+            self._load()
+            files = dict(self._files)
+            rendered = set()
+            dispatcher._local.url_root = self.url_root
+            try:
+                for endpoint, route, methods, options, view in list(dispatcher.routes):
+                    resource_class = dispatcher.resource_for_endpoint.get(endpoint)
+                    if resource_class is None or 'GET' not in (method.upper() for method in methods):
+                        continue
+                    if selected is not None and resource_class not in selected:
+                        continue
+                    for url_params in _prerender_url_params(route, resource_class):
+                        for adapter_class in _adapter_classes(dispatcher):
+                            rendered_file = self._render_file(endpoint, url_params, adapter_class,
+                                                              resource_class, files.get)
+                            if rendered_file is None:
+                                continue
+                            if rendered_file is files.get(rendered_file.key):
+                                counts['unchanged'] += 1
+                            else:
+                                counts['written'] += 1
+                            files[rendered_file.key] = rendered_file
+                            rendered.add(rendered_file.key)
+            finally:
+                dispatcher._local.url_root = None
+            selected_names = set(klass.__name__ for klass in selected) if selected is not None else None
+            for key, rendered_file in list(files.items()):
+                if key in rendered:
+                    continue
+                if selected_names is None or rendered_file.resource in selected_names:
+                    del files[key]
+                    self._remove_files(rendered_file)
+                    counts['removed'] += 1
+            self._save(files)
+        return counts
+
+    def load(self):
+        """
+        Loads the manifest from the directory if it changed.
+        """
+        with self._lock:
+            self._load()
+
+    def lookup(self, endpoint, urlparams, accepted_mimetypes, environ):
+        """
+        :param unicode endpoint: The endpoint that matched the request.
+        :param dict urlparams: The url params of the request.
+        :param list accepted_mimetypes: The mimetypes accepted by the client.
+        :param dict environ: The WSGI environ of the request.
+        :return: The rendered file for the request or None if
+            it should be dispatched.
+        :rtype: RenderedFile
+        """
+        if environ.get('QUERY_STRING') or getattr(self.dispatcher._local, 'mount', None) is not None:
+            return None
+        if default_timer() >= self._next_check and self._lock.acquire(False):
+            try:
+                self._load()
+            finally:
+                self._lock.release()
+        adapter_class = self.dispatcher.get_adapter_for_type(accepted_mimetypes)
+        rendered_file = self._files.get(_file_key(endpoint, urlparams, adapter_class.formats[0]))
+        self._count('hits' if rendered_file is not None else 'misses')
+        return rendered_file
+
+    def send(self, rendered_file, environ):
+        """
+        :param RenderedFile rendered_file: The file from ``lookup``.
+        :param dict environ: The WSGI environ of the request.
+        :return: The response sending the file or the gzip variant
+            if the client accepts it.  None if the file was removed.
+        :rtype: werkzeug.wrappers.Response
+        """
+        filename, etag = rendered_file.filename, rendered_file.etag
+        compressed = (rendered_file.gzip_filename is not None and
+                      parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING')).quality('gzip') > 0)
+        if compressed:
+            filename, etag = rendered_file.gzip_filename, '{0}-gzip'.format(etag)
+        sender = send_file if send_file is not None else _send_file
+        try:
+            response = sender(os.path.join(self.directory, filename), environ,
+                              mimetype=rendered_file.content_type, etag=etag,
+                              max_age=self.max_age, use_x_sendfile=self.use_x_sendfile)
+        except (IOError, OSError):
+            _logger.warning('The rendered file %s is missing', filename)
+            return None
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        return response
+
+    def stats(self):
+        """
+        :return: The number of rendered files and the number of
+            requests answered with one or dispatched.
+        :rtype: dict
+        """
+        with self._counts_lock:
+            stats = dict(self._counts)
+        stats['files'] = len(self._files)
+        return stats
+
+    def _count(self, key):
+        with self._counts_lock:
+            self._counts[key] += 1
+
+    def _render_file(self, endpoint, url_params, adapter_class, resource_class, get_existing):
+        mimetype = adapter_class.formats[0]
+
+        def get_arguments():
+            return {}, {}, _CaseInsentiveDict()
+
+        try:
+            response = _dispatch_request(self.dispatcher, self.dispatcher.function_for_endpoint[endpoint],
+                                         endpoint, 'GET', dict(url_params), [mimetype],
+                                         get_arguments, StoredResponse.from_adapter)
+        except Exception:
+            _logger.exception('Unable to render %s with %s', endpoint, url_params)
+            return None
+        if not isinstance(response, StoredResponse) or response.status_code != 200:
+            return None
+        body = response.formatted_body
+        if isinstance(body, six.text_type):
+            body = body.encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        key = _file_key(endpoint, url_params, mimetype)
+        existing = get_existing(key)
+        if existing is not None and existing.etag == etag:
+            return existing
+        filename = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+        self._write(filename, body)
+        gzip_filename = None
+        if self.compress and len(body) >= self.compress_min_size:
+            compressed = _gzip(body)
+            if len(compressed) < len(body):
+                gzip_filename = '{0}.gz'.format(filename)
+                self._write(gzip_filename, compressed)
+        return RenderedFile(endpoint, _text_params(url_params), mimetype,
+                            response.extra_headers.get('Content-Type', mimetype), filename, etag,
+                            gzip_filename=gzip_filename,
+                            resource=resource_class.__name__ if resource_class is not None else None)
+
+    def _write(self, filename, data):
+        """
+        Writes to a temporary file and renames it so that
+        requests never see a partially written file.
+        """
+        fd, path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                temp.write(data)
+            os.rename(path, os.path.join(self.directory, filename))
+        except Exception:
+            os.remove(path)
+            raise
+
+    def _remove_files(self, rendered_file):
+        for filename in (rendered_file.filename, rendered_file.gzip_filename):
+            if filename is None:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+
+    def _load(self):
+        self._next_check = default_timer() + self.check_interval
+        path = os.path.join(self.directory, MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        with open(path, 'rb') as manifest:
+            entries = json.loads(manifest.read().decode('utf-8'))
+        files = {}
+        for entry in entries:
+            rendered_file = RenderedFile(**dict((str(key), value) for key, value in six.iteritems(entry)))
+            files[rendered_file.key] = rendered_file
+        self._files = files
+        self._manifest_mtime = mtime
+
+    def _save(self, files):
+        entries = [rendered_file.to_dict() for rendered_file in six.itervalues(files)]
+        self._write(MANIFEST, json.dumps(entries, sort_keys=True).encode('utf-8'))
+        self._files = files
+        self._manifest_mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime
+
+    def _add_command(self, cli, name):
+        import click
+
+        @cli.command(name)
+        @click.option('--resource', 'resource_names', multiple=True,
+                      help='The name of a resource class to render.  All of them by default.')
+        def prerender(resource_names):
+            """Renders the GET routes into files."""
+            resources = None
+            if resource_names:
+                classes = dict((klass.__name__, klass) for klass in
+                               six.itervalues(self.dispatcher.resource_for_endpoint) if klass is not None)
+                missing = [name for name in resource_names if name not in classes]
+                if missing:
+                    raise click.BadParameter('Unknown resources: {0}'.format(', '.join(missing)))
+                resources = [classes[name] for name in resource_names]
+            counts = self.render(resources)
+            click.echo('{written} written, {unchanged} unchanged, {removed} removed'.format(**counts))
+
+
+def _adapter_classes(dispatcher):
+    adapter_classes = []
+    for adapter_class in [dispatcher.default_adapter] + list(dispatcher.adapter_formats.values()):
+        if adapter_class is not None and adapter_class not in adapter_classes:
+            adapter_classes.append(adapter_class)
+    return adapter_classes
+
+
+def _prerender_url_params(route, resource_class):
+    if '<' not in route:
+        return [{}]
+    prerender_url_params = getattr(resource_class, 'prerender_url_params', None)
+    if prerender_url_params is None:
+        return []
+    return prerender_url_params()
+
+
+def _text_params(url_params):
+    return dict((key, six.text_type(value)) for key, value in six.iteritems(url_params))
+
+
+def _file_key(endpoint, url_params, mimetype):
+    return endpoint, tuple(sorted(six.iteritems(_text_params(url_params)))), mimetype
+
+
+def _gzip(data):
+    buf = BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as compressed:
+        compressed.write(data)
+    return buf.getvalue()
+
+
+def _send_file(path, environ, mimetype=None, etag=None, max_age=None, use_x_sendfile=False):
+    """
+    Sends the file like ``werkzeug.utils.send_file`` which is
+    not available before Werkzeug 2.0.
+    """
+    stat = os.stat(path)
+    headers = {}
+    if use_x_sendfile:
+        headers['X-Sendfile'] = path
+        data = None
+    else:
+        data = wrap_file(environ, open(path, 'rb'))
+    response = Response(data, mimetype=mimetype, headers=headers, direct_passthrough=True)
+    response.content_length = stat.st_size
+    response.last_modified = int(stat.st_mtime)
+    response.cache_control.no_cache = True
+    if max_age is not None:
+        if max_age > 0:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.expires = int(time.time() + max_age)
+    if etag is not None:
+        response.set_etag(etag)
+    response = response.make_conditional(environ)
+    if response.status_code == 304:
+        response.headers.pop('X-Sendfile', None)
+    return response
@@ -0,0 +1,309 @@
+"""
+A low overhead sampling profiler for requests that are
+handled by a FlaskDispatcher.  Rather than tracing every
+function call (like cProfile) a background thread periodically
+looks at the stack of the threads currently handling requests.
+Only requests that are slow or that have been selected by the
+sample rate are kept.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import deque
+from timeit import default_timer
+
+import random
+import sys
+import threading
+import time
+
+import six
+
+TRUNCATED_FRAME = '...'
+
+
+class StageTimer(object):
+    """
+    Records how long each stage of a request took.
+    Calling ``mark`` closes the current stage and
+    starts the next one.
+    """
+
+    def __init__(self):
+        self.started = default_timer()
+        self._last = self.started
+        self.stages = []
+
+    def mark(self, name):
+        """
+        Records the time since the previous mark (or since the
+        timer was created) under the name of the stage.
+
+        :param unicode name: The name of the stage that just finished.
+        """
+        now = default_timer()
+        self.stages.append((name, now - self._last))
+        self._last = now
+
+    @property
+    def elapsed(self):
+        """
+        :return: The total number of seconds since the timer was created.
+        :rtype: float
+        """
+        return default_timer() - self.started
+
+
+class ProfileReport(object):
+    """
+    A captured profile for a single request.  It holds the stage
+    breakdown and the stack samples taken while the request was
+    being handled.
+    """
+
+    def __init__(self, endpoint, duration, stages, samples, sampled=False):
+        """
+        :param unicode endpoint: The endpoint that handled the request.
+        :param float duration: The total time in seconds.
+        :param list stages: A list of (stage name, seconds) tuples.
+        :param dict samples: A dictionary of stack tuples (root first)
+            to the number of times the stack was seen.
+        :param bool sampled: Whether the report was kept because it
+            was selected by the sample rate instead of the threshold.
+        """
+        self.endpoint = endpoint
+        self.duration = duration
+        self.stages = stages
+        self.samples = samples
+        self.sampled = sampled
+        self.created = time.time()
+
+    def collapsed(self):
+        """
+        Formats the stack samples in the collapsed stack format
+        (``frame;frame;frame count``) used by flame graph tools.
+
+        :return: A list of the collapsed stack lines
+        :rtype: list
+        """
+        return ['{0} {1}'.format(';'.join(stack), count)
+                for stack, count in six.iteritems(self.samples)]
+
+    def to_dict(self):
+        """
+        :return: A json serializable summary of the report.
+        :rtype: dict
+        """
+        return dict(endpoint=self.endpoint, duration=self.duration,
+                    stages=[dict(name=name, duration=duration) for name, duration in self.stages],
+                    samples=sum(six.itervalues(self.samples)), sampled=self.sampled,
+                    created=self.created)
+
+
+class _ActiveRequest(object):
+    """
+    The bookkeeping for a request that is currently
+    being profiled.
+    """
+
+    def __init__(self, endpoint, thread_id, sampled):
+        self.endpoint = endpoint
+        self.thread_id = thread_id
+        self.sampled = sampled
+        self.timer = StageTimer()
+        self.samples = {}
+
+    def mark(self, name):
+        self.timer.mark(name)
+
+
+class SamplingProfiler(object):
+    """
+    Keeps the last ``max_reports`` slow (or sampled) request profiles
+    for every endpoint.  Pass an instance to the FlaskDispatcher
+    to enable it.
+
+    .. code-block:: python
+
+        profiler = SamplingProfiler(threshold=0.25, sample_rate=0.01)
+        dispatcher = FlaskDispatcher(app, profiler=profiler)
+        profiler.register_routes(admin_blueprint)
+    """
+
+    def __init__(self, threshold=0.5, sample_rate=0.0, interval=0.005,
+                 max_reports=10, max_depth=64):
+        """
+        :param float threshold: Requests that take at least this many
+            seconds will always be kept.
+        :param float sample_rate: The fraction (0 to 1) of the requests
+            that will be kept regardless of how long they took.
+        :param float interval: The number of seconds between stack samples.
+        :param int max_reports: The number of reports to keep per endpoint.
+            Older reports are discarded.
+        :param int max_depth: The maximum number of frames to keep
+            for each stack sample.  Deeper stacks keep the frames nearest
+            the sampled call and start with a ``...`` frame so they are
+            still rooted the same way in a flame graph.
+        """
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_reports = max_reports
+        self.max_depth = max_depth
+        self.reports = {}
+        self.request_counts = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._running = False
+
+    def start(self, endpoint):
+        """
+        Starts profiling the request for the endpoint on
+        the current thread.
+
+        :param unicode endpoint: The name of the endpoint.
+        :return: The active request that should be passed to ``finish``.
+        :rtype: _ActiveRequest
+        """
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        active = _ActiveRequest(endpoint, threading.current_thread().ident, sampled)
+        with self._lock:
+            self._active[active.thread_id] = active
+        if not self._running:
+            self._start_sampler()
+        return active
+
+    def finish(self, active):
+        """
+        Stops profiling the request and keeps a report of
+        it if it was slow enough or was sampled.
+
+        :param _ActiveRequest active: The object returned by ``start``
+        :return: The report if one was kept otherwise None
+        :rtype: ProfileReport
+        """
+        duration = active.timer.elapsed
+        with self._lock:
+            self._active.pop(active.thread_id, None)
+            self.request_counts[active.endpoint] = self.request_counts.get(active.endpoint, 0) + 1
+            if duration < self.threshold and not active.sampled:
+                return None
+            report = ProfileReport(active.endpoint, duration, active.timer.stages,
+                                   active.samples, sampled=active.sampled)
+            if active.endpoint not in self.reports:
+                self.reports[active.endpoint] = deque(maxlen=self.max_reports)
+            self.reports[active.endpoint].append(report)
+        return report
+
+    def get_reports(self, endpoint=None):
+        """
+        :param unicode endpoint: If provided, only the reports for
+            this endpoint are returned.
+        :return: A list of the kept reports, oldest first.
+        :rtype: list
+        """
+        with self._lock:
+            if endpoint is not None:
+                return list(self.reports.get(endpoint, ()))
+            return [report for reports in six.itervalues(self.reports) for report in reports]
+
+    def collapsed(self, endpoint=None):
+        """
+        Merges the stack samples of the kept reports into
+        collapsed stacks suitable for a flame graph.
+
+        :param unicode endpoint: Restrict to a single endpoint.
+        :return: The collapsed stacks separated by new lines.
+        :rtype: unicode
+        """
+        merged = {}
+        for report in self.get_reports(endpoint=endpoint):
+            for stack, count in six.iteritems(report.samples):
+                merged[stack] = merged.get(stack, 0) + count
+        return '\n'.join('{0} {1}'.format(';'.join(stack), count)
+                         for stack, count in sorted(six.iteritems(merged)))
+
+    def stats(self):
+        """
+        :return: A dictionary of the endpoint names to the number of
+            requests profiled and the number of reports kept.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((endpoint, dict(requests=count, reports=len(self.reports.get(endpoint, ()))))
+                        for endpoint, count in six.iteritems(self.request_counts))
+
+    def register_routes(self, app, url_prefix='/_profiles'):
+        """
+        Registers the admin routes on the app or blueprint.
+        ``<url_prefix>/`` returns a json summary of the kept
+        reports and ``<url_prefix>/<endpoint>/collapsed`` returns the
+        collapsed stacks for an endpoint as plain text.  These
+        routes should only be exposed on a protected app or blueprint.
+
+        :param flask.Flask|flask.Blueprint app: Where to register the routes.
+        :param unicode url_prefix: The prefix for the routes.
+        """
+        from flask import jsonify, Response
+
+        def profile_reports():
+            return jsonify(dict(reports=[report.to_dict() for report in self.get_reports()]))
+
+        def profile_collapsed(endpoint):
+            return Response(self.collapsed(endpoint=endpoint), content_type='text/plain')
+
+        url_prefix = url_prefix.rstrip('/')
+        app.add_url_rule('{0}/'.format(url_prefix), endpoint='ripozo_profile_reports',
+                         view_func=profile_reports)
+        app.add_url_rule('{0}/<endpoint>/collapsed'.format(url_prefix),
+                         endpoint='ripozo_profile_collapsed', view_func=profile_collapsed)
+
+    def stop(self):
+        """
+        Stops the background sampling thread.  It will be
+        restarted the next time a request is profiled.
+        """
+        self._running = False
+        sampler = self._sampler
+        if sampler is not None:
+            sampler.join()
+        self._sampler = None
+
+    def _start_sampler(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._sampler = threading.Thread(target=self._sample_loop,
+                                             name='flask-ripozo-profiler')
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while self._running:
+            time.sleep(self.interval)
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for active in six.itervalues(self._active):
+                    frame = frames.get(active.thread_id)
+                    if frame is None:
+                        continue
+                    stack = self._get_stack(frame)
+                    active.samples[stack] = active.samples.get(stack, 0) + 1
+            del frames
+
+    def _get_stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append('{0}:{1}'.format(code.co_filename, code.co_name))
+            frame = frame.f_back
+        if frame is not None:
+            stack[-1] = TRUNCATED_FRAME
+        stack.reverse()
+        return tuple(stack)
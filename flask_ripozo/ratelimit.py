@@ -0,0 +1,288 @@
+"""
+Throttles clients with token buckets and sheds load when requests
+slow down.  The limits are checked before the before request hooks
+and the argument parsing so rejected requests are cheap.
+
+.. code-block:: python
+
+    class Search(ResourceBase):
+        @apimethod(route='/search', methods=['GET'], rate_limit=(1, 5))
+        def search(cls, request):
+            ...
+
+    dispatcher = FlaskDispatcher(app)
+    dispatcher.register_resources(Search)
+    RateLimiter(rate=20, burst=40, client_header='X-Api-Key', max_latency=2).attach(dispatcher)
+
+Every client gets a bucket of ``burst`` tokens that refills at ``rate``
+tokens per second.  Routes with a ``rate_limit`` option of
+``(rate, burst)`` also get a bucket per client for that endpoint.
+A request that finds a bucket empty is answered with a 429 and a
+``Retry-After`` header by the dispatcher's ``error_handler``.  No
+tokens are taken from any of the buckets of a rejected request.
+Rejected requests do not run the error hooks and are not logged as
+errors by the access logger; they are counted in ``dispatcher.stats``.
+
+When ``max_latency`` is set, requests are rejected with a 503 while the
+latency of recent requests or the age of the requests in flight is
+above it.  The more it is exceeded the more requests are rejected,
+but some are always let through to measure the latency.
+
+The buckets are kept in memory by default so the limits apply to
+each process separately.  A store shared between processes needs a
+``consume_many(limits)`` method with the same semantics as
+``InMemoryTokenBucketStore.consume_many``.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from timeit import default_timer
+
+from ripozo.exceptions import RestException
+
+import math
+import random
+import threading
+
+
+class RateLimitExceeded(RestException):
+    """
+    Raised when a client has used up its tokens.  The
+    ``headers`` are added to the error response.
+    """
+    def __init__(self, message, retry_after, status_code=429, *args, **kwargs):
+        super(RateLimitExceeded, self).__init__(message, status_code=status_code, *args, **kwargs)
+        self.retry_after = retry_after
+        self.headers = {'Retry-After': _retry_after_header(retry_after)}
+
+
+class LoadShedException(RestException):
+    """
+    Raised when a request is rejected because the
+    requests are taking longer than the maximum latency.
+    """
+    def __init__(self, message, retry_after=1, status_code=503, *args, **kwargs):
+        super(LoadShedException, self).__init__(message, status_code=status_code, *args, **kwargs)
+        self.retry_after = retry_after
+        self.headers = {'Retry-After': _retry_after_header(retry_after)}
+
+
+class InMemoryTokenBucketStore(object):
+    """
+    Keeps the token buckets in memory.  At most ``max_keys``
+    buckets are kept, removing the least recently used first.
+    """
+
+    def __init__(self, max_keys=100000):
+        """
+        :param int max_keys: The maximum number of buckets.
+        """
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, tokens=1):
+        """
+        Atomically refills the bucket for the time since it was
+        last used and takes the tokens from it if it has enough.
+        A new bucket starts full.
+
+        :param unicode key: The bucket.
+        :param float rate: The number of tokens added per second.
+            It must be positive.
+        :param float burst: The maximum number of tokens in the bucket.
+        :param float tokens: The number of tokens to take.
+        :return: 0 if the tokens were taken, otherwise the number
+            of seconds until the bucket has enough tokens.
+        :rtype: float
+        """
+        return self.consume_many([(key, rate, burst)], tokens=tokens)
+
+    def consume_many(self, limits, tokens=1):
+        """
+        Like ``consume`` for several buckets at once.  The tokens
+        are only taken if every bucket has enough of them.
+
+        :param list limits: The ``(key, rate, burst)`` of the buckets.
+        :param float tokens: The number of tokens to take from each.
+        :return: 0 if the tokens were taken, otherwise the number of
+            seconds until every bucket has enough tokens.
+        :rtype: float
+        """
+        now = default_timer()
+        with self._lock:
+            available = []
+            wait = 0
+            for key, rate, burst in limits:
+                bucket = self._buckets.pop(key, None)
+                if bucket is None:
+                    tokens_left = burst
+                else:
+                    tokens_left = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                if tokens_left < tokens:
+                    wait = max(wait, (tokens - tokens_left) / rate)
+                available.append((key, tokens_left))
+            for key, tokens_left in available:
+                self._buckets[key] = (tokens_left - tokens if not wait else tokens_left, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter(object):
+    """
+    Limits the requests of every client and sheds load
+    for a dispatcher.
+    """
+
+    def __init__(self, rate=None, burst=None, store=None, client_header=None, key_func=None,
+                 max_latency=None, latency_decay=0.1, max_shed_ratio=0.9):
+        """
+        :param float rate: The number of requests per second each
+            client may make to all of the endpoints.  There is no
+            limit per client if it is None.
+        :param float burst: The number of requests a client may make
+            at once.  Defaults to the rate.
+        :param InMemoryTokenBucketStore store: Where the buckets are kept.
+            An ``InMemoryTokenBucketStore`` by default.
+        :param unicode client_header: The header that identifies the
+            client (e.g. an api key).  Clients without it are identified
+            by their address.
+        :param function key_func: Takes the WSGI environ and returns
+            the client's key.  It replaces the ``client_header``.
+        :param float max_latency: The number of seconds after which
+            requests are shed.  Load is not shed if it is None.
+        :param float latency_decay: The weight of each finished request
+            in the moving average of the latency.
+        :param float max_shed_ratio: The largest fraction of the
+            requests that are shed.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.store = store if store is not None else InMemoryTokenBucketStore()
+        self.client_header = client_header
+        self.key_func = key_func or self.client_key
+        self.max_latency = max_latency
+        self.latency_decay = latency_decay
+        self.max_shed_ratio = max_shed_ratio
+        self.dispatcher = None
+        self.random = random.random
+        self._lock = threading.Lock()
+        self._latency = 0
+        self._in_flight = 0
+        self._in_flight_started = 0
+        self._counts = dict(allowed=0, limited=0, shed=0)
+
+    def attach(self, dispatcher, name='rate_limit'):
+        """
+        Limits the requests handled by the dispatcher.
+
+        :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The dispatcher.
+        :param unicode name: The name of the metrics in ``dispatcher.stats``
+        """
+        self.dispatcher = dispatcher
+        dispatcher.rate_limiter = self
+        dispatcher.stats_sources[name] = self
+
+    def client_key(self, environ):
+        """
+        :param dict environ: The WSGI environ of the request.
+        :return: The value of the ``client_header`` or the
+            client's address.
+        :rtype: unicode
+        """
+        if self.client_header:
+            value = environ.get('HTTP_{0}'.format(self.client_header.upper().replace('-', '_')))
+            if value:
+                return 'key:{0}'.format(value)
+        return 'addr:{0}'.format(environ.get('REMOTE_ADDR'))
+
+    def admit(self, endpoint, environ):
+        """
+        Checks the load and the client's buckets.
+
+        :param unicode endpoint: The endpoint of the request.
+        :param dict environ: The WSGI environ of the request.
+        :return: The time the request was admitted.  It must be
+            passed to ``finish`` when the request is done.
+        :rtype: float
+        :raises: LoadShedException
+        :raises: RateLimitExceeded
+        """
+        now = default_timer()
+        if self.max_latency is not None:
+            shed_ratio = self._shed_ratio(now)
+            if shed_ratio > 0 and self.random() < shed_ratio:
+                self._count('shed')
+                raise LoadShedException('The server is overloaded', retry_after=self.max_latency)
+        client = self.key_func(environ)
+        limits = []
+        route_limit = self.dispatcher.route_rate_limits.get(endpoint) if self.dispatcher else None
+        if route_limit is not None:
+            rate, burst = route_limit
+            limits.append(('{0}:{1}'.format(endpoint, client), rate, burst))
+        if self.rate is not None:
+            limits.append((client, self.rate, self.burst))
+        wait = self.store.consume_many(limits) if limits else 0
+        if wait > 0:
+            self._count('limited')
+            raise RateLimitExceeded('Too many requests', retry_after=wait)
+        with self._lock:
+            self._counts['allowed'] += 1
+            self._in_flight += 1
+            self._in_flight_started += now
+        return now
+
+    def finish(self, admitted):
+        """
+        Records the latency of an admitted request.
+
+        :param float admitted: The time returned by ``admit``.
+        """
+        latency = default_timer() - admitted
+        with self._lock:
+            self._in_flight -= 1
+            self._in_flight_started -= admitted
+            if not self._in_flight:
+                self._in_flight_started = 0
+            self._latency += (latency - self._latency) * self.latency_decay
+
+    def stats(self):
+        """
+        :return: The number of requests allowed, limited and shed,
+            the number in flight and the moving average latency.
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._counts)
+            stats['in_flight'] = self._in_flight
+            stats['latency'] = self._latency
+        return stats
+
+    def _shed_ratio(self, now):
+        """
+        :return: The fraction of the requests to shed from how much
+            the latency exceeds the ``max_latency``.
+        :rtype: float
+        """
+        with self._lock:
+            latency = self._latency
+            if self._in_flight:
+                latency = max(latency, now - self._in_flight_started / self._in_flight)
+        if latency <= self.max_latency:
+            return 0
+        return min(self.max_shed_ratio, (latency - self.max_latency) / self.max_latency)
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+
+def _retry_after_header(seconds):
+    return '{0}'.format(max(1, int(math.ceil(seconds))))
@@ -0,0 +1,260 @@
+"""
+Request scoped database sessions for managers.  The
+``PooledSessionHandler`` checks sessions out of a bounded pool,
+keeps one per request, commits or rolls it back at the end of
+the request and returns it to the pool.  It exposes how long
+requests waited for a session and how long sessions were held.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import deque
+from timeit import default_timer
+
+from ripozo.exceptions import RestException
+
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutException(RestException):
+    """
+    Raised when a session could not be checked out
+    of the pool before the timeout.
+    """
+    def __init__(self, message, status_code=503, *args, **kwargs):
+        super(PoolTimeoutException, self).__init__(message, status_code=status_code, *args, **kwargs)
+
+
+class _TimingStats(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        return dict(count=self.count, max=self.max,
+                    mean=self.total / self.count if self.count else 0.0)
+
+
+class PooledSessionHandler(object):
+    """
+    A session handler with the ``get_session``/``handle_session``
+    interface used by ripozo-sqlalchemy managers.  Attach it to a
+    dispatcher so that the session used during a request is
+    committed after a successful dispatch, rolled back on errors,
+    and returned to the pool either way.
+
+    .. code-block:: python
+
+        session_handler = PooledSessionHandler(sessionmaker(bind=engine), pool_size=10)
+        session_handler.attach(dispatcher)
+
+        class TaskManager(AlchemyManager):
+            ...
+
+        TaskResource.manager = TaskManager(session_handler)
+
+    Sessions are checked out lazily the first time a manager
+    asks for one during a request.  Endpoints that do not touch
+    the database never wait on the pool.
+    """
+
+    def __init__(self, session_factory, pool_size=5, timeout=30, close_on_release=False):
+        """
+        :param function session_factory: Takes no arguments and returns
+            a new session.  The session must have ``commit`` and
+            ``rollback`` methods (and ``close`` if close_on_release is True).
+            A SQLAlchemy ``sessionmaker`` or a function returning a DB-API
+            connection both work.
+        :param int pool_size: The maximum number of sessions checked out
+            at once.
+        :param float timeout: The number of seconds to wait for a session
+            before raising a ``PoolTimeoutException`` (a 503).
+        :param bool close_on_release: Whether to close sessions when
+            they are returned instead of keeping them idle for
+            the next request.
+        """
+        self.session_factory = session_factory
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.close_on_release = close_on_release
+        self._idle = deque()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._in_use = 0
+        self._max_in_use = 0
+        self._timeouts = 0
+        self._wait = _TimingStats()
+        self._checkout = _TimingStats()
+
+    def attach(self, dispatcher, name='sessions', job_runner=None):
+        """
+        Registers the request lifecycle hooks and the pool
+        metrics on the dispatcher.  The same hooks are registered
+        as the job hooks of the job runner so every background job
+        gets its own session scope.
+
+        :param flask_ripozo.dispatcher.FlaskDispatcher dispatcher: The
+            dispatcher whose requests should be scoped.
+        :param unicode name: The name of the metrics in ``dispatcher.stats``
+        :param flask_ripozo.jobs.JobRunner job_runner: The runner whose
+            jobs should be scoped.  Defaults to the runner attached
+            to the dispatcher if there is one.
+        """
+        dispatcher.before_request(self.begin_request)
+        dispatcher.after_dispatch(self.commit_request)
+        dispatcher.on_error(self.rollback_request)
+        dispatcher.stats_sources[name] = self
+        if job_runner is None:
+            job_runner = dispatcher.job_runner
+        if job_runner is not None:
+            job_runner.before_job(self.begin_request)
+            job_runner.after_job(self.commit_request)
+            job_runner.on_job_error(self.rollback_request)
+
+    def get_session(self):
+        """
+        :return: The session for the current request.  It is checked
+            out of the pool the first time this is called in a request.
+            Outside of a request a session is checked out and must be
+            returned with ``handle_session``.
+        """
+        if getattr(self._local, 'in_request', False):
+            session = getattr(self._local, 'session', None)
+            if session is None:
+                session = self._local.session = self._checkout_session()
+            return session
+        return self._checkout_session()
+
+    def handle_session(self, session, exc=None):
+        """
+        Called by managers after they used the session.  During a
+        request the session stays checked out until the request
+        finishes.  Outside of a request the session is committed (or
+        rolled back if there was an exception) and returned.
+
+        :param session: The session that was used.
+        :param Exception exc: The exception raised while using it.
+        """
+        if getattr(self._local, 'in_request', False) and session is getattr(self._local, 'session', None):
+            if exc is not None:
+                session.rollback()
+            return
+        self._release_session(session, commit=exc is None)
+
+    def begin_request(self, endpoint):
+        """
+        The before request hook.  Starts a request scope.
+        """
+        self._local.in_request = True
+        self._local.session = None
+
+    def commit_request(self, endpoint, request, adapter):
+        """
+        The after dispatch hook.  Commits and returns the
+        request's session if one was checked out.
+        """
+        self._end_request(commit=True)
+
+    def rollback_request(self, endpoint, exc):
+        """
+        The error hook.  Rolls back and returns the request's
+        session if one was checked out.
+        """
+        self._end_request(commit=False)
+
+    def stats(self):
+        """
+        :return: The pool size, the number of sessions in use,
+            the maximum in use at once, the number of checkout timeouts
+            and the count, mean and max seconds spent waiting for a
+            session and holding a session.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(pool_size=self.pool_size, in_use=self._in_use,
+                        max_in_use=self._max_in_use, timeouts=self._timeouts,
+                        wait=self._wait.to_dict(), checkout=self._checkout.to_dict())
+
+    def _end_request(self, commit):
+        session = getattr(self._local, 'session', None)
+        self._local.in_request = False
+        self._local.session = None
+        if session is not None:
+            self._release_session(session, commit=commit)
+
+    def _checkout_session(self):
+        start = default_timer()
+        with self._released:
+            while self._in_use >= self.pool_size:
+                remaining = None
+                if self.timeout is not None:
+                    remaining = self.timeout - (default_timer() - start)
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._wait.add(default_timer() - start)
+                        raise PoolTimeoutException('Timed out waiting for a database session')
+                self._released.wait(remaining)
+            self._wait.add(default_timer() - start)
+            self._in_use += 1
+            self._max_in_use = max(self._max_in_use, self._in_use)
+            session = self._idle.pop() if self._idle else None
+        if session is None:
+            try:
+                session = self.session_factory()
+            except Exception:
+                self._return_slot(None)
+                raise
+        self._checked_out_at(session, default_timer())
+        return session
+
+    def _return_slot(self, session, checked_out=None):
+        with self._released:
+            self._in_use -= 1
+            if checked_out is not None:
+                self._checkout.add(default_timer() - checked_out)
+            if session is not None:
+                self._idle.append(session)
+            self._released.notify()
+
+    def _checked_out_at(self, session, when):
+        if not hasattr(self._local, 'checkouts'):
+            self._local.checkouts = {}
+        self._local.checkouts[id(session)] = when
+
+    def _release_session(self, session, commit=True):
+        reusable = True
+        try:
+            if commit:
+                session.commit()
+            else:
+                session.rollback()
+        except Exception:
+            reusable = False
+            _logger.exception('Unable to finish the session')
+            try:
+                session.rollback()
+            except Exception:
+                pass
+            if commit:
+                raise
+        finally:
+            checked_out = getattr(self._local, 'checkouts', {}).pop(id(session), None)
+            if self.close_on_release:
+                reusable = False
+                try:
+                    session.close()
+                except Exception:
+                    _logger.exception('Unable to close the session')
+            self._return_slot(session if reusable else None, checked_out=checked_out)
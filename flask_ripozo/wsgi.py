@@ -0,0 +1,165 @@
+"""
+A WSGI application that dispatches directly to the routes
+registered on a FlaskDispatcher without going through Flask.
+It skips the request context, the ``flask.request`` proxy and
+the ``flask.Response`` object, which makes it useful for
+mounting the api next to the Flask app with werkzeug's
+``DispatcherMiddleware``.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from io import BytesIO
+
+from werkzeug.datastructures import EnvironHeaders
+from werkzeug.exceptions import HTTPException, InternalServerError
+from werkzeug.formparser import parse_form_data
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.wsgi import get_current_url, get_input_stream
+
+import json
+import logging
+
+import six
+from six.moves.urllib.parse import parse_qs
+
+from flask_ripozo.adapters import get_body_decoder
+from flask_ripozo.dispatcher import _CaseInsentiveDict, _dispatch_request, decode_body
+
+_logger = logging.getLogger(__name__)
+
+
+def get_environ_query_body_args(environ):
+    """
+    The WSGI equivalent of ``get_request_query_body_args``.
+    It gets the query args and body args as dictionaries of
+    lists and a case insensitive copy of the headers.  The body
+    is decoded with MessagePack or CBOR if it is the Content-Type,
+    otherwise it is loaded as JSON if possible or as form data.
+
+    :param dict environ: The WSGI environment.
+    :return: A tuple of the query args, body args, and headers
+    :rtype: (dict, dict, dict)
+    """
+    query_args = parse_qs(environ.get('QUERY_STRING', ''), keep_blank_values=True)
+    body = {}
+    data = get_input_stream(environ).read()
+    decoder = get_body_decoder(environ.get('CONTENT_TYPE', '').split(';')[0].strip())
+    if decoder is not None:
+        body = decode_body(decoder, data)
+    elif data:
+        try:
+            body = json.loads(data.decode('utf-8'))
+        except ValueError:
+            content_type = environ.get('CONTENT_TYPE', '')
+            if content_type.startswith('application/x-www-form-urlencoded'):
+                body = parse_qs(data.decode('utf-8'), keep_blank_values=True)
+            elif content_type.startswith('multipart/form-data'):
+                form_environ = dict(environ)
+                form_environ['wsgi.input'] = BytesIO(data)
+                body = parse_form_data(form_environ)[1].to_dict(flat=False)
+        if not isinstance(body, dict):
+            body = {}
+
+    headers = _CaseInsentiveDict()
+    for key, value in EnvironHeaders(environ):
+        headers[key] = value
+    return query_args, body, headers
+
+
+class WSGIDispatcherApp(object):
+    """
+    A WSGI callable for the routes on a FlaskDispatcher.
+    Get one from ``FlaskDispatcher.wsgi_app``.  The routes are
+    matched relative to where the application is mounted and
+    the dispatcher's ``url_prefix``.
+
+    .. code-block:: python
+
+        from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+        app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
+            '/api': dispatcher.wsgi_app()
+        })
+
+    The hooks that need the Flask request (e.g. a custom
+    ``argument_getter``) are not used by this application.
+    The ``error_handler`` is still called and its response is
+    served as a WSGI application.
+    """
+
+    def __init__(self, dispatcher, argument_getter=get_environ_query_body_args):
+        """
+        :param FlaskDispatcher dispatcher: The dispatcher whose
+            routes should be served.
+        :param function argument_getter: Takes the WSGI environ and
+            returns the query args, body args and headers.
+        """
+        self.dispatcher = dispatcher
+        self.argument_getter = argument_getter
+
+    def __call__(self, environ, start_response):
+        dispatcher = self.dispatcher
+        try:
+            endpoint, urlparams = dispatcher.url_map.bind_to_environ(environ).match()
+        except HTTPException as e:
+            return e(environ, start_response)
+        f = dispatcher.function_for_endpoint[endpoint]
+        accepted_mimetypes = dispatcher.accepted_mimetypes(environ.get('HTTP_ACCEPT'))
+
+        def get_arguments():
+            return self.argument_getter(environ)
+
+        dispatcher._local.url_root = get_current_url(environ, root_only=True)
+        try:
+            response = _dispatch_request(dispatcher, f, endpoint, environ['REQUEST_METHOD'], urlparams,
+                                         accepted_mimetypes, get_arguments, _make_wsgi_response,
+                                         environ=environ)
+        except Exception as e:
+            _logger.exception(e)
+            response = InternalServerError()
+        finally:
+            dispatcher._local.url_root = None
+        if isinstance(response, _WSGIResponse):
+            start_response(response.status, response.headers)
+            if environ['REQUEST_METHOD'] == 'HEAD':
+                return []
+            return [response.body]
+        return response(environ, start_response)
+
+
+class _WSGIResponse(object):
+    """
+    The status line, header list and encoded body
+    for a successful dispatch.
+    """
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def status_code(self):
+        return int(self.status.split(' ', 1)[0])
+
+    @property
+    def content_length(self):
+        return len(self.body)
+
+
+def _make_wsgi_response(adapter):
+    body = adapter.formatted_body
+    if body is None:
+        body = b''
+    elif isinstance(body, six.text_type):
+        body = body.encode('utf-8')
+    headers = [(str(key), str(value)) for key, value in six.iteritems(adapter.extra_headers)]
+    if adapter.formatted_body is not None and 'Content-Length' not in adapter.extra_headers:
+        headers.append((str('Content-Length'), str(len(body))))
+    status_code = adapter.status_code
+    status = str('{0} {1}'.format(status_code, HTTP_STATUS_CODES.get(status_code, 'UNKNOWN')))
+    return _WSGIResponse(status, headers, body)
@@ -3,4 +3,5 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from . import dispatcher
+from . import (access_log, adapters, arguments, deadlines, dispatcher, events, idempotency,
+               jobs, memory, metadata, prerender, profiler, ratelimit, sessions, wsgi)
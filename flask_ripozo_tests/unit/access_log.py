@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.access_log import AccessLogger
+from flask_ripozo.dispatcher import FlaskDispatcher
+
+from ripozo import apimethod, ResourceBase, adapters
+
+import threading
+import unittest2
+
+
+class TestAccessLogger(unittest2.TestCase):
+    def setUp(self):
+        class LoggedResource(ResourceBase):
+            resource_name = 'logged'
+            pks = ('id',)
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                if request.get('id') == 'broken':
+                    raise ValueError('broken')
+                return cls(properties=dict(id=request.get('id')))
+
+        self.records = []
+        self.access_logger = AccessLogger(sink=self.records.append)
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app, access_logger=self.access_logger)
+        self.dispatcher.register_resources(LoggedResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.access_logger.stop()
+
+    def test_access_record(self):
+        """
+        Tests the access record for a successful request.
+        """
+        response = self.client.get('/logged/1/')
+        self.access_logger.flush()
+        self.assertEqual(len(self.records), 1)
+        record = self.records[0]
+        self.assertEqual(record['type'], 'access')
+        self.assertEqual(record['endpoint'], 'LoggedResource__retrieve')
+        self.assertEqual(record['method'], 'GET')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['bytes'], len(response.data))
+        self.assertEqual(record['adapter'], 'BasicJSONAdapter')
+        self.assertEqual(set(record['stages']), set(['arguments', 'dispatch', 'response']))
+
+    def test_traceback_deduplication(self):
+        """
+        Tests that only the first traceback from the same
+        place is written within the window.
+        """
+        for i in range(3):
+            self.assertEqual(self.client.get('/logged/broken/').status_code, 500)
+        self.access_logger.flush()
+        errors = [record for record in self.records if record['type'] == 'error']
+        self.assertEqual(len(errors), 3)
+        self.assertIn('ValueError: broken', errors[0]['traceback'])
+        self.assertTrue(errors[1]['traceback_suppressed'])
+        self.assertNotIn('traceback', errors[2])
+        self.assertEqual(self.access_logger.stats()['suppressed_tracebacks'], 2)
+
+        self.access_logger.traceback_window = 0
+        self.client.get('/logged/broken/')
+        self.access_logger.flush()
+        self.assertEqual(self.records[-2]['repeated'], 2)
+
+    def test_sampling(self):
+        """
+        Tests that successful requests are sampled and
+        server errors are not.
+        """
+        self.access_logger.sample_rate = 0
+        self.client.get('/logged/1/')
+        self.client.get('/logged/broken/')
+        self.access_logger.flush()
+        self.assertEqual([record['type'] for record in self.records], ['error', 'access'])
+        self.assertEqual(self.access_logger.stats()['sampled_out'], 1)
+
+    def test_slow_sink_does_not_block(self):
+        """
+        Tests that records are dropped instead of blocking
+        when the sink falls behind.
+        """
+        release = threading.Event()
+        access_logger = AccessLogger(sink=lambda record: release.wait(5), max_queue=1)
+        self.dispatcher.access_logger = access_logger
+        for i in range(5):
+            self.assertEqual(self.client.get('/logged/1/').status_code, 200)
+        release.set()
+        access_logger.stop()
+        stats = access_logger.stats()
+        self.assertGreaterEqual(stats['dropped'], 3)
+        self.assertEqual(stats['written'] + stats['dropped'], 5)
+
+    def test_sink_errors(self):
+        def sink(record):
+            raise ValueError('sink')
+
+        self.access_logger.sink = sink
+        self.client.get('/logged/1/')
+        self.access_logger.flush()
+        self.assertEqual(self.access_logger.stats()['sink_errors'], 1)
@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo import adapters as binary_adapters
+from flask_ripozo.adapters import CBORAdapter, MessagePackAdapter, get_body_decoder
+from flask_ripozo.dispatcher import FlaskDispatcher
+
+from ripozo import apimethod, ResourceBase, adapters
+from ripozo.exceptions import NotFoundException
+
+import json
+import unittest2
+
+
+class TestBinaryAdapters(unittest2.TestCase):
+    def setUp(self):
+        class BinaryResource(ResourceBase):
+            resource_name = 'binary'
+            pks = ('id',)
+
+            @apimethod(methods=['GET', 'POST'])
+            def retrieve(cls, request):
+                if request.get('id') == 'missing':
+                    raise NotFoundException('missing')
+                return cls(properties=dict(id=request.get('id'), x=request.body_args.get('x')))
+
+        self.resource_class = BinaryResource
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(BinaryResource)
+        self.dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter,
+                                          *binary_adapters.available_binary_adapters())
+        self.client = self.app.test_client()
+
+    def assert_same_document(self, adapter_class, loads):
+        response = self.client.get('/binary/1/', headers={'Accept': adapter_class.formats[0]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, adapter_class.formats[0])
+        siren = self.client.get('/binary/1/', headers={'Accept': 'application/vnd.siren+json'})
+        self.assertEqual(loads(response.data), json.loads(siren.data.decode('utf8')))
+
+        response = self.client.get('/binary/missing/', headers={'Accept': adapter_class.formats[0]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(loads(response.data), dict(status=404, message='missing'))
+
+        response = self.client.post('/binary/1/', data=adapter_class.dumps(dict(x=1)),
+                                    content_type=adapter_class.formats[0],
+                                    headers={'Accept': adapter_class.formats[0]})
+        self.assertEqual(loads(response.data)['properties']['x'], 1)
+
+    @unittest2.skipIf(binary_adapters.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        """
+        Tests that MessagePack is negotiated for responses,
+        errors and request bodies.
+        """
+        self.assert_same_document(MessagePackAdapter, get_body_decoder('application/msgpack'))
+
+    @unittest2.skipIf(binary_adapters.cbor2 is None, 'cbor2 is not installed')
+    def test_cbor(self):
+        """
+        Tests that CBOR is negotiated for responses,
+        errors and request bodies.
+        """
+        self.assert_same_document(CBORAdapter, get_body_decoder('application/cbor'))
+
+    @unittest2.skipIf(binary_adapters.msgpack is None, 'msgpack is not installed')
+    def test_structure_adapter(self):
+        """
+        Tests the other document structures, including one
+        without a builder that goes through JSON.
+        """
+        resource = self.resource_class(properties=dict(id=1))
+        for structure in (adapters.HalAdapter, adapters.BasicJSONAdapter, adapters.JSONAPIAdapter):
+            class StructuredAdapter(MessagePackAdapter):
+                structure_adapter = structure
+
+            body = StructuredAdapter(resource, base_url='http://localhost/').formatted_body
+            expected = json.loads(structure(resource, base_url='http://localhost/').formatted_body)
+            self.assertEqual(get_body_decoder('application/x-msgpack')(body), expected)
+
+    def test_get_body_decoder_unknown(self):
+        """
+        Tests that no decoder is returned for other types.
+        """
+        self.assertIsNone(get_body_decoder('application/json'))
+        self.assertIsNone(get_body_decoder(None))
+
+    def test_bad_body(self):
+        """
+        Tests that a body that cannot be decoded is treated as empty.
+        """
+        response = self.client.post('/binary/1/', data=b'\xc1', content_type='application/msgpack',
+                                    headers={'Accept': 'application/vnd.siren+json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(json.loads(response.data.decode('utf8'))['properties']['x'])
+
+    def test_binary_adapter_abstract(self):
+        """
+        Tests that the base class can not be used without a codec.
+        """
+        self.assertRaises(TypeError, binary_adapters.BinaryAdapter, self.resource_class())
@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.arguments import CompiledArgumentParser, compile_argument_parser
+from flask_ripozo.dispatcher import FlaskDispatcher
+
+from ripozo import apimethod, ResourceBase, adapters, translate, fields
+from ripozo.exceptions import TranslationException, ValidationException
+from ripozo.resources.constants import input_categories
+
+import json
+import unittest2
+
+
+class TestCompiledArgumentParser(unittest2.TestCase):
+    def test_parse(self):
+        """
+        Tests that the fields are translated in the
+        locations where they were found.
+        """
+        parser = CompiledArgumentParser([fields.IntegerField('x'),
+                                         fields.BooleanField('y', arg_type=input_categories.BODY_ARGS),
+                                         fields.IntegerField('z')], validate=True)
+        url_params, query_args, body_args = dict(x='1'), dict(y='true'), dict(y='false', z=['3'])
+        parser.parse(url_params, query_args, body_args)
+        self.assertDictEqual(url_params, dict(x=1))
+        self.assertDictEqual(query_args, dict(y='true'))
+        self.assertDictEqual(body_args, dict(y=False, z=3))
+
+    def test_parse_invalid(self):
+        """
+        Tests that translation and validation errors are raised.
+        """
+        parser = CompiledArgumentParser([fields.IntegerField('x', required=True)], validate=True)
+        self.assertRaises(TranslationException, parser.parse, {}, dict(x='notint'), {})
+        self.assertRaises(ValidationException, parser.parse, {}, {}, {})
+
+        parser = CompiledArgumentParser([fields.IntegerField('x', required=True)],
+                                        validate=True, skip_required=True)
+        parser.parse({}, {}, {})
+
+    def test_compile_argument_parser(self):
+        """
+        Tests compiling a parser from the translate decorator.
+        """
+        class ArgumentResource(ResourceBase):
+            @apimethod()
+            @translate(fields=[fields.IntegerField('x')], skip_required=True, validate=True)
+            def translated(cls, request):
+                pass
+
+            @apimethod(route='other')
+            def untranslated(cls, request):
+                pass
+
+        parser = compile_argument_parser(ArgumentResource.translated, ArgumentResource)
+        self.assertTrue(parser.skip_required)
+        self.assertTrue(parser.validate)
+        self.assertEqual([step[0] for step in parser.steps], ['x'])
+        self.assertIsNone(compile_argument_parser(ArgumentResource.untranslated, ArgumentResource))
+
+    def test_dispatcher_compile_arguments(self):
+        """
+        Tests that the dispatcher coerces the arguments before
+        calling the apimethod and returns errors through the
+        error_handler.
+        """
+        class CompiledResource(ResourceBase):
+            resource_name = 'compiled'
+
+            @apimethod()
+            @translate(fields=[fields.IntegerField('x', required=True)], validate=True)
+            def compiled(cls, request):
+                return cls(properties=dict(x=request.get('x')))
+
+        app = Flask(__name__)
+        d = FlaskDispatcher(app, compile_arguments=True)
+        d.register_resources(CompiledResource)
+        d.register_adapters(adapters.BasicJSONAdapter)
+        self.assertIs(d.resource_for_endpoint['CompiledResource__compiled'], CompiledResource)
+        self.assertIn('CompiledResource__compiled', d.argument_parsers)
+
+        client = app.test_client()
+        response = client.get('/compiled/?x=2')
+        self.assertEqual(json.loads(response.data.decode('utf8'))['compiled']['x'], 2)
+        self.assertEqual(client.get('/compiled/?x=a').status_code, 400)
+        self.assertEqual(client.get('/compiled/').status_code, 400)
+
+    def test_dispatcher_formatted_request(self):
+        """
+        Tests that the arguments are parsed after the adapter
+        formatted the request and that ripozo's translate still runs.
+        """
+        translations = []
+
+        class CountingField(fields.IntegerField):
+            def translate(self, *args, **kwargs):
+                translations.append(args)
+                return super(CountingField, self).translate(*args, **kwargs)
+
+        class JSONAPIResource(ResourceBase):
+            resource_name = 'jsonapi'
+
+            @apimethod(methods=['POST'])
+            @translate(fields=[CountingField('x', required=True)], validate=True)
+            def create(cls, request):
+                return cls(properties=dict(x=request.get('x')))
+
+        app = Flask(__name__)
+        d = FlaskDispatcher(app, compile_arguments=True)
+        d.register_resources(JSONAPIResource)
+        d.register_adapters(adapters.JSONAPIAdapter)
+        body = json.dumps(dict(data=dict(attributes=dict(x='1'))))
+        client = app.test_client()
+        response = client.post('/jsonapi/', data=body, content_type='application/vnd.api+json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(translations), 2)
+        self.assertEqual(json.loads(response.data.decode('utf8'))['data']['attributes']['x'], 1)
+        body = json.dumps(dict(data=dict(attributes=dict(x='a'))))
+        self.assertEqual(client.post('/jsonapi/', data=body, content_type='application/vnd.api+json').status_code, 400)
@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.deadlines import check_deadline, current_deadline, Deadline, DeadlineExceeded, parse_timeout
+from flask_ripozo.dispatcher import FlaskDispatcher
+
+from ripozo import apimethod, ResourceBase, adapters
+
+import json
+import time
+import unittest2
+
+
+class TestDeadline(unittest2.TestCase):
+    def test_deadline(self):
+        deadline = Deadline(10)
+        self.assertFalse(deadline.expired)
+        self.assertGreater(deadline.remaining, 9)
+        deadline.check()
+        expired = Deadline(1, start=deadline.expires - 20)
+        self.assertTrue(expired.expired)
+        self.assertRaises(DeadlineExceeded, expired.check)
+
+    def test_parse_timeout(self):
+        self.assertEqual(parse_timeout('1.5'), 1.5)
+        self.assertIsNone(parse_timeout('0'))
+        self.assertIsNone(parse_timeout('soon'))
+        self.assertIsNone(parse_timeout(None))
+
+    def test_check_deadline_outside_request(self):
+        self.assertIsNone(current_deadline())
+        check_deadline()
+
+
+class TestDispatcherDeadlines(unittest2.TestCase):
+    def setUp(self):
+        self.seen = seen = []
+
+        class SlowResource(ResourceBase):
+            resource_name = 'slow'
+            pks = ('id',)
+
+            @apimethod(methods=['GET'], timeout=0.05)
+            def retrieve(cls, request):
+                seen.append(request.deadline)
+                time.sleep(float(request.query_args.get('sleep', 0)))
+                return cls(properties=dict(id=request.get('id')))
+
+            @apimethod(route='/check', methods=['GET'])
+            def check(cls, request):
+                seen.append(current_deadline())
+                time.sleep(0.02)
+                check_deadline()
+                return cls(properties=dict(id=request.get('id')))
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(SlowResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.client = self.app.test_client()
+
+    def test_route_timeout(self):
+        """
+        Tests that a request that takes longer than the
+        route's timeout is answered with a 504.
+        """
+        self.assertEqual(self.client.get('/slow/1/').status_code, 200)
+        self.assertEqual(self.seen[0].timeout, 0.05)
+        response = self.client.get('/slow/1/?sleep=0.1')
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(json.loads(response.data.decode('utf8'))['status'], 504)
+        self.assertIsNone(current_deadline())
+
+    def test_header_shortens_timeout(self):
+        """
+        Tests that the header can shorten the timeout
+        but not extend it.
+        """
+        self.client.get('/slow/1/', headers={'X-Request-Timeout': '0.01'})
+        self.client.get('/slow/1/', headers={'X-Request-Timeout': '60'})
+        self.assertEqual([deadline.timeout for deadline in self.seen], [0.01, 0.05])
+
+    def test_cooperative_check(self):
+        """
+        Tests that managers can check the deadline of the
+        request handled by the thread.
+        """
+        self.assertEqual(self.client.get('/slow/1/check').status_code, 200)
+        self.assertIsNone(self.seen[0])
+        response = self.client.get('/slow/1/check', headers={'X-Request-Timeout': '0.01'})
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(self.seen[1].timeout, 0.01)
+
+    def test_default_timeout(self):
+        self.dispatcher.default_timeout = 0.01
+        self.assertEqual(self.client.get('/slow/1/check').status_code, 504)
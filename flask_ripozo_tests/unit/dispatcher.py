@@ -7,6 +7,7 @@ from flask import Flask, Blueprint
 
 from flask_ripozo.dispatcher import FlaskDispatcher, flask_dispatch_wrapper, get_request_query_body_args
 
+from ripozo import apimethod, ResourceBase, adapters
 from ripozo.exceptions import RestException
 
 import json
@@ -184,3 +185,87 @@ class TestFlaskDispatcher(unittest2.TestCase):
                 break
         else:
             assert False
+
+
+class TestDispatcherMount(unittest2.TestCase):
+    def setUp(self):
+        class MountedResource(ResourceBase):
+            resource_name = 'mounted'
+            pks = ('id',)
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                return cls(properties=dict(id=request.get('id')))
+
+        self.resource_class = MountedResource
+        self.app = Flask(__name__)
+        self.v1 = Blueprint('v1', __name__, url_prefix='/v1')
+        self.v2 = Blueprint('v2', __name__, url_prefix='/v2')
+        self.dispatcher = FlaskDispatcher(self.v1, url_prefix='/api')
+        self.dispatcher.register_resources(MountedResource)
+        self.dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter)
+        self.dispatcher.mount(self.v2, url_prefix='/api')
+        self.dispatcher.mount(self.app, url_prefix='partner', name='partner')
+
+    def get_self_link(self, client, url):
+        response = client.get(url, headers={'Accept': 'application/hal+json'})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf8'))['_links']['self']['href']
+
+    def test_base_url_per_mount(self):
+        """
+        Tests that every mount serves the routes with
+        links relative to its own prefix.
+        """
+        self.app.register_blueprint(self.v1)
+        self.app.register_blueprint(self.v2)
+        client = self.app.test_client()
+        self.assertEqual(self.get_self_link(client, '/v1/api/mounted/1/'), 'http://localhost/v1/api/mounted/1')
+        self.assertEqual(self.get_self_link(client, '/v2/api/mounted/1/'), 'http://localhost/v2/api/mounted/1')
+        self.assertEqual(self.get_self_link(client, '/partner/mounted/1/'), 'http://localhost/partner/mounted/1')
+        self.assertIn('partner__MountedResource__retrieve', self.app.view_functions)
+
+    def test_routes_registered_after_mount(self):
+        """
+        Tests that routes registered after the mount
+        was created are added to it.
+        """
+        def later(request):
+            return self.resource_class(properties=dict(id='later'))
+
+        self.dispatcher.register_route('later', endpoint_func=later, route='/later/', methods=['GET'])
+        self.app.register_blueprint(self.v2)
+        self.assertEqual(self.app.test_client().get('/v2/api/later/').status_code, 200)
+
+    def test_change_feed_mounted(self):
+        """
+        Tests that change feeds are served from the mounts,
+        including the ones created after the feed.
+        """
+        self.dispatcher.register_change_feed(self.resource_class)
+        self.dispatcher.mount(self.app, url_prefix='later', name='later')
+        self.app.register_blueprint(self.v1)
+        self.app.register_blueprint(self.v2)
+        client = self.app.test_client()
+        for url in ('/v1/api/mounted/_changes', '/v2/api/mounted/_changes',
+                    '/partner/mounted/_changes', '/later/mounted/_changes'):
+            response = client.get(url, buffered=False)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            response.close()
+
+    def test_negotiation_cache(self):
+        """
+        Tests that the negotiation is cached and that the cache
+        is cleared when the adapters change.
+        """
+        dispatcher = self.dispatcher
+        self.assertEqual(dispatcher.accepted_mimetypes('application/hal+json;q=0.5, text/html'),
+                         ['text/html', 'application/hal+json'])
+        self.assertEqual(dispatcher.accepted_mimetypes(None), [])
+        self.assertIs(dispatcher.get_adapter_for_type(['application/hal+json']), adapters.HalAdapter)
+        self.assertIs(dispatcher.get_adapter_for_type(['text/html']), adapters.SirenAdapter)
+        dispatcher.default_adapter = adapters.HalAdapter
+        self.assertIs(dispatcher.get_adapter_for_type(['text/html']), adapters.HalAdapter)
+        dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.assertIs(dispatcher.get_adapter_for_type(['application/json']), adapters.BasicJSONAdapter)
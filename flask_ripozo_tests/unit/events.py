@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.adapters import MessagePackAdapter
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.events import EventBroker, format_sse
+
+from ripozo import apimethod, ResourceBase, adapters
+
+import json
+import unittest2
+
+
+class TestEventBroker(unittest2.TestCase):
+    def test_publish_subscribe(self):
+        """
+        Tests that events are delivered to the subscribers
+        of the channel only.
+        """
+        broker = EventBroker()
+        subscription = broker.subscribe('channel')
+        other = broker.subscribe('other')
+        event = broker.publish('channel', 'updated', 'data')
+        self.assertIs(subscription.get(timeout=0), event)
+        self.assertIsNone(subscription.get(timeout=0))
+        self.assertIsNone(other.get(timeout=0))
+        subscription.close()
+        self.assertEqual(broker.subscriber_count('channel'), 0)
+
+    def test_drop_slow_subscriber(self):
+        """
+        Tests that a subscriber with a full buffer is disconnected.
+        """
+        broker = EventBroker(max_buffer=2)
+        subscription = broker.subscribe('channel')
+        for i in range(3):
+            broker.publish('channel', 'updated', 'data')
+        self.assertTrue(subscription.closed)
+        self.assertEqual(broker.subscriber_count('channel'), 0)
+
+    def test_drop_oldest(self):
+        """
+        Tests that the oldest events are dropped when
+        slow subscribers are not disconnected.
+        """
+        broker = EventBroker(max_buffer=2, drop_slow=False)
+        subscription = broker.subscribe('channel')
+        for i in range(3):
+            broker.publish('channel', 'updated', '{0}'.format(i))
+        self.assertFalse(subscription.closed)
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(subscription.get(timeout=0).data, '1')
+
+    def test_format_sse(self):
+        """
+        Tests formatting multi line and empty messages.
+        """
+        self.assertEqual(format_sse('a\nb', event='updated', event_id=3),
+                         'id: 3\nevent: updated\ndata: a\ndata: b\n\n')
+        self.assertEqual(format_sse(''), 'data: \n\n')
+
+
+class TestChangeFeed(unittest2.TestCase):
+    def setUp(self):
+        class FeedResource(ResourceBase):
+            resource_name = 'feed'
+            pks = ('id',)
+
+            @apimethod(methods=['GET', 'PUT'])
+            def retrieve(cls, request):
+                return cls(properties=dict(id=request.get('id')))
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app, url_prefix='/api')
+        self.dispatcher.register_resources(FeedResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.feed = self.dispatcher.register_change_feed(FeedResource)
+        self.client = self.app.test_client()
+
+    def test_stream(self):
+        """
+        Tests that successful writes are pushed to
+        the subscribers and reads are not.
+        """
+        response = self.client.get('/api/feed/_changes?id=1', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = iter(response.response)
+        self.assertEqual(next(stream), b': connected\n\n')
+
+        self.client.get('/api/feed/1/')
+        self.client.put('/api/feed/2/')
+        self.client.put('/api/feed/1/')
+        message = next(stream).decode('utf8')
+        lines = message.splitlines()
+        self.assertEqual(lines[1], 'event: updated')
+        self.assertDictEqual(json.loads(lines[2][len('data: '):]), dict(feed=dict(id='1')))
+        response.close()
+        self.assertEqual(self.feed.broker.subscriber_count(self.feed.channel), 0)
+
+    def test_no_subscribers(self):
+        """
+        Tests that nothing is published without subscribers.
+        """
+        self.assertIsNone(self.feed.publish(self.dispatcher, 'PUT', None, {}))
+
+    def test_binary_adapter(self):
+        """
+        Tests that binary adapters are rejected and that a binary
+        default adapter is replaced by its structure adapter.
+        """
+        self.assertRaises(ValueError, self.dispatcher.register_change_feed, self.feed.resource_class,
+                          route='/binary', adapter_class=MessagePackAdapter)
+        self.dispatcher.default_adapter = MessagePackAdapter
+        response = self.client.get('/api/feed/_changes', buffered=False)
+        stream = iter(response.response)
+        next(stream)
+        self.client.put('/api/feed/1/')
+        data = next(stream).decode('utf8').splitlines()[2][len('data: '):]
+        self.assertEqual(json.loads(data)['properties'], dict(id='1'))
+        response.close()
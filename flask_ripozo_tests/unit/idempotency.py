@@ -0,0 +1,185 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.idempotency import IdempotencyHandler, InMemoryIdempotencyStore, StoredResponse
+
+from ripozo import apimethod, ResourceBase, adapters
+from ripozo.exceptions import NotFoundException
+
+import threading
+import time
+import unittest2
+
+
+class TestInMemoryIdempotencyStore(unittest2.TestCase):
+    def test_reserve(self):
+        store = InMemoryIdempotencyStore()
+        self.assertEqual(store.reserve('key'), (None, True))
+        self.assertEqual(store.reserve('key'), (None, False))
+        response = StoredResponse('body', {}, 201)
+        store.save('key', response)
+        self.assertEqual(store.reserve('key'), (response, False))
+
+    def test_release(self):
+        store = InMemoryIdempotencyStore()
+        store.reserve('key')
+        store.release('key')
+        self.assertEqual(store.reserve('key'), (None, True))
+
+    def test_ttl_and_max_entries(self):
+        store = InMemoryIdempotencyStore(max_entries=1, ttl=0)
+        store.reserve('first')
+        store.save('first', StoredResponse('body', {}, 200))
+        self.assertEqual(store.reserve('first'), (None, True))
+        store.ttl = 60
+        store.save('first', StoredResponse('body', {}, 200))
+        store.reserve('second')
+        store.save('second', StoredResponse('body', {}, 200))
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.reserve('first'), (None, True))
+
+
+class TestIdempotencyHandler(unittest2.TestCase):
+    def setUp(self):
+        self.calls = calls = []
+        self.release = release = threading.Event()
+        release.set()
+
+        class TaskResource(ResourceBase):
+            resource_name = 'task'
+            pks = ('id',)
+
+            @apimethod(methods=['POST', 'GET'])
+            def create(cls, request):
+                calls.append(request.get('id'))
+                release.wait(5)
+                if request.get('id') == 'missing':
+                    raise NotFoundException('missing')
+                return cls(properties=dict(id=request.get('id'), call=len(calls)), status_code=201)
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(TaskResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.handler = IdempotencyHandler(wait_timeout=2)
+        self.handler.attach(self.dispatcher)
+        self.client = self.app.test_client()
+
+    def post(self, task_id, key='abc', **kwargs):
+        headers = kwargs.pop('headers', {})
+        headers['Idempotency-Key'] = key
+        return self.client.post('/task/{0}/'.format(task_id), headers=headers, **kwargs)
+
+    def test_replay(self):
+        """
+        Tests that a retry replays the stored response
+        without calling the apimethod.
+        """
+        first = self.post('1')
+        second = self.post('1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.calls, ['1'])
+        self.assertEqual(self.dispatcher.stats()['idempotency']['replayed'], 1)
+
+    def test_not_deduplicated(self):
+        """
+        Tests that requests without a key, other keys and
+        safe methods are dispatched.
+        """
+        self.post('1', key='abc')
+        self.post('1', key='def')
+        self.client.post('/task/1/')
+        self.client.get('/task/1/', headers={'Idempotency-Key': 'abc'})
+        self.assertEqual(len(self.calls), 4)
+
+    def test_failure_released(self):
+        """
+        Tests that a failed request does not store a response.
+        """
+        self.assertEqual(self.post('missing').status_code, 404)
+        self.assertEqual(self.post('missing').status_code, 404)
+        self.assertEqual(self.calls, ['missing', 'missing'])
+
+    def test_concurrent_duplicate_waits(self):
+        """
+        Tests that a duplicate of a request in flight waits
+        for it and replays its response.
+        """
+        self.release.clear()
+        responses = []
+
+        def post():
+            with self.app.test_client() as client:
+                responses.append(client.post('/task/1/', headers={'Idempotency-Key': 'abc'}))
+
+        first = threading.Thread(target=post)
+        first.start()
+        while not self.calls:
+            time.sleep(0.001)
+        second = threading.Thread(target=post)
+        second.start()
+        time.sleep(0.05)
+        self.release.set()
+        first.join()
+        second.join()
+        self.assertEqual(self.calls, ['1'])
+        self.assertEqual(responses[0].data, responses[1].data)
+
+    def test_concurrent_duplicate_conflict(self):
+        """
+        Tests that a 409 is returned if the first
+        request takes longer than the wait timeout.
+        """
+        self.release.clear()
+        self.handler.wait_timeout = 0.01
+        key = self.handler.get_key('TaskResource__create', 'POST', {'Idempotency-Key': 'abc'},
+                                   dict(REMOTE_ADDR='127.0.0.1'))
+        self.handler.store.reserve(key)
+        self.assertEqual(self.post('1').status_code, 409)
+        self.assertEqual(self.calls, [])
+
+    def test_scoped_to_client(self):
+        """
+        Tests that the same key from different
+        clients is not deduplicated.
+        """
+        first = self.post('1', headers={'Authorization': 'Bearer first'})
+        second = self.post('1', headers={'Authorization': 'Bearer second'})
+        third = self.post('1', environ_base=dict(REMOTE_ADDR='10.0.0.2'))
+        self.assertNotIn('Idempotent-Replayed', second.headers)
+        self.assertNotIn('Idempotent-Replayed', third.headers)
+        self.assertEqual(len(self.calls), 3)
+        replay = self.post('1', headers={'Authorization': 'Bearer first'})
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_key_func(self):
+        """
+        Tests that the client identity can be customized.
+        """
+        self.handler.key_func = lambda environ, headers: headers['X-Tenant']
+        self.post('1', headers={'X-Tenant': 'a'}, environ_base=dict(REMOTE_ADDR='10.0.0.1'))
+        replay = self.post('1', headers={'X-Tenant': 'a'}, environ_base=dict(REMOTE_ADDR='10.0.0.2'))
+        self.assertEqual(replay.headers['Idempotent-Replayed'], 'true')
+        self.post('1', headers={'X-Tenant': 'b'})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_fingerprint_mismatch(self):
+        """
+        Tests that a key reused for a different path
+        or body gets a 422 instead of the stored response.
+        """
+        self.post('1', data=dict(x='1'))
+        self.assertEqual(self.post('2', data=dict(x='1')).status_code, 422)
+        self.assertEqual(self.post('1', data=dict(x='2')).status_code, 422)
+        self.assertEqual(self.post('1', data=dict(x='1')).status_code, 201)
+        self.assertEqual(self.calls, ['1'])
+        self.assertEqual(self.dispatcher.stats()['idempotency']['mismatches'], 2)
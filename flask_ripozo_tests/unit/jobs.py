@@ -0,0 +1,206 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask, request
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.jobs import FINISHED, InMemoryJobStore, Job, JobRunner, JobStoreFullException
+from flask_ripozo.sessions import PooledSessionHandler
+
+from ripozo import apimethod, ResourceBase, adapters
+from ripozo.exceptions import NotFoundException
+
+import json
+import mock
+import threading
+import time
+import unittest2
+
+
+class TestInMemoryJobStore(unittest2.TestCase):
+    def finish(self, job, finished):
+        job.finished = finished
+        job.status = FINISHED
+
+    def test_retention(self):
+        """
+        Tests that finished jobs expire after the
+        retention and pending jobs do not.
+        """
+        store = InMemoryJobStore(retention=10)
+        pending, old, recent = Job('a'), Job('b'), Job('c')
+        self.finish(old, time.time() - 20)
+        self.finish(recent, time.time())
+        for job in (pending, old, recent):
+            store.add(job)
+        self.assertIs(store.get(pending.job_id), pending)
+        self.assertIsNone(store.get(old.job_id))
+        self.assertIs(store.get(recent.job_id), recent)
+
+    def test_max_jobs(self):
+        """
+        Tests that the oldest finished job is removed for a new
+        job and that pending jobs are never removed.
+        """
+        store = InMemoryJobStore(max_jobs=2)
+        first, second = Job('a'), Job('b')
+        store.add(first)
+        store.add(second)
+        self.assertRaises(JobStoreFullException, store.add, Job('c'))
+        self.finish(first, time.time())
+        third = Job('c')
+        store.add(third)
+        self.assertIsNone(store.get(first.job_id))
+        self.assertIs(store.get(third.job_id), third)
+        self.assertEqual(len(store), 2)
+
+
+class TestJobRunner(unittest2.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        release = self.release
+
+        class ReportResource(ResourceBase):
+            resource_name = 'report'
+            pks = ('id',)
+
+            @apimethod(methods=['POST'], background=True)
+            def generate(cls, request):
+                release.wait(5)
+                if request.get('id') == 'missing':
+                    raise NotFoundException('missing')
+                if request.get('id') == 'broken':
+                    raise ValueError('broken')
+                return cls(properties=dict(id=request.get('id'), total=request.body_args.get('total')))
+
+        self.resource_class = ReportResource
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app, url_prefix='/api')
+        self.dispatcher.register_resources(ReportResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.runner = JobRunner(workers=1)
+        self.runner.attach(self.dispatcher)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.release.set()
+        self.runner.shutdown()
+
+    def submit(self, report_id):
+        response = self.client.post('/api/report/{0}/'.format(report_id), data=json.dumps(dict(total=3)),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        location = response.headers['Location']
+        self.assertTrue(location.startswith('http://localhost/api/jobs/'))
+        self.assertTrue(location.endswith('/'))
+        return location[len('http://localhost'):]
+
+    def test_job(self):
+        """
+        Tests that the job is pending until the apimethod
+        returns and then serves its result.
+        """
+        location = self.submit('1')
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(json.loads(response.data.decode('utf8'))['jobs']['status'], ('pending', 'running'))
+
+        self.release.set()
+        self.runner.shutdown()
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(json.loads(response.data.decode('utf8')), dict(report=dict(id='1', total=3)))
+        self.assertEqual(self.dispatcher.stats()['jobs']['finished'], 1)
+
+    def test_failed_job(self):
+        """
+        Tests that the exception of a failed job is returned.
+        """
+        location = self.submit('missing')
+        self.release.set()
+        self.runner.shutdown()
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.dispatcher.stats()['jobs']['failed'], 1)
+
+    def test_failed_job_error(self):
+        """
+        Tests that a job failing with another exception
+        is returned with its error message.
+        """
+        location = self.submit('broken')
+        self.release.set()
+        self.runner.shutdown()
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 200)
+        job = json.loads(response.data.decode('utf8'))['jobs']
+        self.assertEqual((job['status'], job['error']), ('failed', 'broken'))
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/api/jobs/nope/').status_code, 404)
+
+    def test_hooks_run_in_worker(self):
+        """
+        Tests that the job hooks run in the worker and that
+        the request hooks only run for the request.
+        """
+        calls = []
+
+        @self.dispatcher.before_request
+        def before(endpoint):
+            calls.append(('before_request', request.headers.get('Content-Type')))
+
+        @self.dispatcher.after_dispatch
+        def after(endpoint, ripozo_request, adapter):
+            calls.append(('after_dispatch', adapter.status_code))
+
+        @self.runner.after_job
+        def after_job(endpoint, ripozo_request, adapter):
+            calls.append((endpoint, threading.current_thread().name))
+
+        location = self.submit('1')
+        self.release.set()
+        self.runner.shutdown()
+        self.assertEqual(calls, [('before_request', 'application/json'), ('after_dispatch', 202),
+                                 ('ReportResource__generate', 'flask-ripozo-jobs')])
+        self.assertEqual(self.client.get(location).status_code, 200)
+        self.assertEqual(len(calls), 5)
+
+    def test_session_handler(self):
+        """
+        Tests that a session handler scopes the jobs
+        of the runner attached to the dispatcher.
+        """
+        handler = PooledSessionHandler(mock.Mock())
+        handler.attach(self.dispatcher)
+        self.assertEqual(self.runner.before_job_hooks, [handler.begin_request])
+        self.assertEqual(self.runner.after_job_hooks, [handler.commit_request])
+        self.assertEqual(self.runner.job_error_hooks, [handler.rollback_request])
+
+    def test_change_feed(self):
+        """
+        Tests that the result of the job is published to the
+        change feed from the worker instead of the pending job.
+        """
+        self.dispatcher.register_change_feed(self.resource_class)
+        response = self.client.get('/api/report/_changes', buffered=False)
+        stream = iter(response.response)
+        next(stream)
+        self.submit('1')
+        self.release.set()
+        self.runner.shutdown()
+        lines = next(stream).decode('utf8').splitlines()
+        self.assertEqual(lines[1], 'event: created')
+        self.assertDictEqual(json.loads(lines[2][len('data: '):]), dict(report=dict(id='1', total=3)))
+        response.close()
+
+    def test_resource_class_name(self):
+        """
+        Tests that the job resource class is named after its resource_name.
+        """
+        self.assertEqual(self.runner.resource_class.__name__, 'JobsJobResource')
+        runner = JobRunner()
+        runner.attach(FlaskDispatcher(Flask(__name__)), resource_name='report_jobs')
+        self.assertEqual(runner.resource_class.__name__, 'ReportJobsJobResource')
@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.memory import AllocationTracker
+from flask_ripozo.profiler import SamplingProfiler
+
+import mock
+import unittest2
+
+
+class TestAllocationTracker(unittest2.TestCase):
+    def get_mock_adapter_class(self, body='some body'):
+        response_adapter = mock.MagicMock()
+        response_adapter.formatted_body = body
+        response_adapter.extra_headers = {'Content-Type': 'fake'}
+        response_adapter.status_code = 200
+        adapter_class = mock.Mock(return_value=response_adapter)
+        adapter_class.formats = ['duh']
+        return adapter_class
+
+    def test_not_sampled(self):
+        """
+        Tests that nothing is measured with a sample rate of 0
+        """
+        tracker = AllocationTracker(sample_rate=0)
+        self.assertIsNone(tracker.start('endpoint'))
+        self.assertDictEqual(tracker.stats(), {})
+
+    def test_measure(self):
+        """
+        Tests that the peak and net allocations are recorded.
+        """
+        tracker = AllocationTracker(sample_rate=1)
+        measurement = tracker.start('endpoint')
+        kept = [bytearray(1024) for i in range(100)]
+        temp = bytearray(1024 * 1024)
+        del temp
+        peak, net = tracker.finish(measurement)
+        self.assertGreaterEqual(peak, 1024 * 1024)
+        self.assertGreaterEqual(net, 1024 * 100)
+        self.assertLess(net, 1024 * 1024)
+
+        stats = tracker.stats()['endpoint']
+        self.assertEqual(stats['samples'], 1)
+        self.assertEqual(stats['max_peak'], peak)
+        self.assertEqual(stats['last_net'], net)
+        del kept
+
+    def test_one_measurement_at_a_time(self):
+        """
+        Tests that a second request is not measured while
+        the first one is.
+        """
+        tracker = AllocationTracker(sample_rate=1)
+        measurement = tracker.start('endpoint')
+        self.assertIsNone(tracker.start('endpoint'))
+        tracker.finish(measurement)
+        tracker.finish(tracker.start('endpoint'))
+        self.assertEqual(tracker.stats()['endpoint']['samples'], 2)
+
+    def test_dispatcher_stats(self):
+        """
+        Tests that the allocations are exposed with the other
+        dispatcher stats.
+        """
+        app = Flask(__name__)
+        profiler = SamplingProfiler(threshold=10)
+        d = FlaskDispatcher(app, profiler=profiler,
+                            allocation_tracker=AllocationTracker(sample_rate=1))
+        d.register_adapters(self.get_mock_adapter_class())
+        d.register_route('myendpoint', endpoint_func=mock.Mock(), route='/myresource')
+        app.test_client().get('/myresource')
+        profiler.stop()
+        stats = d.stats()
+        self.assertEqual(stats['allocations']['myendpoint']['samples'], 1)
+        self.assertEqual(stats['profiler']['myendpoint']['requests'], 1)
+        self.assertDictEqual(FlaskDispatcher(app, auto_options=False).stats(), {})
@@ -0,0 +1,185 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.metadata import add_validators, allowed_methods
+
+from ripozo import apimethod, ResourceBase, adapters
+from ripozo.exceptions import NotFoundException
+
+from werkzeug.test import Client
+
+import mock
+import unittest2
+
+
+class TestMetadata(unittest2.TestCase):
+    def setUp(self):
+        self.calls = calls = []
+
+        class DocumentResource(ResourceBase):
+            resource_name = 'document'
+            pks = ('id',)
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                calls.append('retrieve')
+                return cls(properties=dict(id=request.get('id')))
+
+            @apimethod(methods=['PUT', 'DELETE'])
+            def update(cls, request):
+                return cls(properties=dict(id=request.get('id')))
+
+            @classmethod
+            def head_metadata(cls, request, adapter_class):
+                calls.append(adapter_class)
+                if request.get('id') == 'missing':
+                    raise NotFoundException('missing')
+                if request.get('id') == 'unknown':
+                    return None
+                return dict(etag='v1', last_modified=datetime(2016, 1, 1))
+
+        class PlainResource(ResourceBase):
+            resource_name = 'plain'
+            pks = ('id',)
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                calls.append('plain')
+                return cls(properties=dict(id=request.get('id')))
+
+            @apimethod(methods=['OPTIONS'], route='/custom')
+            def custom_options(cls, request):
+                calls.append('options')
+                return cls(properties=dict(id=request.get('id')))
+
+        class LateOptionsResource(ResourceBase):
+            resource_name = 'late'
+
+            @apimethod(methods=['GET'])
+            def retrieve_list(cls, request):
+                calls.append('late')
+                return cls(properties=dict(x=1))
+
+            @apimethod(methods=['OPTIONS'])
+            def late_options(cls, request):
+                calls.append('late_options')
+                return cls(properties=dict(x=1))
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(DocumentResource, PlainResource, LateOptionsResource)
+        self.dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter)
+        self.clients = [self.app.test_client(), Client(self.dispatcher.wsgi_app())]
+
+    def test_options(self):
+        """
+        Tests that OPTIONS is answered from the routes
+        without dispatching.
+        """
+        for client in self.clients:
+            response = client.options('/document/1/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Allow'], 'DELETE, GET, HEAD, OPTIONS, PUT')
+            self.assertEqual(response.headers['Accept-Formats'],
+                             'application/hal+json, application/vnd.siren+json')
+            self.assertEqual(response.data, b'')
+            self.assertNotIn('Content-Type', response.headers)
+        self.assertEqual(self.calls, [])
+
+    def test_options_apimethod(self):
+        """
+        Tests that apimethods for OPTIONS are dispatched, also
+        when they are registered after another method on the route.
+        """
+        for client in self.clients:
+            self.assertEqual(client.options('/plain/1/custom').status_code, 200)
+            self.assertEqual(client.options('/late/').status_code, 200)
+        self.assertEqual(self.calls, ['options', 'late_options'] * 2)
+
+    def test_head_metadata(self):
+        """
+        Tests that HEAD uses the resource's head_metadata
+        instead of dispatching.
+        """
+        for client in self.clients:
+            response = client.head('/document/1/', headers={'Accept': 'application/hal+json'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['ETag'], '"v1"')
+            self.assertNotIn('Content-Length', response.headers)
+            self.assertEqual(response.headers['Last-Modified'], 'Fri, 01 Jan 2016 00:00:00 GMT')
+            self.assertEqual(response.mimetype, 'application/hal+json')
+            self.assertEqual(response.data, b'')
+            self.assertEqual(client.head('/document/missing/').status_code, 404)
+        self.assertEqual(self.calls, [adapters.HalAdapter, adapters.SirenAdapter] * 2)
+
+    def test_get_validators(self):
+        """
+        Tests that GET responses have the same validators
+        as the HEAD responses.
+        """
+        for client in self.clients:
+            head = client.head('/document/1/', headers={'Accept': 'application/hal+json'})
+            get = client.get('/document/1/', headers={'Accept': 'application/hal+json'})
+            self.assertEqual(get.status_code, 200)
+            self.assertEqual(get.headers['ETag'], head.headers['ETag'])
+            self.assertEqual(get.headers['Last-Modified'], head.headers['Last-Modified'])
+            self.assertEqual(get.mimetype, 'application/hal+json')
+            self.assertNotIn('ETag', client.get('/document/unknown/').headers)
+            self.assertNotIn('ETag', client.get('/plain/1/').headers)
+        self.assertEqual(self.calls.count('retrieve'), 4)
+        self.assertEqual(self.calls.count(adapters.HalAdapter), 4)
+
+    def test_get_not_modified(self):
+        """
+        Tests that a GET whose conditional headers match the
+        head_metadata is answered with a 304 without dispatching.
+        """
+        for client in self.clients:
+            for headers in ({'If-None-Match': '"v0", W/"v1"'},
+                            {'If-Modified-Since': 'Sat, 02 Jan 2016 00:00:00 GMT'}):
+                response = client.get('/document/1/', headers=headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers['ETag'], '"v1"')
+                self.assertEqual(response.data, b'')
+            for headers in ({'If-None-Match': '"v0"'},
+                            {'If-Modified-Since': 'Thu, 31 Dec 2015 00:00:00 GMT'},
+                            {'If-None-Match': '"v0"', 'If-Modified-Since': 'Sat, 02 Jan 2016 00:00:00 GMT'}):
+                self.assertEqual(client.get('/document/1/', headers=headers).status_code, 200)
+        self.assertEqual(self.calls.count('retrieve'), 6)
+
+    def test_validated_adapter_lazy(self):
+        """
+        Tests that adding the validators does not format the body.
+        """
+        adapter = mock.Mock(extra_headers={'Content-Type': 'application/json'})
+        formatted_body = mock.PropertyMock(return_value='body')
+        type(adapter).formatted_body = formatted_body
+        validated = add_validators(adapter, {'ETag': '"v1"'})
+        self.assertFalse(formatted_body.called)
+        self.assertEqual(validated.formatted_body, 'body')
+        self.assertEqual(validated.extra_headers, {'Content-Type': 'application/json', 'ETag': '"v1"'})
+        self.assertIs(add_validators(adapter, {}), adapter)
+
+    def test_head_fallback(self):
+        """
+        Tests that HEAD is dispatched without head_metadata or
+        when it returns None and that the body is not sent.
+        """
+        for client in self.clients:
+            get = client.get('/plain/1/')
+            response = client.head('/plain/1/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['Content-Length'], str(len(get.data)))
+            self.assertEqual(response.data, b'')
+            self.assertEqual(client.head('/document/unknown/').status_code, 200)
+        self.assertEqual(self.calls, ['plain', 'plain', adapters.SirenAdapter, 'retrieve'] * 2)
+
+    def test_allowed_methods(self):
+        self.assertEqual(allowed_methods(set(['post'])), ['OPTIONS', 'POST'])
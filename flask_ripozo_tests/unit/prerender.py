@@ -0,0 +1,168 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.prerender import StaticRenderer
+
+from ripozo import apimethod, ResourceBase, adapters
+from ripozo.exceptions import NotFoundException
+
+from io import BytesIO
+
+from werkzeug.test import Client
+
+import gzip
+import json
+import mock
+import os
+import shutil
+import tempfile
+import unittest2
+
+
+class TestStaticRenderer(unittest2.TestCase):
+    def setUp(self):
+        self.calls = calls = []
+        self.countries = countries = {'fr': 'France', 'de': 'Germany'}
+
+        class CountryResource(ResourceBase):
+            resource_name = 'country'
+            pks = ('code',)
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                calls.append(request.get('code'))
+                code = request.get('code')
+                if code not in countries:
+                    raise NotFoundException('missing')
+                return cls(properties=dict(code=code, name=countries[code] * 50))
+
+            @apimethod(methods=['PUT'])
+            def update(cls, request):
+                return cls(properties=dict(code=request.get('code')))
+
+            @classmethod
+            def prerender_url_params(cls):
+                return [dict(code=code) for code in sorted(countries)]
+
+        class StatusResource(ResourceBase):
+            resource_name = 'status'
+
+            @apimethod(methods=['GET'])
+            def status(cls, request):
+                calls.append('status')
+                return cls(properties=dict(status='ok'))
+
+        self.CountryResource = CountryResource
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(CountryResource, StatusResource)
+        self.dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter)
+        self.renderer = StaticRenderer(self.directory, 'http://localhost/', check_interval=0)
+        self.renderer.attach(self.dispatcher)
+        self.clients = [self.app.test_client(), Client(self.dispatcher.wsgi_app())]
+
+    def test_render(self):
+        """
+        Tests that the GET routes are rendered for every adapter
+        and that unchanged bodies are not written again.
+        """
+        self.assertEqual(self.renderer.render(), dict(written=6, unchanged=0, removed=0))
+        self.assertEqual(sorted(self.calls), ['de', 'de', 'fr', 'fr', 'status', 'status'])
+        with open(os.path.join(self.directory, 'manifest.json')) as manifest:
+            self.assertEqual(len(json.load(manifest)), 6)
+        self.assertEqual(self.renderer.render(), dict(written=0, unchanged=6, removed=0))
+
+    def test_serve(self):
+        """
+        Tests that the rendered files are served without
+        dispatching with an ETag and a gzip variant.
+        """
+        self.assert_serves()
+
+    @mock.patch('flask_ripozo.prerender.send_file', None)
+    def test_serve_old_werkzeug(self):
+        """
+        Tests serving the files without ``werkzeug.utils.send_file``.
+        """
+        self.assert_serves()
+
+    def assert_serves(self):
+        live = self.app.test_client().get('/country/fr/', headers={'Accept': 'application/hal+json'})
+        self.renderer.render()
+        del self.calls[:]
+        for client in self.clients:
+            response = client.get('/country/fr/', headers={'Accept': 'application/hal+json'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, live.data)
+            self.assertEqual(response.mimetype, 'application/hal+json')
+            etag = response.headers['ETag']
+            response = client.get('/country/fr/', headers={'Accept': 'application/hal+json',
+                                                           'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            response = client.get('/country/fr/', headers={'Accept': 'application/hal+json',
+                                                           'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.GzipFile(fileobj=BytesIO(response.data)).read(), live.data)
+            self.assertNotEqual(response.headers['ETag'], etag)
+            self.assertEqual(client.head('/country/fr/').data, b'')
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.dispatcher.stats()['prerender']['hits'], 8)
+
+    def test_fallback(self):
+        """
+        Tests that requests with a query string or for
+        something that was not rendered are dispatched.
+        """
+        self.renderer.render()
+        del self.calls[:]
+        for client in self.clients:
+            self.assertEqual(client.get('/country/fr/?fields=name').status_code, 200)
+            self.assertEqual(client.get('/country/it/').status_code, 404)
+        self.assertEqual(self.calls, ['fr', 'it'] * 2)
+
+    def test_incremental(self):
+        """
+        Tests that only the routes of the given resources are
+        rendered again and that removed resources are no longer served.
+        """
+        self.renderer.render()
+        self.countries['fr'] = 'Republique francaise'
+        del self.countries['de']
+        del self.calls[:]
+        counts = self.renderer.render([self.CountryResource])
+        self.assertEqual(counts, dict(written=2, unchanged=0, removed=2))
+        self.assertEqual(self.calls, ['fr', 'fr'])
+        del self.calls[:]
+        self.assertIn(b'Republique', self.app.test_client().get('/country/fr/').data)
+        self.assertEqual(self.app.test_client().get('/country/de/').status_code, 404)
+        self.assertEqual(self.calls, ['de'])
+
+    def test_reload(self):
+        """
+        Tests that files rendered by another process are served.
+        """
+        other = StaticRenderer(self.directory, 'http://localhost/')
+        other.attach(FlaskDispatcher(Flask(__name__), auto_options=False), command=None)
+        other.dispatcher.register_resources(self.CountryResource)
+        other.dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter)
+        other.render()
+        del self.calls[:]
+        self.assertEqual(self.app.test_client().get('/country/fr/').status_code, 200)
+        self.assertEqual(self.calls, [])
+
+    def test_command(self):
+        """
+        Tests the command added to the app's cli.
+        """
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['prerender', '--resource', 'StatusResource'])
+        self.assertEqual(result.output.strip(), '2 written, 0 unchanged, 0 removed')
+        result = runner.invoke(args=['prerender', '--resource', 'Unknown'])
+        self.assertNotEqual(result.exit_code, 0)
@@ -0,0 +1,135 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.profiler import SamplingProfiler, StageTimer
+
+import json
+import mock
+import sys
+import time
+import unittest2
+
+
+class TestSamplingProfiler(unittest2.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def get_mock_adapter_class(self):
+        response_adapter = mock.MagicMock()
+        response_adapter.formatted_body = 'some body'
+        response_adapter.extra_headers = {'Content-Type': 'fake'}
+        response_adapter.status_code = 200
+        adapter_class = mock.Mock(return_value=response_adapter)
+        adapter_class.formats = ['duh']
+        return adapter_class
+
+    def test_stage_timer(self):
+        """
+        Tests that each mark records the time since the previous mark.
+        """
+        timer = StageTimer()
+        timer.mark('first')
+        timer.mark('second')
+        self.assertEqual([name for name, duration in timer.stages], ['first', 'second'])
+        self.assertGreaterEqual(timer.elapsed, sum(duration for name, duration in timer.stages))
+
+    def test_fast_request_discarded(self):
+        """
+        Tests that requests under the threshold that are not
+        sampled are not kept.
+        """
+        profiler = SamplingProfiler(threshold=10)
+        active = profiler.start('endpoint')
+        self.assertIsNone(profiler.finish(active))
+        self.assertListEqual(profiler.get_reports(), [])
+        self.assertDictEqual(profiler.stats(), dict(endpoint=dict(requests=1, reports=0)))
+        profiler.stop()
+
+    def test_slow_request_kept(self):
+        """
+        Tests that slow requests are kept along with their
+        stack samples and that the ring buffer is bounded.
+        """
+        profiler = SamplingProfiler(threshold=0, interval=0.001, max_reports=2)
+        for i in range(3):
+            active = profiler.start('endpoint')
+            time.sleep(0.02)
+            active.mark('work')
+            report = profiler.finish(active)
+            self.assertIsNotNone(report)
+            self.assertEqual(report.stages[0][0], 'work')
+        profiler.stop()
+        self.assertEqual(len(profiler.get_reports('endpoint')), 2)
+        self.assertTrue(report.samples)
+        collapsed = profiler.collapsed('endpoint')
+        self.assertIn('test_slow_request_kept', collapsed)
+
+    def test_sampled_request_kept(self):
+        """
+        Tests that a request selected by the sample rate is kept
+        regardless of the threshold.
+        """
+        profiler = SamplingProfiler(threshold=10, sample_rate=1)
+        report = profiler.finish(profiler.start('endpoint'))
+        profiler.stop()
+        self.assertTrue(report.sampled)
+
+    def test_truncated_stack(self):
+        """
+        Tests that stacks deeper than the max_depth keep the
+        frames nearest the call under a ``...`` root frame.
+        """
+        profiler = SamplingProfiler(max_depth=3)
+
+        def nested(depth):
+            if depth:
+                return nested(depth - 1)
+            return profiler._get_stack(sys._getframe())
+
+        stack = nested(5)
+        self.assertEqual(len(stack), 3)
+        self.assertEqual(stack[0], '...')
+        self.assertTrue(stack[1].endswith(':nested'))
+        self.assertTrue(stack[2].endswith(':nested'))
+        self.assertNotIn('...', SamplingProfiler()._get_stack(sys._getframe()))
+
+    def test_dispatcher_integration(self):
+        """
+        Tests that requests through the dispatcher are profiled
+        per endpoint with a stage breakdown.
+        """
+        profiler = SamplingProfiler(threshold=0)
+        d = FlaskDispatcher(self.app, profiler=profiler)
+        d.register_adapters(self.get_mock_adapter_class())
+        d.register_route('myendpoint', endpoint_func=mock.Mock(), route='/myresource')
+        response = self.app.test_client().get('/myresource')
+        profiler.stop()
+        self.assertEqual(response.status_code, 200)
+        reports = profiler.get_reports('myendpoint')
+        self.assertEqual(len(reports), 1)
+        self.assertListEqual([name for name, duration in reports[0].stages],
+                             ['arguments', 'dispatch', 'response'])
+
+    def test_register_routes(self):
+        """
+        Tests the admin routes that expose the reports.
+        """
+        profiler = SamplingProfiler(threshold=0)
+        report = profiler.finish(profiler.start('endpoint'))
+        profiler.stop()
+        report.samples[('a', 'b')] = 3
+        profiler.register_routes(self.app, url_prefix='/_profiles')
+        client = self.app.test_client()
+
+        response = client.get('/_profiles/')
+        body = json.loads(response.data.decode('utf8'))
+        self.assertEqual(body['reports'][0]['endpoint'], 'endpoint')
+        self.assertEqual(body['reports'][0]['samples'], 3)
+
+        response = client.get('/_profiles/endpoint/collapsed')
+        self.assertEqual(response.data.decode('utf8'), 'a;b 3')
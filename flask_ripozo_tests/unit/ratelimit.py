@@ -0,0 +1,172 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.ratelimit import InMemoryTokenBucketStore, RateLimiter
+
+from ripozo import apimethod, ResourceBase, adapters
+
+from werkzeug.test import Client
+
+import mock
+import unittest2
+
+
+class TestInMemoryTokenBucketStore(unittest2.TestCase):
+    @mock.patch('flask_ripozo.ratelimit.default_timer')
+    def test_consume(self, default_timer):
+        default_timer.return_value = 100
+        store = InMemoryTokenBucketStore()
+        self.assertEqual(store.consume('client', 2, 2), 0)
+        self.assertEqual(store.consume('client', 2, 2), 0)
+        self.assertEqual(store.consume('client', 2, 2), 0.5)
+        default_timer.return_value = 100.5
+        self.assertEqual(store.consume('client', 2, 2), 0)
+        default_timer.return_value = 200
+        self.assertEqual(store.consume('client', 2, 2), 0)
+        self.assertEqual(store.consume('client', 2, 2), 0)
+        self.assertGreater(store.consume('client', 2, 2), 0)
+
+    @mock.patch('flask_ripozo.ratelimit.default_timer')
+    def test_consume_many(self, default_timer):
+        default_timer.return_value = 100
+        store = InMemoryTokenBucketStore()
+        limits = [('route', 1, 1), ('client', 1, 2)]
+        self.assertEqual(store.consume_many(limits), 0)
+        self.assertEqual(store.consume_many(limits), 1)
+        self.assertEqual(store.consume('client', 1, 2), 0)
+        self.assertEqual(store.consume('client', 1, 2), 1)
+
+    def test_max_keys(self):
+        store = InMemoryTokenBucketStore(max_keys=2)
+        for key in ('first', 'second', 'third'):
+            store.consume(key, 1, 1)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.consume('first', 1, 1), 0)
+
+
+class TestRateLimiter(unittest2.TestCase):
+    def setUp(self):
+        self.calls = calls = []
+
+        class TaskResource(ResourceBase):
+            resource_name = 'task'
+            pks = ('id',)
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                calls.append('retrieve')
+                return cls(properties=dict(id=request.get('id')))
+
+            @apimethod(route='/search', methods=['GET'], rate_limit=(0.001, 1))
+            def search(cls, request):
+                calls.append('search')
+                return cls(properties=dict(id=request.get('id')))
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(TaskResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.limiter = RateLimiter(rate=0.001, burst=2, client_header='X-Api-Key')
+        self.limiter.attach(self.dispatcher)
+
+    def test_client_limit(self):
+        """
+        Tests that a client is answered with a 429 and Retry-After
+        once its bucket is empty without calling the apimethod.
+        """
+        client = self.app.test_client()
+        headers = {'X-Api-Key': 'abc'}
+        self.assertEqual(client.get('/task/1/', headers=headers).status_code, 200)
+        self.assertEqual(client.get('/task/1/', headers=headers).status_code, 200)
+        response = client.get('/task/1/', headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1000')
+        self.assertEqual(self.calls, ['retrieve', 'retrieve'])
+        self.assertEqual(client.get('/task/1/', headers={'X-Api-Key': 'def'}).status_code, 200)
+        stats = self.dispatcher.stats()['rate_limit']
+        self.assertEqual(stats['allowed'], 3)
+        self.assertEqual(stats['limited'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_wsgi_app(self):
+        """
+        Tests that the standalone WSGI application is limited
+        by the client's address.
+        """
+        client = Client(self.dispatcher.wsgi_app())
+        statuses = [client.get('/task/1/', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code
+                    for i in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(client.get('/task/1/', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code, 200)
+
+    def test_route_limit(self):
+        """
+        Tests the rate_limit option of a route.
+        """
+        client = self.app.test_client()
+        self.assertEqual(client.get('/task/1/search').status_code, 200)
+        self.assertEqual(client.get('/task/1/search').status_code, 429)
+        self.assertEqual(client.get('/task/1/search').status_code, 429)
+        self.assertEqual(client.get('/task/1/').status_code, 200)
+
+    def test_rejections_skip_error_hooks(self):
+        """
+        Tests that rejected requests are answered by the error_handler
+        without running the error hooks or logging an error.
+        """
+        errors = []
+        self.dispatcher.on_error(lambda endpoint, exc: errors.append(exc))
+        self.dispatcher.access_logger = mock.Mock()
+        client = self.app.test_client()
+        client.get('/task/1/search')
+        self.assertEqual(client.get('/task/1/search').status_code, 429)
+        self.limiter.rate = None
+        self.limiter.max_latency = 1
+        self.limiter._latency = 100
+        self.limiter.random = lambda: 0
+        self.assertEqual(client.get('/task/1/').status_code, 503)
+        self.assertEqual(errors, [])
+        self.assertFalse(self.dispatcher.access_logger.log_error.called)
+        self.assertEqual(self.dispatcher.access_logger.log_request.call_count, 3)
+        stats = self.limiter.stats()
+        self.assertEqual((stats['limited'], stats['shed']), (1, 1))
+
+    def test_load_shedding(self):
+        """
+        Tests that requests are shed in proportion to how
+        much the latency exceeds the maximum.
+        """
+        self.limiter.rate = None
+        self.limiter.max_latency = 1
+        self.limiter._latency = 1.5
+        client = self.app.test_client()
+        self.limiter.random = lambda: 0.4
+        response = client.get('/task/1/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.limiter.random = lambda: 0.6
+        self.assertEqual(client.get('/task/1/').status_code, 200)
+        self.assertLess(self.limiter.stats()['latency'], 1.5)
+        self.limiter._latency = 100
+        self.limiter.random = lambda: 0.95
+        self.assertEqual(client.get('/task/1/').status_code, 200)
+        self.assertEqual(self.limiter.stats()['shed'], 1)
+
+    def test_in_flight_latency(self):
+        """
+        Tests that slow requests in flight cause load to be shed.
+        """
+        self.limiter.rate = None
+        self.limiter.max_latency = 1
+        self.limiter.random = lambda: 0
+        with mock.patch('flask_ripozo.ratelimit.default_timer') as default_timer:
+            default_timer.return_value = 100
+            admitted = self.limiter.admit('endpoint', {})
+            default_timer.return_value = 105
+            self.assertEqual(self.app.test_client().get('/task/1/').status_code, 503)
+            self.limiter.finish(admitted)
@@ -0,0 +1,165 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.sessions import PooledSessionHandler, PoolTimeoutException
+
+from ripozo import apimethod, ResourceBase, adapters
+from ripozo.exceptions import NotFoundException
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest2
+
+
+class TestPooledSessionHandler(unittest2.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'sessions.db')
+        connection = sqlite3.connect(self.db_path)
+        connection.execute('CREATE TABLE item (id TEXT PRIMARY KEY)')
+        connection.commit()
+        connection.close()
+        self.handler = PooledSessionHandler(self.connect, pool_size=2, timeout=0.05)
+        handler = self.handler
+
+        class ItemResource(ResourceBase):
+            resource_name = 'item'
+            pks = ('id',)
+
+            @apimethod(methods=['PUT'])
+            def create(cls, request):
+                session = handler.get_session()
+                session.execute('INSERT INTO item (id) VALUES (?)', (request.get('id'),))
+                handler.handle_session(session)
+                if request.get('id') == 'fail':
+                    raise NotFoundException('fail')
+                return cls(properties=dict(id=request.get('id')))
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                return cls(properties=dict(id=request.get('id')))
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(ItemResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.handler.attach(self.dispatcher)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def saved_ids(self):
+        connection = sqlite3.connect(self.db_path)
+        try:
+            return [row[0] for row in connection.execute('SELECT id FROM item ORDER BY id')]
+        finally:
+            connection.close()
+
+    def test_commit_and_rollback(self):
+        """
+        Tests that the session is committed after a successful
+        request and rolled back after a failed one.
+        """
+        self.assertEqual(self.client.put('/item/1/').status_code, 200)
+        self.assertEqual(self.client.put('/item/fail/').status_code, 404)
+        self.assertEqual(self.saved_ids(), ['1'])
+        stats = self.dispatcher.stats()['sessions']
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['checkout']['count'], 2)
+        self.assertEqual(stats['wait']['count'], 2)
+
+    def test_lazy_checkout(self):
+        """
+        Tests that requests that do not use the database
+        do not check out a session.
+        """
+        self.client.get('/item/1/')
+        self.assertEqual(self.dispatcher.stats()['sessions']['wait']['count'], 0)
+
+    def test_reuse(self):
+        """
+        Tests that released sessions are reused.
+        """
+        session = self.handler.get_session()
+        self.handler.handle_session(session)
+        self.assertIs(self.handler.get_session(), session)
+
+    def test_timeout(self):
+        """
+        Tests that a 503 is raised when the pool is exhausted.
+        """
+        sessions = [self.handler.get_session() for i in range(2)]
+        with self.assertRaises(PoolTimeoutException) as context:
+            self.handler.get_session()
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(self.handler.stats()['timeouts'], 1)
+        self.assertEqual(self.handler.stats()['max_in_use'], 2)
+        for session in sessions:
+            self.handler.handle_session(session)
+        self.assertEqual(self.handler.stats()['in_use'], 0)
+
+
+class TestLifecycleHooks(unittest2.TestCase):
+    def setUp(self):
+        class HookResource(ResourceBase):
+            resource_name = 'hook'
+            pks = ('id',)
+
+            @apimethod(methods=['GET'])
+            def retrieve(cls, request):
+                if request.get('id') == 'missing':
+                    raise NotFoundException('missing')
+                return cls(properties=dict(id=request.get('id')))
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app)
+        self.dispatcher.register_resources(HookResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter)
+        self.client = self.app.test_client()
+        self.calls = []
+
+        @self.dispatcher.before_request
+        def before(endpoint):
+            self.calls.append('before')
+
+        @self.dispatcher.after_dispatch
+        def after(endpoint, request, adapter):
+            self.calls.append('after')
+
+        @self.dispatcher.on_error
+        def error(endpoint, exc):
+            self.calls.append('error')
+
+    def test_success(self):
+        self.client.get('/hook/1/')
+        self.assertEqual(self.calls, ['before', 'after'])
+
+    def test_error(self):
+        self.assertEqual(self.client.get('/hook/missing/').status_code, 404)
+        self.assertEqual(self.calls, ['before', 'error'])
+
+    def test_before_hook_raises(self):
+        """
+        Tests that an exception in a before request hook
+        is handled like any other error.
+        """
+        @self.dispatcher.before_request
+        def reject(endpoint):
+            raise NotFoundException('rejected')
+
+        response = self.client.get('/hook/1/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data.decode('utf8'))['message'], 'rejected')
+        self.assertEqual(self.calls, ['before', 'error'])
@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Flask
+
+from flask_ripozo.dispatcher import FlaskDispatcher
+from flask_ripozo.wsgi import get_environ_query_body_args
+
+from ripozo import apimethod, ResourceBase, adapters
+from ripozo.exceptions import NotFoundException
+
+from werkzeug.test import Client, EnvironBuilder
+
+import json
+import unittest2
+
+
+class TestWSGIDispatcherApp(unittest2.TestCase):
+    def setUp(self):
+        class WSGIResource(ResourceBase):
+            resource_name = 'wsgi_resource'
+            pks = ('id',)
+
+            @apimethod(methods=['GET', 'POST'])
+            def retrieve(cls, request):
+                if request.get('id') == 'missing':
+                    raise NotFoundException('missing')
+                return cls(properties=dict(id=request.get('id'), x=request.get('x'),
+                                           header=request.headers.get('x-custom')))
+
+        self.app = Flask(__name__)
+        self.dispatcher = FlaskDispatcher(self.app, url_prefix='/api')
+        self.dispatcher.register_resources(WSGIResource)
+        self.dispatcher.register_adapters(adapters.BasicJSONAdapter, adapters.HalAdapter)
+        self.client = Client(self.dispatcher.wsgi_app())
+
+    def test_get(self):
+        """
+        Tests a simple get through the WSGI app.
+        """
+        response = self.client.get('/api/wsgi_resource/1/?x=2', headers={'X-Custom': 'custom'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+        body = json.loads(response.data.decode('utf8'))
+        self.assertDictEqual(body['wsgi_resource'], dict(id='1', x=['2'], header='custom'))
+
+    def test_same_as_flask(self):
+        """
+        Tests that the body is the same as the one
+        generated by the Flask path.
+        """
+        response = self.client.get('/api/wsgi_resource/1/', headers={'Accept': 'application/hal+json'})
+        flask_response = self.app.test_client().get('/api/wsgi_resource/1/',
+                                                     headers={'Accept': 'application/hal+json'})
+        self.assertEqual(response.data, flask_response.data)
+        self.assertEqual(response.headers['Content-Type'], flask_response.headers['Content-Type'])
+
+    def test_mounted_base_url(self):
+        """
+        Tests that the links use the url root where the app
+        is mounted.
+        """
+        response = self.client.get('/api/wsgi_resource/1/', base_url='http://example.com/mount',
+                                   headers={'Accept': 'application/hal+json'})
+        body = json.loads(response.data.decode('utf8'))
+        self.assertEqual(body['_links']['self']['href'], 'http://example.com/mount/api/wsgi_resource/1')
+
+    def test_body(self):
+        """
+        Tests that json and form bodies are loaded.
+        """
+        response = self.client.post('/api/wsgi_resource/1/', data=json.dumps(dict(x=3)),
+                                    content_type='application/json')
+        self.assertEqual(json.loads(response.data.decode('utf8'))['wsgi_resource']['x'], 3)
+        response = self.client.post('/api/wsgi_resource/1/', data=dict(x='4'))
+        self.assertEqual(json.loads(response.data.decode('utf8'))['wsgi_resource']['x'], ['4'])
+
+    def test_errors(self):
+        """
+        Tests that unmatched routes and RestExceptions
+        return the appropriate status codes.
+        """
+        self.assertEqual(self.client.get('/nothing').status_code, 404)
+        self.assertEqual(self.client.delete('/api/wsgi_resource/1/').status_code, 405)
+        self.assertEqual(self.client.get('/api/wsgi_resource/missing/').status_code, 404)
+
+    def test_get_environ_query_body_args(self):
+        """
+        Tests getting the arguments from the environ.
+        """
+        environ = EnvironBuilder('/?x=1&x=2', data='bad json', headers={'Some-Header': 'val'}).get_environ()
+        q, b, h = get_environ_query_body_args(environ)
+        self.assertDictEqual(q, dict(x=['1', '2']))
+        self.assertDictEqual(b, {})
+        self.assertEqual(h['some-header'], 'val')
+        self.assertEqual(h['Some-Header'], 'val')
@@ -0,0 +1,115 @@
+"""
+Benchmarks the compiled argument parsers against ripozo's
+per request ``translate_fields`` for an endpoint with many
+filter fields, first for the translation alone and then for
+whole requests through the Flask app with and without
+``compile_arguments``.
+
+    python -m profiling.argument_parsing
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from timeit import default_timer
+
+from flask import Flask
+
+from flask_ripozo import FlaskDispatcher
+from flask_ripozo.arguments import CompiledArgumentParser
+
+from ripozo import adapters, apimethod, fields, RequestContainer, ResourceBase, translate
+from ripozo.resources.fields import base as fields_base
+
+from six.moves.urllib.parse import urlencode
+
+from werkzeug.test import EnvironBuilder
+
+
+def build_fields(count):
+    filter_fields = []
+    for i in range(count):
+        if i % 3 == 0:
+            filter_fields.append(fields.IntegerField('int_{0}'.format(i), minimum=0))
+        elif i % 3 == 1:
+            filter_fields.append(fields.BooleanField('bool_{0}'.format(i)))
+        else:
+            filter_fields.append(fields.StringField('str_{0}'.format(i)))
+    return filter_fields
+
+
+def build_query_args(filter_fields):
+    values = {fields.IntegerField: ['10'], fields.BooleanField: ['true'], fields.StringField: ['value']}
+    return dict((field.name, values[type(field)]) for field in filter_fields[::2])
+
+
+def time_per_call(func, runs):
+    start = default_timer()
+    for i in range(runs):
+        func()
+    return (default_timer() - start) / runs * 1e6
+
+
+def build_app(filter_fields, compile_arguments):
+    class FilteredResource(ResourceBase):
+        resource_name = 'filtered'
+
+        @apimethod(methods=['GET'])
+        @translate(fields=filter_fields, validate=True)
+        def retrieve_list(cls, request):
+            return cls(properties=dict(count=len(request.query_args)))
+
+    app = Flask(__name__)
+    dispatcher = FlaskDispatcher(app, compile_arguments=compile_arguments)
+    dispatcher.register_resources(FilteredResource)
+    dispatcher.register_adapters(adapters.BasicJSONAdapter)
+    return app
+
+
+def _start_response(status, headers, exc_info=None):
+    pass
+
+
+def time_per_request(app, query_args, runs):
+    query_string = urlencode([(key, value[0]) for key, value in query_args.items()])
+    environ = EnvironBuilder('/filtered/', query_string=query_string).get_environ()
+
+    def request():
+        for chunk in app.wsgi_app(dict(environ), _start_response):
+            pass
+    return time_per_call(request, runs)
+
+
+def main(runs=5000):
+    print('{0:>7} {1:>22} {2:>18} {3:>8}'.format('fields', 'translate_fields (us)', 'compiled (us)', 'speedup'))
+    for count in (5, 20, 50, 100):
+        filter_fields = build_fields(count)
+        query_args = build_query_args(filter_fields)
+        parser = CompiledArgumentParser(filter_fields, validate=True)
+
+        def ripozo_translate():
+            fields_base.translate_fields(RequestContainer(query_args=dict(query_args)),
+                                         filter_fields, validate=True)
+
+        def compiled():
+            parser.parse({}, dict(query_args), {})
+
+        ripozo_time = time_per_call(ripozo_translate, runs)
+        compiled_time = time_per_call(compiled, runs)
+        print('{0:>7} {1:>22.1f} {2:>18.1f} {3:>7.1f}x'.format(count, ripozo_time, compiled_time,
+                                                              ripozo_time / compiled_time))
+
+    print()
+    print('{0:>7} {1:>22} {2:>18} {3:>8}'.format('fields', 'request (us)', 'compiled (us)', 'speedup'))
+    for count in (5, 20, 50, 100):
+        filter_fields = build_fields(count)
+        query_args = build_query_args(filter_fields)
+        ripozo_time = time_per_request(build_app(filter_fields, False), query_args, runs // 5)
+        compiled_time = time_per_request(build_app(filter_fields, True), query_args, runs // 5)
+        print('{0:>7} {1:>22.1f} {2:>18.1f} {3:>7.1f}x'.format(count, ripozo_time, compiled_time,
+                                                              ripozo_time / compiled_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmarks the encode time, decode time and payload size of the
+binary adapters against the SIREN and HAL JSON adapters for a
+list resource with embedded items.
+
+    python -m profiling.binary_adapters
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from timeit import default_timer
+
+from flask_ripozo.adapters import available_binary_adapters, get_body_decoder
+
+from ripozo import ResourceBase, ListRelationship, adapters
+
+import json
+
+
+class Item(ResourceBase):
+    resource_name = 'item'
+    pks = ('id',)
+
+
+class ItemList(ResourceBase):
+    resource_name = 'items'
+    _relationships = (ListRelationship('items', relation='Item', embedded=True),)
+
+
+def build_resource(count):
+    items = [dict(id=i, title='Item number {0}'.format(i), description='x' * 50,
+                  completed=i % 2 == 0, score=i * 1.5) for i in range(count)]
+    return ItemList(properties=dict(items=items, count=count))
+
+
+def time_per_call(func, runs):
+    start = default_timer()
+    for i in range(runs):
+        func()
+    return (default_timer() - start) / runs * 1e6
+
+
+def main(runs=200):
+    resource = build_resource(100)
+    adapter_classes = [adapters.SirenAdapter, adapters.HalAdapter] + available_binary_adapters()
+    row = '{0:<20} {1:>12} {2:>12} {3:>10}'
+    print(row.format('adapter', 'encode (us)', 'decode (us)', 'bytes'))
+    for adapter_class in adapter_classes:
+        adapter = adapter_class(resource, base_url='http://localhost/')
+        body = adapter.formatted_body
+        decoder = get_body_decoder(adapter_class.formats[0])
+        if decoder is None:
+            decoder = json.loads
+        encode_time = time_per_call(lambda: adapter.formatted_body, runs)
+        decode_time = time_per_call(lambda: decoder(body), runs)
+        size = len(body.encode('utf8') if not isinstance(body, bytes) else body)
+        print(row.format(adapter_class.__name__, '{0:.1f}'.format(encode_time),
+                         '{0:.1f}'.format(decode_time), size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+A localhost load testing harness.  It starts one of the profiling
+apps under a multi-worker server, either a single process with a
+pool of threads or several single threaded processes sharing one
+listening socket, and drives it with concurrent client processes.
+For every combination of worker mode, worker count and client
+concurrency it reports the throughput and the p50/p95/p99 latency.
+
+    python -m profiling.load_test --workers 1 2 4 --concurrency 1 4 16
+
+Everything runs on 127.0.0.1 so the results can be compared
+between commits and tuning options.  Unix only since the worker
+processes are forked.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import argparse
+import importlib
+import logging
+import multiprocessing
+import socket
+import time
+
+from six.moves import http_client
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """
+    Does not log every request and always uses a new
+    connection per request so the worker modes are comparable.
+    """
+    protocol_version = str('HTTP/1.0')
+
+    def log(self, *args, **kwargs):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    A WSGI server that handles the requests on a fixed
+    size pool of threads.
+    """
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super(PooledWSGIServer, self).__init__(host, port, app, handler=_QuietRequestHandler, fd=fd)
+        self.pool = ThreadPool(threads)
+
+    def process_request(self, request, client_address):
+        self.pool.apply_async(self._process_request, (request, client_address))
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def load_app(app_path):
+    """
+    :param unicode app_path: A ``module:attribute`` path to the WSGI app.
+    :return: The WSGI app
+    """
+    module_name, attribute = app_path.split(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _serve(app_path, port, fd, threads):
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    app = load_app(app_path)
+    if threads > 1:
+        server = PooledWSGIServer('127.0.0.1', port, app, threads, fd=fd)
+    else:
+        server = BaseWSGIServer('127.0.0.1', port, app, handler=_QuietRequestHandler, fd=fd)
+    server.serve_forever()
+
+
+def start_servers(app_path, mode, workers):
+    """
+    Starts the server processes on a free port.
+
+    :param unicode app_path: The ``module:attribute`` path to the app.
+    :param unicode mode: Either ``'threads'`` or ``'processes'``
+    :param int workers: The number of threads or processes.
+    :return: The port and the list of server processes.
+    :rtype: (int, list)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+    port = sock.getsockname()[1]
+    if mode == 'threads':
+        targets = [(app_path, port, sock.fileno(), workers)]
+    else:
+        targets = [(app_path, port, sock.fileno(), 1)] * workers
+    processes = []
+    for args in targets:
+        process = multiprocessing.Process(target=_serve, args=args)
+        process.daemon = True
+        process.start()
+        processes.append(process)
+    sock.close()
+    return port, processes
+
+
+def _client(args):
+    port, path, duration, warmup = args
+    latencies = []
+    errors = 0
+    end = default_timer() + warmup + duration
+    record_after = default_timer() + warmup
+    while True:
+        start = default_timer()
+        if start >= end:
+            break
+        try:
+            connection = http_client.HTTPConnection('127.0.0.1', port, timeout=30)
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            failed = response.status >= 400
+        except Exception:
+            failed = True
+        if start < record_after:
+            continue
+        if failed:
+            errors += 1
+        else:
+            latencies.append(default_timer() - start)
+    return latencies, errors
+
+
+def percentile(values, percent):
+    """
+    :param list values: The sorted values.
+    :param float percent: The percentile between 0 and 100.
+    :return: The nearest rank percentile of the values.
+    :rtype: float
+    """
+    if not values:
+        return float('nan')
+    index = int(round(percent / 100 * len(values) + 0.5)) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+def run_load(port, path, concurrency, duration, warmup=0.5):
+    """
+    Drives the server with ``concurrency`` client processes.
+
+    :return: A dictionary with the requests, errors, throughput
+        (requests per second) and p50/p95/p99 latency in milliseconds.
+    :rtype: dict
+    """
+    pool = multiprocessing.Pool(concurrency)
+    try:
+        results = pool.map(_client, [(port, path, duration, warmup)] * concurrency)
+    finally:
+        pool.close()
+        pool.join()
+    latencies = sorted(latency for client_latencies, errors in results for latency in client_latencies)
+    errors = sum(errors for client_latencies, errors in results)
+    return dict(requests=len(latencies), errors=errors, throughput=len(latencies) / duration,
+                p50=percentile(latencies, 50) * 1000, p95=percentile(latencies, 95) * 1000,
+                p99=percentile(latencies, 99) * 1000)
+
+
+def _wait_for_server(port, timeout=10):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError('The server did not start on port {0}'.format(port))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--app', default='profiling.flask_app_ripozo:app',
+                        help='The module:attribute path of the WSGI app')
+    parser.add_argument('--path', default='/my_resource/hello/', help='The path to request')
+    parser.add_argument('--modes', nargs='+', default=['threads', 'processes'],
+                        choices=['threads', 'processes'])
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per measurement')
+    args = parser.parse_args(argv)
+
+    row = '{0:<10} {1:>7} {2:>11} {3:>10} {4:>8} {5:>8} {6:>8} {7:>7}'
+    print(row.format('mode', 'workers', 'concurrency', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for mode in args.modes:
+        for workers in args.workers:
+            port, processes = start_servers(args.app, mode, workers)
+            try:
+                _wait_for_server(port)
+                for concurrency in args.concurrency:
+                    result = run_load(port, args.path, concurrency, args.duration)
+                    print(row.format(mode, workers, concurrency, '{0:.0f}'.format(result['throughput']),
+                                     '{0:.2f}'.format(result['p50']), '{0:.2f}'.format(result['p95']),
+                                     '{0:.2f}'.format(result['p99']), result['errors']))
+            finally:
+                for process in processes:
+                    process.terminate()
+                    process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Runs requests against the ripozo profiling app in process
+and prints the peak and net bytes allocated per endpoint.
+Useful for catching allocation regressions between commits.
+
+    python -m profiling.memory_report
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask_ripozo.memory import AllocationTracker
+
+from profiling.flask_app_ripozo import app, dispatcher
+
+import six
+
+
+def main(runs=200):
+    dispatcher.allocation_tracker = AllocationTracker(sample_rate=1)
+    client = app.test_client()
+    for i in range(runs):
+        client.get('/my_resource/hello/')
+    for endpoint, stats in sorted(six.iteritems(dispatcher.stats()['allocations'])):
+        print('{0}: samples={samples} max_peak={max_peak} mean_peak={mean_peak:.0f} '
+              'mean_net={mean_net:.0f}'.format(endpoint, **stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the startup time and memory of serving the same
+resources under N prefixes with a FlaskDispatcher per blueprint
+against a single dispatcher mounted on every blueprint.
+
+    python -m profiling.mounts
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from timeit import default_timer
+
+from flask import Blueprint, Flask
+
+from flask_ripozo import FlaskDispatcher
+
+from ripozo import adapters, apimethod, restmixins, translate, fields
+
+import tracemalloc
+import warnings
+
+
+def build_resources(count):
+    resources = []
+    for i in range(count):
+        class Resource(restmixins.CRUDL):
+            resource_name = 'resource{0}'.format(i)
+            pks = ('id',)
+
+            @apimethod(route='/action', methods=['POST'])
+            @translate(fields=[fields.IntegerField('value', required=True)], validate=True)
+            def action(cls, request):
+                return cls(properties=request.body_args)
+
+        Resource.__name__ = str('Resource{0}'.format(i))
+        resources.append(Resource)
+    return resources
+
+
+def separate_dispatchers(app, resources, mounts):
+    for i in range(mounts):
+        blueprint = Blueprint('v{0}'.format(i), __name__, url_prefix='/v{0}'.format(i))
+        dispatcher = FlaskDispatcher(blueprint, url_prefix='/api', compile_arguments=True,
+                                     auto_options_name=str('Options{0}'.format(i)))
+        dispatcher.register_resources(*resources)
+        dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter)
+        app.register_blueprint(blueprint)
+
+
+def shared_dispatcher(app, resources, mounts):
+    blueprints = [Blueprint('v{0}'.format(i), __name__, url_prefix='/v{0}'.format(i)) for i in range(mounts)]
+    dispatcher = FlaskDispatcher(blueprints[0], url_prefix='/api', compile_arguments=True)
+    dispatcher.register_resources(*resources)
+    dispatcher.register_adapters(adapters.SirenAdapter, adapters.HalAdapter)
+    for blueprint in blueprints[1:]:
+        dispatcher.mount(blueprint, url_prefix='/api')
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint)
+
+
+def measure(setup, resources, mounts):
+    start = default_timer()
+    app = Flask(__name__)
+    setup(app, resources, mounts)
+    app.url_map.bind('localhost').match('/v{0}/api/resource0/'.format(mounts - 1))
+    elapsed = default_timer() - start
+
+    tracemalloc.start()
+    app = Flask(__name__)
+    setup(app, resources, mounts)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, current
+
+
+def main(resource_count=20):
+    warnings.simplefilter('ignore')
+    resources = build_resources(resource_count)
+    row = '{0:>6} {1:>14} {2:>14} {3:>14} {4:>14}'
+    print('{0} resources'.format(resource_count))
+    print(row.format('mounts', 'separate (ms)', 'shared (ms)', 'separate (KB)', 'shared (KB)'))
+    for mounts in (1, 5, 20, 50):
+        separate_time, separate_memory = measure(separate_dispatchers, resources, mounts)
+        shared_time, shared_memory = measure(shared_dispatcher, resources, mounts)
+        print(row.format(mounts, '{0:.1f}'.format(separate_time * 1000), '{0:.1f}'.format(shared_time * 1000),
+                         separate_memory // 1024, shared_memory // 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares live dispatching of a reference data resource with
+serving its pre-rendered file from a ``StaticRenderer``.  Both
+are called in process through the Flask app with a prebuilt environ.
+
+    python -m profiling.prerender
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from timeit import default_timer
+
+from flask import Flask
+
+from flask_ripozo import FlaskDispatcher
+from flask_ripozo.prerender import StaticRenderer
+
+from ripozo import adapters, apimethod, ResourceBase
+
+from werkzeug.test import EnvironBuilder
+
+import shutil
+import tempfile
+
+COUNTRIES = [dict(code='c{0}'.format(i), name='Country {0}'.format(i), population=i * 1000)
+             for i in range(250)]
+
+
+class CountryListResource(ResourceBase):
+    resource_name = 'countries'
+
+    @apimethod(methods=['GET'])
+    def retrieve_list(cls, request):
+        return cls(properties=dict(countries=COUNTRIES))
+
+
+def _start_response(status, headers, exc_info=None):
+    pass
+
+
+def requests_per_second(wsgi_app, environ, runs):
+    start = default_timer()
+    for i in range(runs):
+        for chunk in wsgi_app(dict(environ), _start_response):
+            pass
+    return runs / (default_timer() - start)
+
+
+def main(runs=2000):
+    directory = tempfile.mkdtemp()
+    try:
+        app = Flask(__name__)
+        dispatcher = FlaskDispatcher(app)
+        dispatcher.register_resources(CountryListResource)
+        dispatcher.register_adapters(adapters.HalAdapter)
+        environ = EnvironBuilder('/countries/').get_environ()
+        gzip_environ = EnvironBuilder('/countries/', headers={'Accept-Encoding': 'gzip'}).get_environ()
+
+        live = requests_per_second(app.wsgi_app, environ, runs)
+        StaticRenderer(directory, 'http://localhost/').attach(dispatcher)
+        dispatcher.static_renderer.render()
+        static = requests_per_second(app.wsgi_app, environ, runs)
+        compressed = requests_per_second(app.wsgi_app, gzip_environ, runs)
+        print('live dispatch:   {0:.0f} requests/second'.format(live))
+        print('pre-rendered:    {0:.0f} requests/second ({1:.2f}x)'.format(static, static / live))
+        print('pre-rendered gz: {0:.0f} requests/second ({1:.2f}x)'.format(compressed, compressed / live))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Measures the overhead of a ``RateLimiter`` on the standalone WSGI
+application and how cheap rejected requests are compared to
+dispatched ones.
+
+    python -m profiling.rate_limit
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask_ripozo.ratelimit import RateLimiter
+
+from profiling.flask_app_ripozo import dispatcher
+from profiling.wsgi_throughput import requests_per_second
+
+
+def main(runs=10000):
+    path = '/my_resource/hello/'
+    wsgi_app = dispatcher.wsgi_app()
+    baseline = requests_per_second(wsgi_app, path, runs)
+    RateLimiter(rate=10 ** 9, burst=10 ** 9).attach(dispatcher)
+    allowed = requests_per_second(wsgi_app, path, runs)
+    dispatcher.rate_limiter.rate = dispatcher.rate_limiter.burst = 0.001
+    limited = requests_per_second(wsgi_app, path, runs)
+    print('no limiter: {0:.0f} requests/second'.format(baseline))
+    print('allowed:    {0:.0f} requests/second ({1:.2f}x)'.format(allowed, allowed / baseline))
+    print('limited:    {0:.0f} requests/second ({1:.2f}x)'.format(limited, limited / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares the throughput of the Flask mounted path with the
+standalone WSGI application from ``FlaskDispatcher.wsgi_app``.
+Both applications are called in process with a prebuilt
+environ so that only the application's work is timed.
+
+    python -m profiling.wsgi_throughput
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from timeit import default_timer
+
+from werkzeug.test import EnvironBuilder
+
+from profiling.flask_app_ripozo import app, dispatcher
+
+
+def _start_response(status, headers, exc_info=None):
+    pass
+
+
+def requests_per_second(wsgi_app, path, runs):
+    environ = EnvironBuilder(path).get_environ()
+    start = default_timer()
+    for i in range(runs):
+        for chunk in wsgi_app(dict(environ), _start_response):
+            pass
+    return runs / (default_timer() - start)
+
+
+def main(runs=10000):
+    path = '/my_resource/hello/'
+    flask_rps = requests_per_second(app.wsgi_app, path, runs)
+    wsgi_rps = requests_per_second(dispatcher.wsgi_app(), path, runs)
+    print('flask mounted: {0:.0f} requests/second'.format(flask_rps))
+    print('wsgi_app:      {0:.0f} requests/second ({1:.2f}x)'.format(wsgi_rps, wsgi_rps / flask_rps))
+
+
+if __name__ == '__main__':
+    main()
@@ -31,6 +31,12 @@ setup(
             'Flask-SQLAlchemy',
             'pypermedia',
             'ripozo-sqlalchemy'
+        ],
+        'msgpack': [
+            'msgpack'
+        ],
+        'cbor': [
+            'cbor2'
         ]
     },
     install_requires=[